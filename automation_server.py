@@ -0,0 +1,523 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from components.deployment.drift_detection import CHUNK_SIZE, DeviceDrift, _compare_chunk, intended_state
+from components.deployment.push_engine import PushEngine, PushResult
+from components.devices import device_creator
+from components.devices.router.router import Router
+from components.devices.router.xr_router import XRRouter
+from components.topologies.autonomous_system.backbone import Backbone
+from components.topologies.autonomous_system.l2vpnbackbone import L2VPNBackbone
+from components.topologies.autonomous_system.l3vpnbackbone import L3VPNBackbone
+from components.topologies.federation import BackboneFederation
+from iptx_utils import DeviceError, NetworkError, NotFoundError, print_log, print_success
+
+SHARD = "model"  # The only shard of the federation of each topology
+
+BACKBONE_KINDS = {"backbone": Backbone, "l2vpn": L2VPNBackbone, "l3vpn": L3VPNBackbone}
+DEVICE_MODELS = {name: getattr(device_creator, name) for name in (
+    "cisco_3600", "cisco_7200_v1", "cisco_7200", "gns3_c7200", "gns3_ce_router", "cisco_xr_9000", "gns3_cisco_xr")}
+
+MAX_BODY = 64 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+# ******************************** SHARD SIDE ********************************
+# Module-level functions, run inside the worker process of a topology (see BackboneFederation)
+def _new_router(spec: Dict[str, Any]) -> Router:
+    try:
+        model = DEVICE_MODELS[spec.get("model", "gns3_c7200")]
+    except KeyError:
+        raise NotFoundError(f"ERROR: Unknown device model '{spec['model']}' - Please use one of the following "
+                            f"models {', '.join(DEVICE_MODELS)}")
+
+    router = model(spec["router_id"], spec["hostname"])
+    if spec.get("as_number") is not None:
+        router.as_number = spec["as_number"]
+
+    return router
+
+
+def _build(spec: Dict[str, Any], quiet: bool) -> Backbone:
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+
+    try:
+        kind = BACKBONE_KINDS[spec.get("kind", "backbone")]
+    except KeyError:
+        raise ValueError(f"ERROR: Unknown kind of backbone '{spec['kind']}' - Please use one of the following "
+                         f"kinds {', '.join(BACKBONE_KINDS)}")
+
+    devices = [_new_router(device) for device in spec.get("devices", [])]
+    try:
+        if kind is L3VPNBackbone:
+            return kind(spec["as_number"], spec["name"], devices, spec.get("route_reflector_id"))
+
+        return kind(spec["as_number"], spec["name"], devices)
+    except EOFError:
+        raise ValueError("ERROR: The backbone needs a confirmation on the console to be built")
+
+
+def _connect(backbone: Backbone, link: Dict[str, Any]) -> str:
+    backbone.connect_internal_devices(link["device_id1"], link["port1"], link["device_id2"], link["port2"],
+                                      link["network_address"], link.get("scr"))
+    return link["network_address"]
+
+
+def _onboard_client(backbone: Backbone, client: Dict[str, Any]) -> str:
+    router = _new_router(client["device"])
+    options = {key: client[key] for key in ("network_address", "new_vrf", "existing_vrf_id", "static_routing")
+               if key in client}
+    backbone.connect_client(router, client["client_port"], client["device_id"], client["port"], **options)
+    return router.id()
+
+
+def _begin_routing(backbone: Backbone, routing: Dict[str, Any]) -> int:
+    if not isinstance(backbone, L3VPNBackbone) and (routing.get("bgp") or routing.get("route_targets")):
+        raise ValueError(f"ERROR: Backbone '{backbone.name}' has no BGP routing - Only the l3vpn kind has")
+
+    if routing.get("internal", True):
+        backbone.begin_internal_routing()
+    for route_target in routing.get("route_targets", []):
+        backbone.vpn_route_target(route_target["source"], route_target["destination"],
+                                  route_target.get("two_way", False))
+    if routing.get("bgp"):
+        backbone.begin_bgp_routing()
+
+    return len(backbone.get_all_routers())
+
+
+def _backbone_routers(backbone: Backbone, device_ids: List[str] | None) -> List[Router]:
+    if device_ids is not None:
+        return [backbone[device_id] for device_id in device_ids]
+
+    return [router for router in backbone.get_all_routers() if router.as_number == backbone.as_number]
+
+
+def _preview(backbone: Backbone, device_ids: List[str] | None) -> Dict[str, List[str]]:
+    # The pending scripts of the routers, which are left pending
+    scripts = {}
+    for router in _backbone_routers(backbone, device_ids):
+        with backbone._lock_devices(router.id()):
+            script = router.preview_script()
+        scripts[router.id()] = script + ["commit"] if isinstance(router, XRRouter) else script
+
+    return scripts
+
+
+def _render(backbone: Backbone, device_ids: List[str] | None) -> Dict[str, List[str]]:
+    # The pending scripts, which are taken, since they are about to be pushed
+    return PushEngine.render(backbone, device_ids)
+
+
+def _intended(backbone: Backbone, device_ids: List[str]) -> List[Tuple]:
+    return [intended_state(router) for router in _backbone_routers(backbone, device_ids)]
+
+
+def _summary(backbone: Backbone) -> Dict[str, Any]:
+    return {
+        "name": backbone.name,
+        "as_number": backbone.as_number,
+        "kind": next(kind for kind, cls in BACKBONE_KINDS.items() if cls is type(backbone)),
+        "routers": len([router for router in backbone.get_all_routers() if router.as_number == backbone.as_number]),
+        "clients": len(backbone.get_all_client_devices()),
+        "links": len(backbone.get_all_links())
+    }
+
+
+def _apply_batch(backbone: Backbone, operations: List[Tuple[Callable, tuple]]) -> List[Tuple[str, Any]]:
+    # Every operation of the batch, in order, each with its own result (a failed one doesn't stop the rest)
+    results = []
+    for function, args in operations:
+        try:
+            results.append(("ok", function(backbone, *args)))
+        except (NetworkError, DeviceError, NotFoundError, ValueError, TypeError, KeyError) as error:
+            results.append(("error", type(error).__name__, str(error)))
+        except EOFError:
+            # A warning of the model asked to continue, and the worker has no console to answer it
+            results.append(("error", "ValueError", "ERROR: The operation needs a confirmation on the console"))
+
+    return results
+
+
+# ******************************** BATCHING ********************************
+class MutationBatcher:
+    """
+    The operations on one topology, queued in the order they come in, and sent to its worker process in batches:
+    whatever has queued up while the previous batch was running (up to 'max_batch' operations, after waiting
+    'window' seconds for more) goes in a single round trip, instead of one round trip per request. The reads are
+    queued along with the mutations, so every request sees the ones before it.
+    """
+
+    def __init__(self, federation: BackboneFederation, threads: ThreadPoolExecutor, max_batch: int = 64,
+                 window: float = 0.002) -> None:
+        self.federation = federation
+        self.max_batch = max_batch
+        self.window = window
+        self.batches = 0
+        self.operations = 0
+
+        self.__threads = threads
+        self.__queue: asyncio.Queue[Tuple[Callable, tuple, asyncio.Future]] = asyncio.Queue()
+        self.__task = asyncio.create_task(self.__run())
+
+    async def submit(self, function: Callable, *args: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((function, args, future))
+        return await future
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.__queue.get()]
+            if self.window and self.__queue.empty():
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self.__queue.empty():
+                batch.append(self.__queue.get_nowait())
+
+            operations = [(function, args) for function, args, _ in batch]
+            try:
+                # The pipe to the worker blocks, so it's waited on in a thread
+                results = await loop.run_in_executor(self.__threads, self.federation.run, SHARD, _apply_batch,
+                                                     operations)
+            except Exception as error:
+                results = [("error", type(error).__name__, str(error))] * len(batch)
+
+            self.batches += 1
+            self.operations += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if result[0] == "ok":
+                    future.set_result(result[1])
+                else:
+                    future.set_exception(HTTPError(HTTPStatus.NOT_FOUND if result[1] == "NotFoundError"
+                                                   else HTTPStatus.BAD_REQUEST, f"{result[1]}: {result[2]}"))
+
+    async def close(self) -> None:
+        self.__task.cancel()
+        await asyncio.gather(self.__task, return_exceptions=True)
+
+
+# ******************************** SERVER ********************************
+def _drift_json(drift: DeviceDrift) -> Dict[str, Any]:
+    return {
+        "device_id": drift.device_id,
+        "hostname": drift.hostname,
+        "drifted": drift.drifted,
+        "missing": drift.missing,
+        "unexpected": drift.unexpected,
+        "changed": {key: list(values) for key, values in drift.changed.items()},
+        "failure": drift.failure
+    }
+
+
+def _push_json(result: PushResult) -> Dict[str, Any]:
+    return {
+        "device_id": result.device_id,
+        "address": list(result.address),
+        "success": result.success,
+        "lines": result.lines,
+        "attempts": result.attempts,
+        "elapsed": round(result.elapsed, 3),
+        "errors": [list(error) for error in result.errors],
+        "failure": result.failure
+    }
+
+
+class AutomationServer:
+    """
+    HTTP/1.1 service (JSON over keep-alive connections, on asyncio) for building and running backbones:
+
+        GET    /topologies                      The topologies, with their sizes
+        POST   /topologies                      Builds one: {name, as_number, kind, devices: [{router_id, hostname,
+                                                model}], route_reflector_id}
+        DELETE /topologies/<name>
+        POST   /topologies/<name>/links         Connects two of its routers: {device_id1, port1, device_id2, port2,
+                                                network_address}
+        POST   /topologies/<name>/clients       Onboards a client router: {device: {...}, client_port, device_id, port,
+                                                network_address, new_vrf, existing_vrf_id, static_routing}
+        POST   /topologies/<name>/routing       Begins the routing: {internal (true by default), route_targets:
+                                                [{source, destination, two_way}], bgp}
+        GET    /topologies/<name>/scripts       The pending scripts (?device=<ID>, any number of times), which are
+                                                left pending
+        POST   /topologies/<name>/diff          Compares running configurations ({configs: {<ID>: text}}) with the
+                                                model, like DriftDetector
+        POST   /topologies/<name>/push          Pushes the pending scripts to the CLI of the devices: {addresses:
+                                                {<ID>: [host, port]}, username, password, and the PushEngine options}
+        GET    /stats
+
+    Every topology lives in its own worker process (a BackboneFederation of one shard), so building it and
+    rendering its scripts never holds up the event loop, and the requests for it are batched (see
+    MutationBatcher). Parsing and comparing the running configurations of a diff is split in chunks over a
+    process pool, and the pushes run on the event loop itself (see PushEngine).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, max_batch: int = 64, batch_window: float = 0.002,
+                 processes: int = None, quiet_shards: bool = True) -> None:
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.quiet_shards = quiet_shards
+        self.requests = 0
+
+        self.__topologies: Dict[str, Tuple[BackboneFederation, MutationBatcher]] = {}
+        self.__building: set[str] = set()
+        self.__threads = ThreadPoolExecutor(32, thread_name_prefix="shard-pipe")
+        self.__processes = ProcessPoolExecutor(processes)
+        self.__server: asyncio.AbstractServer | None = None
+        self.__sessions: set[asyncio.Task] = set()
+
+        self.__routes: List[Tuple[str, re.Pattern, Callable]] = [
+            ("GET", re.compile(r"^/topologies$"), self.__list),
+            ("POST", re.compile(r"^/topologies$"), self.__build),
+            ("DELETE", re.compile(r"^/topologies/([^/]+)$"), self.__delete),
+            ("POST", re.compile(r"^/topologies/([^/]+)/links$"), self.__connect),
+            ("POST", re.compile(r"^/topologies/([^/]+)/clients$"), self.__onboard),
+            ("POST", re.compile(r"^/topologies/([^/]+)/routing$"), self.__routing),
+            ("GET", re.compile(r"^/topologies/([^/]+)/scripts$"), self.__scripts),
+            ("POST", re.compile(r"^/topologies/([^/]+)/diff$"), self.__diff),
+            ("POST", re.compile(r"^/topologies/([^/]+)/push$"), self.__push),
+            ("GET", re.compile(r"^/stats$"), self.__stats),
+        ]
+
+    # ******************************** LIFECYCLE ********************************
+    async def start(self) -> Tuple[str, int]:
+        self.__server = await asyncio.start_server(self.__session, self.host, self.port)
+        self.host, self.port = self.__server.sockets[0].getsockname()[:2]
+        print_log(f"Automation server listening on http://{self.host}:{self.port}")
+        return self.host, self.port
+
+    async def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+        for task in self.__sessions:
+            task.cancel()
+        await asyncio.gather(*self.__sessions, return_exceptions=True)
+
+        for name in list(self.__topologies):
+            await self.__remove(name)
+
+        self.__processes.shutdown(cancel_futures=True)
+        self.__threads.shutdown()
+
+    async def __aenter__(self) -> AutomationServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
+
+    async def serve_forever(self) -> None:
+        async with self:
+            await self.__server.serve_forever()
+
+    # ******************************** HTTP ********************************
+    async def __session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__sessions.add(asyncio.current_task())
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    return
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                version = "HTTP/1.0"  # Until the request line is read, the connection is closed after the answer
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The body is too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.__dispatch(method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {"message": str(error)}
+                except ValueError:
+                    status, payload, version = HTTPStatus.BAD_REQUEST, {"message": "Malformed request"}, "HTTP/1.0"
+                except Exception as error:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"message": f"{type(error).__name__}: {error}"}
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    return
+
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+
+        finally:
+            self.__sessions.discard(asyncio.current_task())
+            writer.close()
+
+    async def __dispatch(self, method: str, target: str, body: bytes) -> Tuple[HTTPStatus, Any]:
+        self.requests += 1
+        parts = urlsplit(target)
+        path, query = parts.path.rstrip("/") or "/", parse_qs(parts.query)
+
+        allowed = []
+        for route_method, pattern, handler in self.__routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+
+            try:
+                request = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "The body is not valid JSON")
+
+            try:
+                return await handler(*map(unquote, match.groups()), request=request, query=query)
+            except KeyError as error:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing field {error}")
+            except NotFoundError as error:
+                raise HTTPError(HTTPStatus.NOT_FOUND, str(error))
+            except (NetworkError, DeviceError, ValueError, TypeError) as error:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"{type(error).__name__}: {error}")
+
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use {' or '.join(allowed)} for {path}")
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No such resource: {path}")
+
+    # ******************************** TOPOLOGIES ********************************
+    def __batcher(self, name: str) -> MutationBatcher:
+        try:
+            return self.__topologies[name][1]
+        except KeyError:
+            raise NotFoundError(f"ERROR: Topology '{name}' not found")
+
+    async def __remove(self, name: str) -> None:
+        federation, batcher = self.__topologies.pop(name)
+        await batcher.close()
+        await asyncio.get_running_loop().run_in_executor(self.__threads, federation.close)
+
+    async def __list(self, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        names = list(self.__topologies)
+        summaries = await asyncio.gather(*[self.__batcher(name).submit(_summary) for name in names])
+        return HTTPStatus.OK, summaries
+
+    async def __build(self, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        name = request["name"]
+        if name in self.__topologies or name in self.__building:
+            raise HTTPError(HTTPStatus.CONFLICT, f"Topology '{name}' already exists")
+        if not isinstance(request.get("as_number"), int):
+            raise ValueError("The AS number has to be an integer")
+
+        # Built in its worker, while the event loop goes on
+        self.__building.add(name)
+        federation = BackboneFederation()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.__threads, federation.add_shard, SHARD, _build,
+                                                             request, self.quiet_shards)
+        except Exception:
+            federation.close()
+            raise
+        finally:
+            self.__building.discard(name)
+
+        batcher = MutationBatcher(federation, self.__threads, self.max_batch, self.batch_window)
+        self.__topologies[name] = (federation, batcher)
+        return HTTPStatus.CREATED, await batcher.submit(_summary)
+
+    async def __delete(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        self.__batcher(name)
+        await self.__remove(name)
+        return HTTPStatus.OK, {"deleted": name}
+
+    async def __connect(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        return HTTPStatus.CREATED, {"network_address": await self.__batcher(name).submit(_connect, request)}
+
+    async def __onboard(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        return HTTPStatus.CREATED, {"device_id": await self.__batcher(name).submit(_onboard_client, request)}
+
+    async def __routing(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        return HTTPStatus.OK, {"routers": await self.__batcher(name).submit(_begin_routing, request)}
+
+    async def __scripts(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        return HTTPStatus.OK, await self.__batcher(name).submit(_preview, query.get("device"))
+
+    async def __diff(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        configs: Dict[str, str] = request["configs"]
+        intended = await self.__batcher(name).submit(_intended, list(configs))
+
+        # Parsed and compared in the process pool, a chunk at a time
+        tasks = [(*state, configs[state[0]].splitlines()) for state in intended]
+        chunks = [tasks[start:start + CHUNK_SIZE] for start in range(0, len(tasks), CHUNK_SIZE)]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[loop.run_in_executor(self.__processes, _compare_chunk, chunk)
+                                         for chunk in chunks])
+
+        drifts = [drift for drifts in results for drift in drifts]
+        return HTTPStatus.OK, {"drifted": sum(drift.drifted for drift in drifts),
+                               "devices": [_drift_json(drift) for drift in drifts]}
+
+    async def __push(self, name: str, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        addresses = {device_id: tuple(address) for device_id, address in request["addresses"].items()}
+        options = {key: request[key] for key in ("concurrency", "timeout", "retries", "backoff", "window")
+                   if key in request}
+        engine = PushEngine(addresses, request.get("username"), request.get("password"), **options)
+
+        scripts = await self.__batcher(name).submit(_render, list(addresses))
+        results = await engine.push_all(scripts)
+        return HTTPStatus.OK, {"failed": sum(not result.success for result in results),
+                               "devices": [_push_json(result) for result in results]}
+
+    async def __stats(self, request: dict, query: dict) -> Tuple[HTTPStatus, Any]:
+        batchers = {name: batcher for name, (_, batcher) in self.__topologies.items()}
+        return HTTPStatus.OK, {
+            "requests": self.requests,
+            "topologies": {name: {"batches": batcher.batches, "operations": batcher.operations}
+                           for name, batcher in batchers.items()}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the IPTx backbone automation server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=64, help="Operations sent to a topology at once")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="Milliseconds to wait for a batch to fill")
+    parser.add_argument("--processes", type=int, help="Worker processes for the diffs (one per CPU by default)")
+    parser.add_argument("--verbose", action="store_true", help="Let the topologies print their logs")
+    args = parser.parse_args()
+
+    server = AutomationServer(args.host, args.port, args.max_batch, args.batch_window / 1000, args.processes,
+                              not args.verbose)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print_success("Automation server stopped")
+
+
+if __name__ == "__main__":
+    main()
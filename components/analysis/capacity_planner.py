@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Sequence, Tuple, TYPE_CHECKING
+from weakref import WeakKeyDictionary
+
+import numpy as np
+from tabulate import tabulate
+
+from components.analysis.spf import ShortestPathTree, SPFEngine, topology_snapshot
+from iptx_utils import NotFoundError, print_log, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.backbone import Backbone
+
+TrafficMatrix = Dict[Tuple[str, str], float]  # (source PE ID, destination PE ID) -> traffic in k bits/s
+Direction = Tuple[str, str, int | None, int]  # (source router ID, destination router ID, SCR, bandwidth in k bits/s)
+
+
+def link_directions(backbone: Backbone, router_ids: Iterable[str]) -> List[Direction]:
+    # Both directions of every internal link between the given routers, as plain data
+    router_ids, directions = set(router_ids), []
+    for device1, device2, data in backbone.get_all_links():
+        if data.get("external") or device1.id() not in router_ids or device2.id() not in router_ids:
+            continue
+
+        directions.append((device1.id(), device2.id(), data.get("scr"), data["bandwidth"]))
+        directions.append((device2.id(), device1.id(), data.get("scr"), data["bandwidth"]))
+
+    return directions
+
+
+class LinkLoad:
+    def __init__(self, scr: int, source: str, destination: str, load: float, bandwidth: int) -> None:
+        self.scr = scr
+        self.source = source
+        self.destination = destination
+        self.load = load  # k bits/s
+        self.bandwidth = bandwidth  # k bits/s
+
+    @property
+    def utilization(self) -> float:
+        return self.load / self.bandwidth
+
+
+class CapacityPlanner:
+    """
+    Routes a PE-to-PE traffic matrix over the OSPF shortest paths of a backbone, splitting the traffic equally
+    among the ECMP next hops at every router (like CEF per-flow load sharing does on average), and reports the
+    load of each direction of every internal link as a fraction of its bandwidth.
+
+    The traffic towards each destination is pushed through its tree one distance level at a time, with NumPy
+    doing the splitting and the accumulation of all the routers of the level at once.
+
+    It can also be made from plain data (an engine and the link directions, without a backbone), e.g. in another
+    process, in which case only the printing is not available.
+    """
+
+    def __init__(self, backbone: Backbone | None, engine: SPFEngine = None, directions: List[Direction] = None) -> None:
+        self.backbone = backbone
+        self.engine = engine if engine is not None else SPFEngine(*topology_snapshot(backbone))
+
+        self.__router_ids: List[str] = self.engine.routers()
+        self.__router_index: Dict[str, int] = {router_id: index for index, router_id in enumerate(self.__router_ids)}
+
+        # Both directions of every internal link, with their SCR and bandwidth
+        if directions is None:
+            directions = link_directions(backbone, self.__router_ids)
+
+        self.__directions: List[Tuple[str, str]] = [(source, destination) for source, destination, _, _ in directions]
+        self.__direction_index: Dict[Tuple[str, str], int] = {direction: index for index, direction
+                                                              in enumerate(self.__directions)}
+        self.__scrs = [scr for _, _, scr, _ in directions]
+        self.__bandwidths = np.array([bandwidth for _, _, _, bandwidth in directions], dtype=np.float64)
+
+        # Forwarding DAG of each tree as arrays (see __forwarding_dag), kept for as long as the tree is in use
+        self.__dags: WeakKeyDictionary[ShortestPathTree, List[Tuple[np.ndarray, ...]]] = WeakKeyDictionary()
+
+    def __forwarding_dag(self, destination: str) -> List[Tuple[np.ndarray, ...]]:
+        # For each distance level (farthest first): the routers, their next hops, the links and the share per hop
+        tree = self.engine.reverse_tree(destination)
+
+        # The engine makes a new tree after a link change, so the DAG of the same tree is still valid
+        if tree in self.__dags:
+            return self.__dags[tree]
+
+        levels: Dict[int, Tuple[List[int], List[int], List[int], List[float]]] = {}
+
+        for router_id in tree.order():
+            next_hops = tree.predecessors[router_id]
+            if not next_hops:
+                continue
+
+            routers, hops, directions, shares = levels.setdefault(tree.distances[router_id], ([], [], [], []))
+            for next_hop in next_hops:
+                routers.append(self.__router_index[router_id])
+                hops.append(self.__router_index[next_hop])
+                directions.append(self.__direction_index[(router_id, next_hop)])
+                shares.append(1 / len(next_hops))
+
+        dag = [(np.array(routers), np.array(hops), np.array(directions), np.array(shares))
+               for distance, (routers, hops, directions, shares) in sorted(levels.items(), reverse=True)]
+
+        self.__dags[tree] = dag
+        return dag
+
+    def route_traffic(self, traffic: TrafficMatrix) -> Tuple[np.ndarray, float]:
+        # Load (k bits/s) of each link direction, in the order of link_directions(), and the traffic without a path
+        loads = np.zeros(len(self.__directions))
+
+        # Demands grouped by destination, as a column of the traffic matrix
+        columns: Dict[str, np.ndarray] = {}
+        for (source, destination), amount in traffic.items():
+            for router_id in (source, destination):
+                if router_id not in self.__router_index:
+                    raise NotFoundError(f"Router with ID '{router_id}' is not a router of the backbone")
+
+            if source != destination:
+                column = columns.setdefault(destination, np.zeros(len(self.__router_ids)))
+                column[self.__router_index[source]] += amount
+
+        unroutable = 0.0
+        for destination, flow in columns.items():
+            reachable = self.engine.reverse_tree(destination).distances
+            unreachable = np.array([router_id not in reachable for router_id in self.__router_ids])
+            unroutable += flow[unreachable].sum()
+
+            # The farthest routers are done first, so each level forwards all the traffic that has reached it
+            for routers, hops, directions, shares in self.__forwarding_dag(destination):
+                forwarded = flow[routers] * shares
+                np.add.at(flow, hops, forwarded)
+                np.add.at(loads, directions, forwarded)
+
+        return loads, float(unroutable)
+
+    def link_loads(self, traffic: TrafficMatrix) -> np.ndarray:
+        # Load (k bits/s) of each link direction, in the order of link_directions()
+        loads, unroutable = self.route_traffic(traffic)
+        if unroutable:
+            print_warning(f"{unroutable} k bits/s of the traffic matrix has no path to its destination", prompt=False)
+
+        return loads
+
+    def link_directions(self) -> List[Tuple[str, str]]:
+        return list(self.__directions)
+
+    def bandwidths(self) -> np.ndarray:
+        # Bandwidth (k bits/s) of each link direction, in the order of link_directions()
+        return self.__bandwidths
+
+    def scrs(self) -> List[int | None]:
+        return list(self.__scrs)
+
+    def hot_links(self, traffic: TrafficMatrix, top: int = None) -> List[LinkLoad]:
+        # Link directions in descending order of utilization
+        loads = self.link_loads(traffic)
+        utilization = loads / self.__bandwidths
+        ranking = np.argsort(-utilization, kind="stable")[:top]
+
+        return [LinkLoad(self.__scrs[index], *self.__directions[index], float(loads[index]),
+                         int(self.__bandwidths[index])) for index in ranking]
+
+    def print_hot_links(self, traffic: TrafficMatrix, top: int = 20, threshold: float = 0.8) -> None:
+        hot_links = self.hot_links(traffic, top)
+
+        data = [[
+            str(link.scr),
+            f"{self.backbone[link.source]} ---> {self.backbone[link.destination]}",
+            f"{link.load:.0f}",
+            f"{link.bandwidth}",
+            f"{link.utilization * 100:.1f}%",
+            "SATURATED" if link.utilization >= 1 else "HOT" if link.utilization >= threshold else ""
+        ] for link in hot_links]
+
+        headers = ["SCR", "Direction", "Load (KB/s)", "Bandwidth (KB/s)", "Utilization", "Status"]
+
+        print()
+        print_log(f"AS {self.backbone.as_number}: The busiest backbone links for the given traffic matrix:")
+        print(tabulate(data, headers=headers))
+        print()
+
+    @staticmethod
+    def uniform_traffic(pe_ids: Sequence[str], amount: float) -> TrafficMatrix:
+        # The same amount of traffic between every pair of PEs
+        return {(source, destination): amount for source in pe_ids for destination in pe_ids if source != destination}
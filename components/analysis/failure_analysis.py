@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+
+import numpy as np
+from tabulate import tabulate
+
+from components.analysis.capacity_planner import CapacityPlanner, Direction, LinkLoad, TrafficMatrix, link_directions
+from components.analysis.spf import Link, SPFEngine, topology_snapshot
+from components.analysis.vpn_reachability import VPNReachability
+from iptx_utils import NetworkError, print_log, print_success
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.backbone import Backbone
+
+LINK_FAILURE = "link"
+ROUTER_FAILURE = "router"
+CHUNK_SIZE = 64
+
+Failure = Tuple[str, str, str | None]  # (LINK_FAILURE, router ID 1, router ID 2) or (ROUTER_FAILURE, router ID, None)
+PEPair = Tuple[str, str]  # The provider edges of two client sites which should reach each other
+
+
+class FailureImpact:
+    def __init__(self, failure: Failure, scr: int | None, lost_sites: List[Tuple[str, str]], lost_traffic: float,
+                 hot_links: List[LinkLoad], max_utilization: float) -> None:
+        self.kind, self.router1, self.router2 = failure
+        self.scr = scr  # Only for the link failures
+        self.lost_sites = lost_sites  # Pairs of client sites that can't reach each other anymore
+        self.lost_traffic = lost_traffic  # k bits/s without a path, or from/to the failed router
+        self.hot_links = hot_links  # The link directions over the threshold that get some of the rerouted traffic
+        self.max_utilization = max_utilization
+
+    def severity(self) -> Tuple[int, float, int, float]:
+        # Lost reachability first, then the lost traffic, then the congestion
+        return len(self.lost_sites), self.lost_traffic, len(self.hot_links), self.max_utilization
+
+
+class FailureAnalyzer:
+    """
+    What-if analysis of every single failure of a backbone: each internal link (by its SCR) and each router of the
+    AS is failed on its own, and the impact is measured against the normal state:
+
+    - The pairs of client sites which can't reach each other anymore (only the VPN sites which reach each other
+      to begin with, in an L3VPN backbone), since their provider edges are cut off (or have failed)
+    - The traffic of the traffic matrix that has no path anymore
+    - The link directions which go over the utilization threshold with the rerouted traffic
+
+    The failures are split in chunks over a process pool. Every worker builds its SPF engine once, and applies
+    each failure to it (and then takes it back) as an incremental change, so only the trees that actually use the
+    failed element are computed again, and the other trees (and their forwarding DAGs) are reused.
+    """
+
+    def __init__(self, backbone: Backbone, traffic: TrafficMatrix = None, threshold: float = 0.8) -> None:
+        self.backbone = backbone
+        self.traffic = traffic if traffic is not None else {}
+        self.threshold = threshold
+
+        self.__snapshot = topology_snapshot(backbone)
+        self.__directions = link_directions(backbone, self.__snapshot[0])
+        self.__sites = self.__site_pairs()
+
+    def __site_pairs(self) -> Dict[PEPair, List[Tuple[str, str]]]:
+        # The pairs of client sites which should reach each other, grouped by their provider edges
+        routers = set(self.__snapshot[0])
+        if hasattr(self.backbone, "get_all_vrfs"):
+            reachability = VPNReachability(self.backbone)
+            sites = {client: provider_edge for client, provider_edge, _ in reachability.sites()}
+            pairs = [(client1, client2) for client1 in sites for client2 in reachability.reachable_sites(client1)
+                     if client1 < client2]
+        else:
+            sites = {}
+            for device1, device2, data in self.backbone.get_all_links():
+                if data.get("external"):
+                    client, provider_edge = (device1, device2) if device2.id() in routers else (device2, device1)
+                    sites[client.id()] = provider_edge.id()
+
+            pairs = [(client1, client2) for client1 in sites for client2 in sites if client1 < client2]
+
+        grouped = {}
+        for client1, client2 in pairs:
+            if sites[client1] in routers and sites[client2] in routers:
+                grouped.setdefault((sites[client1], sites[client2]), []).append((client1, client2))
+
+        return grouped
+
+    def failures(self) -> List[Failure]:
+        links = [(LINK_FAILURE, router1, router2) for router1, router2, _, _ in self.__snapshot[1]]
+        return links + [(ROUTER_FAILURE, router, None) for router in self.__snapshot[0]]
+
+    def analyze(self, processes: int = None) -> List[FailureImpact]:
+        # The impact of every single failure, the worst first
+        if not self.__snapshot[0]:
+            raise NetworkError(f"ERROR in AS_NUM {self.backbone.as_number}: There are no routers to fail")
+
+        pe_pairs = list(self.__sites)
+        args = (*self.__snapshot, self.__directions, pe_pairs, self.traffic, self.threshold)
+
+        failures = self.failures()
+        chunks = [failures[start:start + CHUNK_SIZE] for start in range(0, len(failures), CHUNK_SIZE)]
+        if processes == 1 or len(chunks) <= 1:
+            worker = _FailureWorker(*args)
+            results = [worker.evaluate(failure) for failure in failures]
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=args) as executor:
+                results = [result for chunk in executor.map(_evaluate_in_worker, chunks) for result in chunk]
+
+        scrs = {(router1, router2): scr for router1, router2, scr, _ in self.__directions}
+        impacts = []
+        for failure, (lost_pairs, lost_traffic, hot_links, max_utilization) in zip(failures, results):
+            lost_sites = [sites for index in lost_pairs for sites in self.__sites[pe_pairs[index]]]
+            hot = [LinkLoad(self.__directions[index][2], *self.__directions[index][:2], load,
+                            self.__directions[index][3]) for index, load in hot_links]
+
+            scr = scrs.get(failure[1:]) if failure[0] == LINK_FAILURE else None
+            impacts.append(FailureImpact(failure, scr, lost_sites, lost_traffic, hot, max_utilization))
+
+        impacts.sort(key=FailureImpact.severity, reverse=True)
+        return impacts
+
+    def print_report(self, impacts: List[FailureImpact] = None, top: int = 20) -> None:
+        impacts = impacts if impacts is not None else self.analyze()
+        harmful = [impact for impact in impacts if impact.lost_sites or impact.lost_traffic or impact.hot_links]
+
+        if not harmful:
+            print_success(f"AS {self.backbone.as_number}: No single failure out of {len(impacts)} loses any site "
+                          f"or overloads any link")
+            return
+
+        data = []
+        for rank, impact in enumerate(harmful[:top], start=1):
+            if impact.kind == LINK_FAILURE:
+                failure = f"SCR {impact.scr}: {self.backbone[impact.router1]} <---> {self.backbone[impact.router2]}"
+            else:
+                failure = str(self.backbone[impact.router1])
+
+            # Each link once, by its busiest direction
+            hot_scrs: Dict[int, float] = {}
+            for link in impact.hot_links:
+                hot_scrs.setdefault(link.scr, link.utilization)
+
+            hot_links = ", ".join(f"SCR {scr} ({utilization * 100:.0f}%)" for scr, utilization
+                                  in list(hot_scrs.items())[:3])
+            data.append([
+                rank,
+                failure,
+                len(impact.lost_sites),
+                f"{impact.lost_traffic:.0f}",
+                (hot_links + (", ..." if len(hot_scrs) > 3 else "")) or "-",
+                f"{impact.max_utilization * 100:.1f}%"
+            ])
+
+        headers = ["Rank", "Failure", "Sites Lost", "Traffic Lost (KB/s)", "Overloaded Links", "Max Utilization"]
+
+        print()
+        print_log(f"AS {self.backbone.as_number}: {len(harmful)} out of {len(impacts)} single failures have an impact:")
+        print(tabulate(data, headers=headers))
+        print()
+
+
+# ******************************** WORKERS ********************************
+class _FailureWorker:
+    # The normal state of the backbone, to which each failure is applied and then taken back
+    def __init__(self, routers: List[str], links: List[Link], directions: List[Direction], pe_pairs: List[PEPair],
+                 traffic: TrafficMatrix, threshold: float) -> None:
+        self.engine = SPFEngine(routers, links)
+        self.planner = CapacityPlanner(None, self.engine, directions)
+        self.pe_pairs = pe_pairs
+        self.traffic = traffic
+        self.threshold = threshold
+
+        # The trees of the normal state, which every failure starts from (and goes back to)
+        self.base_loads, _ = self.planner.route_traffic(traffic)
+        for router in {router for pe_pair in pe_pairs for router in pe_pair}:
+            self.engine.reverse_tree(router)
+
+        self.__checkpoint = self.engine.checkpoint()
+
+    def evaluate(self, failure: Failure) -> Tuple[List[int], float, List[Tuple[int, float]], float]:
+        kind, router1, router2 = failure
+        if kind == ROUTER_FAILURE:
+            self.engine.remove_router(router1)
+        else:
+            self.engine.remove_link(router1, router2)
+
+        try:
+            return self.__impact({router1} if kind == ROUTER_FAILURE else set())
+        finally:
+            self.engine.restore(self.__checkpoint)
+
+    def __impact(self, failed: Set[str]) -> Tuple[List[int], float, List[Tuple[int, float]], float]:
+        lost_pairs = []
+        for index, (router1, router2) in enumerate(self.pe_pairs):
+            if failed & {router1, router2}:
+                lost_pairs.append(index)
+            elif router1 != router2 and (router1 not in self.engine.reverse_tree(router2).distances
+                                         or router2 not in self.engine.reverse_tree(router1).distances):
+                lost_pairs.append(index)
+
+        # The traffic from or to a failed router is lost along with it
+        traffic = {demand: amount for demand, amount in self.traffic.items() if not failed & set(demand)}
+        loads, lost_traffic = self.planner.route_traffic(traffic)
+        lost_traffic += sum(self.traffic.values()) - sum(traffic.values())
+
+        utilization = loads / self.planner.bandwidths()
+        # Over the threshold, and with more traffic than before (some of the rerouted traffic goes through them)
+        hot_links = [(int(index), float(loads[index])) for index
+                     in np.flatnonzero((utilization >= self.threshold) & (loads > self.base_loads + 1e-9))]
+        hot_links.sort(key=lambda hot_link: -hot_link[1] / self.planner.bandwidths()[hot_link[0]])
+
+        return lost_pairs, float(lost_traffic), hot_links, float(utilization.max(initial=0))
+
+
+_worker: _FailureWorker | None = None
+
+
+def _init_worker(*args) -> None:
+    global _worker
+    _worker = _FailureWorker(*args)
+
+
+def _evaluate_in_worker(failures: List[Failure]) -> List[Tuple[List[int], float, List[Tuple[int, float]], float]]:
+    return [_worker.evaluate(failure) for failure in failures]
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple, TYPE_CHECKING
+
+import networkx as nx
+import numpy as np
+from tabulate import tabulate
+
+from components.analysis.spf import INFINITY, Link, SPFEngine, topology_snapshot
+from components.devices.router.router import Router
+from iptx_utils import NotFoundError, print_log, print_success, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+
+IMPLICIT_NULL = 3  # Advertised for the router's own FEC, so that the previous hop pops the label (PHP)
+LABEL_BASE = 16  # Labels 0-15 are reserved
+
+Session = Tuple[str, str]  # LDP session between two neighbors, in both directions
+
+
+class LFIB:
+    # Label forwarding table of a router, one row per (FEC, labelled next hop), as parallel integer arrays
+    def __init__(self, router: str, fecs: np.ndarray, in_labels: np.ndarray, out_labels: np.ndarray,
+                 next_hops: np.ndarray) -> None:
+        self.router = router
+        self.fecs = fecs  # Index of the FEC (the Loopback0 of that router)
+        self.in_labels = in_labels
+        self.out_labels = out_labels  # IMPLICIT_NULL means that the label is popped
+        self.next_hops = next_hops  # Index of the next hop router
+
+    def __len__(self) -> int:
+        return len(self.in_labels)
+
+
+class LDPSimulator:
+    """
+    Simulates the LDP label bindings and the LFIB of every router, with each router's Loopback0 as a FEC.
+
+    Each router allocates its local labels deterministically, starting from LABEL_BASE in the order of the FECs
+    (beginning after itself), and advertises implicit-null for its own FEC. So any binding is worked out from the
+    two indexes without being stored, and only the forwarding tables need arrays. The LFIB of a router comes from
+    its own shortest-path tree: one row for every ECMP next hop it has an LDP session with.
+
+    An LSP to a FEC works from a router if it has a labelled next hop, and every labelled next hop has a working
+    LSP as well. Otherwise the traffic is sent unlabelled (or dropped) somewhere along the way. Checking every
+    loopback would take one SPF per FEC, so only the FECs with a link without LDP on any of their shortest paths
+    are checked that way (the other FECs work from every router that can reach them at all).
+    """
+
+    def __init__(self, routers: List[str], links: List[Link], sessions: Iterable[Session]) -> None:
+        self.engine = SPFEngine(routers, links)
+        self.__routers = self.engine.routers()
+        self.__index: Dict[str, int] = {router: index for index, router in enumerate(self.__routers)}
+        self.__sessions: Set[Session] = set()
+        self.__lfibs: Dict[str, Tuple[List[str], LFIB]] = {}  # With the order() of the tree it was made from
+
+        for router1, router2 in sessions:
+            self.__sessions.update(((router1, router2), (router2, router1)))
+
+    @classmethod
+    def from_topology(cls, topology: Topology) -> LDPSimulator:
+        routers, links = topology_snapshot(topology)
+        router_ids = set(routers)
+
+        # An LDP session comes up over a link with MPLS enabled on both of its ends
+        sessions = []
+        for router in topology.get_all_routers():
+            if router.id() not in router_ids:
+                continue
+
+            for interface in router.all_phys_interfaces():
+                remote = interface.remote_device
+                if isinstance(remote, Router) and remote.id() in router_ids and interface.mpls_enabled \
+                        and remote.interface(interface.remote_port).mpls_enabled:
+                    sessions.append((router.id(), remote.id()))
+
+        return cls(routers, links, sessions)
+
+    def snapshot(self) -> Tuple[List[str], List[Link], List[Session]]:
+        return (*self.engine.snapshot(), sorted(self.__sessions))
+
+    # ******************************** LABELS ********************************
+    def local_label(self, router: str, fec: str) -> int:
+        # The label that the router binds to the FEC, and advertises to all its LDP neighbors
+        router_index, fec_index = self.__index[router], self.__index[fec]
+        if router_index == fec_index:
+            return IMPLICIT_NULL
+
+        return LABEL_BASE + (fec_index - router_index) % len(self.__routers) - 1
+
+    def bindings(self, router: str) -> np.ndarray:
+        # Local label of the router for every FEC, in the order of the routers
+        router_index = self.__index[router]
+        labels = LABEL_BASE + (np.arange(len(self.__routers)) - router_index) % len(self.__routers) - 1
+        labels[router_index] = IMPLICIT_NULL
+
+        return labels.astype(np.int32)
+
+    def lfib(self, router: str) -> LFIB:
+        tree = self.engine.tree(router)
+
+        # Still valid, if the tree hasn't changed since
+        if router in self.__lfibs and self.__lfibs[router][0] is tree.order():
+            return self.__lfibs[router][1]
+
+        # The first hops towards every destination, handed down the tree in order of distance
+        first_hops: Dict[str, Set[str]] = {router: set()}
+        for destination in tree.order()[1:]:
+            hops = set()
+            for predecessor in tree.predecessors[destination]:
+                hops.update({destination} if predecessor == router else first_hops[predecessor])
+
+            first_hops[destination] = hops
+
+        fecs, next_hops = [], []
+        for destination, hops in first_hops.items():
+            for hop in sorted(hops):
+                if (router, hop) in self.__sessions:
+                    fecs.append(self.__index[destination])
+                    next_hops.append(self.__index[hop])
+
+        router_index = self.__index[router]
+        fecs, next_hops = np.array(fecs, dtype=np.int32), np.array(next_hops, dtype=np.int32)
+        count = len(self.__routers)
+
+        in_labels = LABEL_BASE + (fecs - router_index) % count - 1
+        out_labels = LABEL_BASE + (fecs - next_hops) % count - 1
+        out_labels[fecs == next_hops] = IMPLICIT_NULL
+
+        lfib = LFIB(router, fecs, in_labels.astype(np.int32), out_labels.astype(np.int32), next_hops)
+        self.__lfibs[router] = (tree.order(), lfib)
+        return lfib
+
+    def print_lfib(self, router: str, limit: int = 50) -> None:
+        lfib = self.lfib(router)
+        data = [[
+            int(lfib.in_labels[row]),
+            "Pop Label" if lfib.out_labels[row] == IMPLICIT_NULL else int(lfib.out_labels[row]),
+            f"{self.__routers[lfib.fecs[row]]}/32",
+            self.__routers[lfib.next_hops[row]]
+        ] for row in range(min(len(lfib), limit))]
+
+        print()
+        print_log(f"LFIB of {router} ({len(lfib)} entries):")
+        print(tabulate(data, headers=["Local Label", "Outgoing Label", "Prefix", "Next Hop"]))
+        print()
+
+    # ******************************** LSP REACHABILITY ********************************
+    def lsp_reachability(self, fec: str) -> np.ndarray:
+        # Whether the LSP to the FEC works from each router, in the order of the routers
+        if fec not in self.__index:
+            raise NotFoundError(f"FEC '{fec}' is not the loopback of any router")
+
+        tree = self.engine.reverse_tree(fec)
+        working = np.zeros(len(self.__routers), dtype=bool)
+        working[self.__index[fec]] = True
+
+        # The next hops are always closer to the FEC, so they are decided before the routers that use them
+        for router in tree.order()[1:]:
+            labelled = [hop for hop in tree.predecessors[router] if (router, hop) in self.__sessions]
+            working[self.__index[router]] = bool(labelled) and all(working[self.__index[hop]] for hop in labelled)
+
+        return working
+
+    def __distances(self, router: str) -> np.ndarray:
+        distances = self.engine.tree(router).distances
+        return np.array([distances.get(other, INFINITY) for other in self.__routers])
+
+    def __suspect_fecs(self) -> np.ndarray:
+        # FECs with a link without an LDP session on any of their shortest paths (from any router)
+        suspect = np.zeros(len(self.__routers), dtype=bool)
+        distances: Dict[str, np.ndarray] = {}
+
+        for router in self.__routers:
+            for neighbor, cost in self.engine.neighbors(router).items():
+                if (router, neighbor) in self.__sessions:
+                    continue
+
+                for end in (router, neighbor):
+                    if end not in distances:
+                        distances[end] = self.__distances(end)
+
+                # The link is on a shortest path to every FEC that is just as far through the neighbor
+                suspect |= np.isfinite(distances[router]) & (distances[router] == cost + distances[neighbor])
+
+        return suspect
+
+    def __reaching_routers(self, fecs: List[str]) -> Dict[str, np.ndarray]:
+        # FEC -> which routers have any path to it (the same for every FEC of a strongly connected component)
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.__routers)
+        graph.add_edges_from((router, neighbor) for router in self.__routers
+                             for neighbor in self.engine.neighbors(router))
+
+        components, masks, reaching = {}, {}, {}
+        for number, component in enumerate(nx.strongly_connected_components(graph)):
+            components.update({router: number for router in component})
+
+        for fec in fecs:
+            number = components[fec]
+            if number not in masks:
+                ancestors = nx.ancestors(graph, fec) | {fec}
+                masks[number] = np.array([router in ancestors for router in self.__routers])
+
+            reaching[fec] = masks[number]
+
+        return reaching
+
+    def broken_lsps(self, fecs: Iterable[str] = None, processes: int = None) -> Dict[str, List[str]]:
+        # FEC -> the routers whose LSP to it is broken (including the ones that can't reach it at all)
+        fecs = list(fecs) if fecs is not None else self.__routers
+        for fec in fecs:
+            if fec not in self.__index:
+                raise NotFoundError(f"FEC '{fec}' is not the loopback of any router")
+
+        suspect = self.__suspect_fecs()
+        checked = [fec for fec in fecs if suspect[self.__index[fec]]]
+
+        broken = {}
+        for fec, reaching in self.__reaching_routers([fec for fec in fecs if not suspect[self.__index[fec]]]).items():
+            if not reaching.all():
+                broken[fec] = [self.__routers[index] for index in np.flatnonzero(~reaching)]
+
+        # The suspect FECs get a full check each, in parallel when there are many of them. The trees of a large
+        # batch are not kept in this engine, since there would be one for every FEC
+        chunks = [checked[start:start + 256] for start in range(0, len(checked), 256)]
+        if len(chunks) <= 1:
+            results = [_broken_lsps(self, chunk) for chunk in chunks]
+        elif processes == 1:
+            results = [_broken_lsps(LDPSimulator(*self.snapshot()), chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=self.snapshot()) as executor:
+                results = list(executor.map(_broken_lsps_in_worker, chunks))
+
+        for result in results:
+            broken.update(result)
+
+        return {fec: broken[fec] for fec in fecs if fec in broken}
+
+    def check_lsps(self, fecs: Iterable[str] = None, processes: int = None) -> bool:
+        fecs = list(fecs) if fecs is not None else self.__routers
+        broken = self.broken_lsps(fecs, processes)
+        total = sum(len(routers) for routers in broken.values())
+
+        if not total:
+            print_success(f"All the LSPs to {len(fecs)} loopbacks are working")
+            return True
+
+        print_warning(f"{total} broken LSPs towards {len(broken)} loopbacks", prompt=False)
+        data = [[fec, len(routers), ", ".join(routers[:5]) + (", ..." if len(routers) > 5 else "")]
+                for fec, routers in sorted(broken.items(), key=lambda item: -len(item[1]))[:20]]
+        print(tabulate(data, headers=["FEC", "Broken From", "Routers"]))
+        print()
+        return False
+
+    def routers(self) -> List[str]:
+        return list(self.__routers)
+
+
+# ******************************** WORKERS ********************************
+_worker_snapshot: Tuple[List[str], List[Link], List[Session]] | None = None
+
+
+def _init_worker(routers: List[str], links: List[Link], sessions: List[Session]) -> None:
+    global _worker_snapshot
+    _worker_snapshot = (routers, links, sessions)
+
+
+def _broken_lsps(simulator: LDPSimulator, fecs: List[str]) -> Dict[str, List[str]]:
+    routers, broken = simulator.routers(), {}
+    for fec in fecs:
+        working = simulator.lsp_reachability(fec)
+        if not working.all():
+            broken[fec] = [routers[index] for index in np.flatnonzero(~working)]
+
+    return broken
+
+
+def _broken_lsps_in_worker(fecs: List[str]) -> Dict[str, List[str]]:
+    # A new simulator for every chunk, so that the trees of the previous chunks are freed
+    return _broken_lsps(LDPSimulator(*_worker_snapshot), fecs)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Tuple, TYPE_CHECKING
+
+from tabulate import tabulate
+
+from components.analysis.spf import INFINITY, SPFEngine, topology_snapshot
+from iptx_utils import print_log, print_success, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.l2vpnbackbone import L2VPNBackbone
+
+LABEL_SIZE = 4  # Bytes of each MPLS label
+PW_LABELS = 2  # The LDP transport label of the LSP, and the pseudowire (VC) label
+XR_L2_HEADER = 14  # The MTU of an IOS-XR interface includes the Ethernet header
+
+Pseudowire = Tuple[int, str, str]  # (VLAN ID, gateway router ID 1, gateway router ID 2)
+
+
+def ip_mtu(interface) -> int:
+    # The MTU of an interface, without the Ethernet header which IOS-XR counts in
+    return interface.mtu - XR_L2_HEADER if getattr(interface, "xr_mode", False) else interface.mtu
+
+
+class PseudowirePath:
+    def __init__(self, pseudowire: Pseudowire, hops: int | None, bottleneck_mtu: int | float,
+                 bottleneck_link: Tuple[str, str] | None, required_mtu: int) -> None:
+        self.vlan_id, self.router1, self.router2 = pseudowire
+        self.hops = hops  # Of the longest ECMP path of the LSP, or None if there's no path at all
+        self.bottleneck_mtu = bottleneck_mtu  # Smallest MTU along any of the ECMP paths (INFINITY for local ones)
+        self.bottleneck_link = bottleneck_link
+        self.required_mtu = required_mtu
+
+    @property
+    def reachable(self) -> bool:
+        return self.hops is not None
+
+    @property
+    def fits(self) -> bool:
+        return self.reachable and self.bottleneck_mtu >= self.required_mtu
+
+
+class PseudowirePaths:
+    """
+    Computes the LSP of each pseudowire of an L2VPN backbone over the OSPF shortest paths between its gateway
+    routers, with its hop count and its bottleneck MTU, which has to fit the payload (the MTU of the backbone)
+    along with the label stack (PW_LABELS labels).
+
+    The traffic of a pseudowire may take any of the ECMP paths, so the bottleneck is the smallest MTU of every link
+    on any of the shortest paths, and the hop count is of the longest one. Both are worked out for every destination
+    at once, in a single pass over the shortest-path tree of the source, so there is one tree per gateway router,
+    however many pseudowires start from it.
+    """
+
+    def __init__(self, backbone: L2VPNBackbone, engine: SPFEngine = None, payload: int = None,
+                 labels: int = PW_LABELS) -> None:
+        self.backbone = backbone
+        self.engine = engine if engine is not None else SPFEngine(*topology_snapshot(backbone))
+        self.required_mtu = (payload if payload is not None else backbone.mtu) + labels * LABEL_SIZE
+
+        # MTU of each direction of every internal link: the smallest of its two interfaces
+        self.__link_mtus: Dict[Tuple[str, str], int] = {}
+        for device1, device2, data in backbone.get_all_links():
+            if data.get("external"):
+                continue
+
+            # The edges are undirected, so the ports are matched against the interfaces of the first device
+            port1, port2 = data["d1_port"], data["d2_port"]
+            if not any(interface.remote_device is device2 and interface.port == port1
+                       for interface in device1.all_phys_interfaces()):
+                port1, port2 = port2, port1
+
+            mtu = min(ip_mtu(device1.interface(port1)), ip_mtu(device2.interface(port2)))
+            self.__link_mtus[(device1.id(), device2.id())] = self.__link_mtus[(device2.id(), device1.id())] = mtu
+
+    def __from_source(self, source: str) -> Tuple[Dict[str, int], Dict[str, int], Dict[str, Tuple[str, str]]]:
+        # Hops, bottleneck MTU and bottleneck link towards every router, handed down the tree in order of distance
+        tree = self.engine.tree(source)
+        hops, mtus, links = {source: 0}, {source: INFINITY}, {source: None}
+
+        for router in tree.order()[1:]:
+            hops[router], mtus[router] = 0, INFINITY
+            for predecessor in tree.predecessors[router]:
+                hops[router] = max(hops[router], hops[predecessor] + 1)
+
+                link_mtu = self.__link_mtus[(predecessor, router)]
+                if mtus[predecessor] < min(mtus[router], link_mtu):
+                    mtus[router], links[router] = mtus[predecessor], links[predecessor]
+                elif link_mtu < mtus[router]:
+                    mtus[router], links[router] = link_mtu, (predecessor, router)
+
+        return hops, mtus, links
+
+    def compute(self, pseudowires: Iterable[Pseudowire] = None) -> List[PseudowirePath]:
+        # The paths of the given pseudowires (all the ones of the backbone, by default), in the same order
+        pseudowires = list(pseudowires) if pseudowires is not None else self.backbone.get_pseudowires()
+
+        by_source: Dict[str, List[int]] = {}
+        for index, (_, router1, _) in enumerate(pseudowires):
+            by_source.setdefault(router1, []).append(index)
+
+        paths: List[PseudowirePath | None] = [None] * len(pseudowires)
+        routers = set(self.engine.routers())
+        for source, indexes in by_source.items():
+            hops, mtus, links = self.__from_source(source) if source in routers else ({}, {}, {})
+
+            for index in indexes:
+                destination = pseudowires[index][2]
+                paths[index] = PseudowirePath(pseudowires[index], hops.get(destination), mtus.get(destination, 0),
+                                              links.get(destination), self.required_mtu)
+
+        return paths
+
+    def validate(self, pseudowires: Iterable[Pseudowire] = None) -> bool:
+        paths = self.compute(pseudowires)
+        failed = [path for path in paths if not path.fits]
+
+        if not failed:
+            print_success(f"AS {self.backbone.as_number}: All the {len(paths)} pseudowires fit an MTU of "
+                          f"{self.required_mtu} bytes along their LSPs")
+            return True
+
+        print_warning(f"AS {self.backbone.as_number}: {len(failed)} out of {len(paths)} pseudowires don't fit an "
+                      f"MTU of {self.required_mtu} bytes along their LSPs", prompt=False)
+        self.print_paths(failed)
+        return False
+
+    def print_paths(self, paths: List[PseudowirePath] = None, limit: int = 50) -> None:
+        paths = paths if paths is not None else self.compute()
+
+        data = []
+        for path in paths[:limit]:
+            if path.bottleneck_link is not None:
+                scr = self.backbone.get_link(*path.bottleneck_link)[2].get("scr")
+                bottleneck = f"{path.bottleneck_mtu} (SCR {scr})"
+            else:
+                bottleneck = "-" if path.reachable else "No path"
+
+            data.append([
+                path.vlan_id,
+                f"{self.backbone[path.router1]} <---> {self.backbone[path.router2]}",
+                path.hops if path.reachable else "-",
+                bottleneck,
+                "OK" if path.fits else f"SHORT BY {path.required_mtu - path.bottleneck_mtu}" if path.reachable
+                else "UNREACHABLE"
+            ])
+
+        headers = ["VLAN", "Gateway Routers", "Hops", "Bottleneck MTU", "Status"]
+
+        print()
+        print_log(f"AS {self.backbone.as_number}: LSPs of {len(paths)} pseudowires "
+                  f"(required MTU: {self.required_mtu} bytes):")
+        print(tabulate(data, headers=headers))
+        print()
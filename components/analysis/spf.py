@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, TYPE_CHECKING
+
+from components.devices.router.router import Router
+from iptx_utils import NotFoundError
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+
+INFINITY = float('inf')
+
+# Plain data of a topology, which can be sent to other processes: (router IDs, links)
+Link = Tuple[str, str, int, int]  # (router ID 1, router ID 2, cost from 1 to 2, cost from 2 to 1)
+Snapshot = Tuple[List[str], List[Link]]
+
+
+def ospf_cost(reference_bw: int, bandwidth: int) -> int:
+    # Same as 'auto-cost reference-bandwidth': reference bandwidth (M bits/s) / interface bandwidth (k bits/s)
+    return max(1, int(reference_bw * 1000 // bandwidth))
+
+
+def topology_snapshot(topology: Topology) -> Snapshot:
+    # The OSPF domain: the routers of the AS, and the internal links between them
+    routers = {router.id(): router for router in topology.get_all_routers() if router.as_number == topology.as_number}
+    links = []
+
+    for device1, device2, data in topology.get_all_links():
+        if data.get("external") or device1.id() not in routers or device2.id() not in routers:
+            continue
+
+        bandwidth = data["bandwidth"]
+        links.append((device1.id(), device2.id(), ospf_cost(device1.reference_bw, bandwidth),
+                      ospf_cost(device2.reference_bw, bandwidth)))
+
+    return list(routers.keys()), links
+
+
+class ShortestPathTree:
+    """
+    Shortest paths from one root router, with every equal-cost predecessor of each router (so the ECMP paths
+    form a DAG). Unreachable routers are left out.
+
+    A tree is never changed once the engine has handed it out: every change makes a new tree, so the callers can
+    tell whether the tree has changed (by its order() list), and the old trees can still be used.
+    """
+
+    def __init__(self, root: str, distances: Dict[str, int], predecessors: Dict[str, Set[str]]) -> None:
+        self.root = root
+        self.distances = distances
+        self.predecessors = predecessors
+        self.__order: List[str] | None = None
+
+    def distance(self, destination: str) -> int | float:
+        return self.distances.get(destination, INFINITY)
+
+    def order(self) -> List[str]:
+        # Reachable routers in ascending order of distance (the root first)
+        if self.__order is None:
+            self.__order = sorted(self.distances, key=self.distances.__getitem__)
+
+        return self.__order
+
+    def copy(self) -> ShortestPathTree:
+        # The predecessor sets are shared, so a change to the copy has to replace the set instead of modifying it
+        return ShortestPathTree(self.root, dict(self.distances), dict(self.predecessors))
+
+    def next_hops(self, destination: str) -> Set[str]:
+        # The neighbors of the root that are on any of the shortest paths to the destination
+        if destination == self.root or destination not in self.distances:
+            return set()
+
+        hops, visited, stack = set(), {destination}, [destination]
+        while stack:
+            router = stack.pop()
+            for predecessor in self.predecessors[router]:
+                if predecessor == self.root:
+                    hops.add(router)
+                elif predecessor not in visited:
+                    visited.add(predecessor)
+                    stack.append(predecessor)
+
+        return hops
+
+    def paths(self, destination: str) -> Iterator[List[str]]:
+        # Every equal-cost shortest path from the root to the destination
+        if destination not in self.distances:
+            return
+
+        def walk(router: str) -> Iterator[List[str]]:
+            if router == self.root:
+                yield [router]
+                return
+
+            for predecessor in sorted(self.predecessors[router]):
+                for path in walk(predecessor):
+                    yield path + [router]
+
+        yield from walk(destination)
+
+
+# Links and cached trees of an engine: (adjacency, reverse adjacency, trees, reverse trees)
+Checkpoint = Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, int]], Dict[str, ShortestPathTree],
+                   Dict[str, ShortestPathTree]]
+
+
+class SPFEngine:
+    """
+    OSPF shortest-path simulator over the internal links of a topology, with the link costs derived the same way
+    as 'auto-cost reference-bandwidth' (each direction uses the reference bandwidth of the sending router).
+
+    The tree of each root is computed on demand and cached, in both directions: from the root (tree()) and towards
+    it (reverse_tree(), whose predecessors are the ECMP next hops of each router to the root). After a link change,
+    only the cached trees which actually use (or would use) the link are touched: a cheaper link is propagated from
+    its far end, an ECMP branch that goes away is just dropped, and when the only path gets longer, only the
+    routers behind it are worked out again.
+
+    Since the trees are never changed in place, a checkpoint() of the engine is cheap, and restore() takes it
+    back to that state without computing anything (e.g. to try out a failure and then undo it).
+
+    NOTE: All the routers are treated as a single area, since the intra-area and inter-area paths have the same
+    costs when every area is attached to the backbone area.
+    """
+
+    def __init__(self, routers: Iterable[str] = (), links: Iterable[Link] = ()) -> None:
+        self.__adjacency: Dict[str, Dict[str, int]] = {router: {} for router in routers}
+        self.__reverse_adjacency: Dict[str, Dict[str, int]] = {router: {} for router in routers}
+        self.__trees: Dict[str, ShortestPathTree] = {}
+        self.__reverse_trees: Dict[str, ShortestPathTree] = {}
+        self.recomputed_trees = 0  # Number of full Dijkstra runs, for checking the incremental updates
+
+        for router1, router2, cost12, cost21 in links:
+            self.__set_cost(router1, router2, cost12)
+            self.__set_cost(router2, router1, cost21)
+
+    @classmethod
+    def from_topology(cls, topology: Topology) -> SPFEngine:
+        return cls(*topology_snapshot(topology))
+
+    def snapshot(self) -> Snapshot:
+        # Each link once, along with the cost of its other direction
+        links = [(router1, router2, cost, self.__adjacency[router2].get(router1, INFINITY))
+                 for router1, neighbors in self.__adjacency.items() for router2, cost in neighbors.items()
+                 if router1 < router2 or router1 not in self.__adjacency[router2]]
+
+        return list(self.__adjacency.keys()), links
+
+    def routers(self) -> List[str]:
+        return list(self.__adjacency.keys())
+
+    def neighbors(self, router: str) -> Dict[str, int]:
+        # Neighbor -> cost of the link towards it
+        return self.__adjacency[router]
+
+    def cost(self, router1: str, router2: str) -> int | float:
+        return self.__adjacency.get(router1, {}).get(router2, INFINITY)
+
+    # ******************************** TREES ********************************
+    def __set_cost(self, router: str, neighbor: str, cost: int | float) -> None:
+        self.__adjacency.setdefault(router, {})
+        self.__reverse_adjacency.setdefault(neighbor, {})
+
+        if cost == INFINITY:
+            self.__adjacency[router].pop(neighbor, None)
+            self.__reverse_adjacency[neighbor].pop(router, None)
+        else:
+            self.__adjacency[router][neighbor] = cost
+            self.__reverse_adjacency[neighbor][router] = cost
+
+    def __dijkstra(self, root: str, adjacency: Dict[str, Dict[str, int]]) -> ShortestPathTree:
+        self.recomputed_trees += 1
+        distances: Dict[str, int] = {root: 0}
+        predecessors: Dict[str, Set[str]] = {root: set()}
+        done: Set[str] = set()
+        heap = [(0, root)]
+
+        while heap:
+            distance, router = heapq.heappop(heap)
+            if router in done:
+                continue
+
+            done.add(router)
+            for neighbor, cost in adjacency[router].items():
+                new_distance = distance + cost
+                old_distance = distances.get(neighbor, INFINITY)
+
+                if new_distance < old_distance:
+                    distances[neighbor] = new_distance
+                    predecessors[neighbor] = {router}
+                    heapq.heappush(heap, (new_distance, neighbor))
+                elif new_distance == old_distance and neighbor not in done:
+                    predecessors[neighbor].add(router)
+
+        return ShortestPathTree(root, distances, predecessors)
+
+    def tree(self, root: str) -> ShortestPathTree:
+        if root not in self.__adjacency:
+            raise NotFoundError(f"Router with ID '{root}' not found in the SPF engine")
+
+        if root not in self.__trees:
+            self.__trees[root] = self.__dijkstra(root, self.__adjacency)
+
+        return self.__trees[root]
+
+    def reverse_tree(self, destination: str) -> ShortestPathTree:
+        # Shortest paths towards the destination: the distances are to it, and the predecessors are the next hops
+        if destination not in self.__adjacency:
+            raise NotFoundError(f"Router with ID '{destination}' not found in the SPF engine")
+
+        if destination not in self.__reverse_trees:
+            self.__reverse_trees[destination] = self.__dijkstra(destination, self.__reverse_adjacency)
+
+        return self.__reverse_trees[destination]
+
+    def cached_roots(self) -> List[str]:
+        return list(self.__trees.keys())
+
+    def distance(self, source: str, destination: str) -> int | float:
+        return self.tree(source).distance(destination)
+
+    def next_hops(self, source: str, destination: str) -> Set[str]:
+        return self.tree(source).next_hops(destination)
+
+    def paths(self, source: str, destination: str) -> List[List[str]]:
+        return list(self.tree(source).paths(destination))
+
+    # ******************************** INCREMENTAL UPDATES ********************************
+    @staticmethod
+    def __propagate_decrease(tree: ShortestPathTree, adjacency: Dict[str, Dict[str, int]],
+                             router: str, neighbor: str, cost: int) -> ShortestPathTree:
+        # Dijkstra from the far end of a cheaper link, which only goes as far as the distances improve
+        new_distance = tree.distances[router] + cost
+        old_distance = tree.distance(neighbor)
+
+        if new_distance > old_distance:
+            return tree
+
+        tree = tree.copy()
+        if new_distance == old_distance:
+            tree.predecessors[neighbor] = tree.predecessors[neighbor] | {router}
+            return tree
+
+        tree.distances[neighbor] = new_distance
+        tree.predecessors[neighbor] = {router}
+        heap = [(new_distance, neighbor)]
+
+        while heap:
+            distance, current = heapq.heappop(heap)
+            if distance > tree.distances[current]:
+                continue
+
+            for next_router, next_cost in adjacency[current].items():
+                candidate = distance + next_cost
+                if candidate < tree.distance(next_router):
+                    tree.distances[next_router] = candidate
+                    tree.predecessors[next_router] = {current}
+                    heapq.heappush(heap, (candidate, next_router))
+                elif candidate == tree.distances[next_router]:
+                    tree.predecessors[next_router] = tree.predecessors[next_router] | {current}
+
+        return tree
+
+    @staticmethod
+    def __propagate_increase(tree: ShortestPathTree, adjacency: Dict[str, Dict[str, int]],
+                             incoming: Dict[str, Dict[str, int]], neighbor: str) -> ShortestPathTree:
+        # The far end of the link has lost its only shortest path, and so has every router which only has shortest
+        # paths through it. Just those routers are worked out again, starting from the ones around them
+        affected, heap = {neighbor}, [(tree.distances[neighbor], neighbor)]
+        while heap:
+            _, current = heapq.heappop(heap)
+            for next_router in adjacency[current]:
+                predecessors = tree.predecessors.get(next_router, ())
+                if current in predecessors and next_router not in affected and affected.issuperset(predecessors):
+                    affected.add(next_router)
+                    heapq.heappush(heap, (tree.distances[next_router], next_router))
+
+        tree = tree.copy()
+        for router in affected:
+            del tree.distances[router]
+            del tree.predecessors[router]
+
+        # The other routers only lose the ECMP branches through the affected ones
+        for router in affected:
+            for next_router in adjacency[router]:
+                if router in tree.predecessors.get(next_router, ()):
+                    tree.predecessors[next_router] = tree.predecessors[next_router] - affected
+
+        # Dijkstra among the affected routers, from their best way in from the rest of the tree
+        heap = []
+        for router in affected:
+            distance = min((tree.distances[previous] + cost for previous, cost in incoming[router].items()
+                            if previous in tree.distances), default=INFINITY)
+            if distance < INFINITY:
+                heap.append((distance, router))
+
+        heapq.heapify(heap)
+        while heap:
+            distance, router = heapq.heappop(heap)
+            if router in tree.distances:
+                continue
+
+            tree.distances[router] = distance
+            for next_router, cost in adjacency[router].items():
+                if next_router in affected and next_router not in tree.distances:
+                    heapq.heappush(heap, (distance + cost, next_router))
+
+        for router in affected:
+            if router in tree.distances:
+                tree.predecessors[router] = {previous for previous, cost in incoming[router].items()
+                                             if tree.distance(previous) + cost == tree.distances[router]}
+
+        return tree
+
+    def __update_trees(self, trees: Dict[str, ShortestPathTree], adjacency: Dict[str, Dict[str, int]],
+                       incoming: Dict[str, Dict[str, int]], router: str, neighbor: str, old_cost: int | float,
+                       cost: int | float) -> None:
+        for root, tree in list(trees.items()):
+            if router not in tree.distances:
+                continue
+
+            # The link was on a shortest path, and now it costs more
+            if cost > old_cost and router in tree.predecessors.get(neighbor, ()):
+                if len(tree.predecessors[neighbor]) > 1:
+                    # An equal-cost path remains, so only this branch of the ECMP is lost
+                    tree = tree.copy()
+                    tree.predecessors[neighbor] = tree.predecessors[neighbor] - {router}
+                    trees[root] = tree
+                else:
+                    trees[root] = self.__propagate_increase(tree, adjacency, incoming, neighbor)
+
+            elif cost < old_cost:
+                trees[root] = self.__propagate_decrease(tree, adjacency, router, neighbor, cost)
+
+    def __update_direction(self, router: str, neighbor: str, cost: int | float) -> None:
+        old_cost = self.__adjacency[router].get(neighbor, INFINITY)
+        if cost == old_cost:
+            return
+
+        self.__set_cost(router, neighbor, cost)
+
+        # In the reverse trees, the same link goes from the neighbor to the router
+        self.__update_trees(self.__trees, self.__adjacency, self.__reverse_adjacency, router, neighbor,
+                            old_cost, cost)
+        self.__update_trees(self.__reverse_trees, self.__reverse_adjacency, self.__adjacency, neighbor, router,
+                            old_cost, cost)
+
+    def set_link(self, router1: str, router2: str, cost12: int | float, cost21: int | float) -> None:
+        # Adds or changes a link (an infinite cost removes that direction)
+        for router in (router1, router2):
+            self.__adjacency.setdefault(router, {})
+            self.__reverse_adjacency.setdefault(router, {})
+
+        self.__update_direction(router1, router2, cost12)
+        self.__update_direction(router2, router1, cost21)
+
+    def remove_link(self, router1: str, router2: str) -> None:
+        self.set_link(router1, router2, INFINITY, INFINITY)
+
+    def remove_router(self, router: str) -> None:
+        for neighbor in [other for other, neighbors in self.__adjacency.items() if router in neighbors]:
+            self.remove_link(router, neighbor)
+
+        for neighbor in list(self.__adjacency[router].keys()):
+            self.remove_link(router, neighbor)
+
+        del self.__adjacency[router]
+        del self.__reverse_adjacency[router]
+        self.__trees.pop(router, None)
+        self.__reverse_trees.pop(router, None)
+
+    def checkpoint(self) -> Checkpoint:
+        # The links and the cached trees as they are now (the trees themselves are shared, since they never change)
+        return ({router: dict(neighbors) for router, neighbors in self.__adjacency.items()},
+                {router: dict(neighbors) for router, neighbors in self.__reverse_adjacency.items()},
+                dict(self.__trees), dict(self.__reverse_trees))
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        # The same checkpoint can be restored again, since it's copied once more
+        adjacency, reverse_adjacency, trees, reverse_trees = checkpoint
+        self.__adjacency = {router: dict(neighbors) for router, neighbors in adjacency.items()}
+        self.__reverse_adjacency = {router: dict(neighbors) for router, neighbors in reverse_adjacency.items()}
+        self.__trees = dict(trees)
+        self.__reverse_trees = dict(reverse_trees)
+
+    def sync_link(self, topology: Topology, device_id1: str, device_id2: str) -> None:
+        # Takes the current state of one link from the topology (e.g. after connecting or disconnecting it)
+        device1, device2 = topology[device_id1], topology[device_id2]
+        try:
+            data = topology.get_link(device_id1, device_id2)[2]
+        except KeyError:
+            self.remove_link(device_id1, device_id2)
+            return
+
+        if data.get("external") or not (isinstance(device1, Router) and isinstance(device2, Router)):
+            return
+
+        self.set_link(device_id1, device_id2, ospf_cost(device1.reference_bw, data["bandwidth"]),
+                      ospf_cost(device2.reference_bw, data["bandwidth"]))
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+import numpy as np
+from tabulate import tabulate
+
+from iptx_utils import NotFoundError, print_log
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.l3vpnbackbone import L3VPNBackbone
+
+Site = Tuple[str, str, str]  # (client device ID, provider edge ID, VRF ID)
+
+
+class VPNReachability:
+    """
+    Site-to-site reachability of an L3VPN backbone, from the route-targets of its VRFs and the VRF of each client.
+
+    A VRF has the routes of another VRF when it imports any of the route-targets that the other one exports, and two
+    sites can reach each other when their VRFs have the routes of each other (both ways, for the return traffic).
+    The sites of the same VRF on the same provider edge always can, through its local table, but on different
+    provider edges only if the VRF imports one of its own route-targets, like in the rendered definition.
+
+    The VRFs which export (or import) each route-target are kept as bitsets (Python integers), so the VRFs that a VRF
+    has the routes of are just the OR of the bitsets of its route-targets. The result is packed into a bit matrix of
+    VRF x VRF, so each query is a single lookup, and the sites of the same VRF share the same row.
+    """
+
+    def __init__(self, backbone: L3VPNBackbone) -> None:
+        self.backbone = backbone
+
+        # Taken together, so the IDs stay aligned with the VRFs even while VRFs are added
+        self.__vrf_ids, vrfs = backbone.vrf_snapshot()
+        self.__vrf_index: Dict[str, int] = {vrf_id: index for index, vrf_id in enumerate(self.__vrf_ids)}
+
+        # Route-target -> bitset of the VRFs that export (or import) it
+        exporters: Dict[int, int] = {}
+        importers: Dict[int, int] = {}
+        for index, vrf in enumerate(vrfs):
+            for route_target in vrf.export_route_targets():
+                exporters[route_target] = exporters.get(route_target, 0) | 1 << index
+            for route_target in vrf.import_route_targets():
+                importers[route_target] = importers.get(route_target, 0) | 1 << index
+
+        # Reachable both ways: the VRFs it has the routes of, which have its routes as well
+        row_bytes = (len(vrfs) + 7) // 8
+        self.__matrix = np.zeros((len(vrfs), row_bytes), dtype=np.uint8)
+
+        for index, vrf in enumerate(vrfs):
+            routes_of, routes_in = 0, 0
+            for route_target in vrf.import_route_targets():
+                routes_of |= exporters.get(route_target, 0)
+            for route_target in vrf.export_route_targets():
+                routes_in |= importers.get(route_target, 0)
+
+            self.__matrix[index] = np.frombuffer((routes_of & routes_in).to_bytes(row_bytes, "little"), np.uint8)
+
+        # The client sites, by their external links
+        self.__sites: Dict[str, Site] = {}
+        for device1, device2, data in backbone.get_all_links():
+            if not data.get("external") or data.get("vrf") not in self.__vrf_index:
+                continue
+
+            client, provider_edge = (device1, device2) if device1.as_number != backbone.as_number \
+                else (device2, device1)
+            self.__sites[client.id()] = (client.id(), provider_edge.id(), data["vrf"])
+
+    def __site(self, client_id: str) -> Site:
+        try:
+            return self.__sites[client_id]
+        except KeyError:
+            raise NotFoundError(f"Client with ID '{client_id}' is not a site of any VRF")
+
+    def vrf_reachable(self, vrf_id1: str, vrf_id2: str) -> bool:
+        index1, index2 = self.__vrf_index[vrf_id1], self.__vrf_index[vrf_id2]
+        return bool(self.__matrix[index1, index2 >> 3] >> (index2 & 7) & 1)
+
+    def reachable(self, client_id1: str, client_id2: str) -> bool:
+        # Whether the two client sites can reach each other
+        _, provider_edge_id1, vrf_id1 = self.__site(client_id1)
+        _, provider_edge_id2, vrf_id2 = self.__site(client_id2)
+        if vrf_id1 == vrf_id2 and provider_edge_id1 == provider_edge_id2:
+            return True
+
+        return self.vrf_reachable(vrf_id1, vrf_id2)
+
+    def reachable_vrfs(self, vrf_id: str) -> List[str]:
+        row = np.unpackbits(self.__matrix[self.__vrf_index[vrf_id]], bitorder="little")[:len(self.__vrf_ids)]
+        return [self.__vrf_ids[index] for index in np.flatnonzero(row)]
+
+    def reachable_sites(self, client_id: str) -> List[str]:
+        # The other sites that the site can reach
+        _, provider_edge_id, vrf_id = self.__site(client_id)
+        vrf_ids = set(self.reachable_vrfs(vrf_id))
+        return [other for other, site in self.__sites.items() if other != client_id and
+                (site[2] in vrf_ids or site[1:] == (provider_edge_id, vrf_id))]
+
+    def sites(self) -> List[Site]:
+        return list(self.__sites.values())
+
+    # ******************************** EXPORT ********************************
+    def export(self) -> Dict[str, object]:
+        # Compact form: each row of the VRF matrix as a hexadecimal bitset (bit i is the i-th VRF)
+        return {
+            "as_number": self.backbone.as_number,
+            "vrfs": self.__vrf_ids,
+            "sites": [[client_id, provider_edge_id, self.__vrf_index[vrf_id]]
+                      for client_id, provider_edge_id, vrf_id in self.__sites.values()],
+            "reachability": [f"{int.from_bytes(row.tobytes(), 'little'):x}" for row in self.__matrix]
+        }
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.export(), file)
+
+    def print_matrix(self) -> None:
+        client_ids = sorted(self.__sites)
+        data = [[client_id, self.__sites[client_id][2]] +
+                ["x" if self.reachable(client_id, other) else "" for other in client_ids] for client_id in client_ids]
+
+        print()
+        print_log(f"AS {self.backbone.as_number}: Reachability between the client sites:")
+        print(tabulate(data, headers=["Site", "VRF"] + client_ids))
+        print()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from typing import List, Tuple
+
+Address = Tuple[str, int]
+LineError = Tuple[int, str]  # (index of the line sent, error message)
+
+# Telnet (RFC 854) commands, to refuse every option that a real device may ask for
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+
+PROMPT = re.compile(rb"(^|[\r\n])[\w./:-]+(\([\w-]+\))?[#>] ?$")
+PROMPT_LINE = re.compile(rb"^[\w./:-]+(\([\w-]+\))?[#>]")  # A prompt, and the echo of the next line after it
+LOGIN_PROMPT = re.compile(rb"(?i)(username|login): ?$")
+PASSWORD_PROMPT = re.compile(rb"(?i)password: ?$")
+CONFIRM_PROMPT = re.compile(rb"(\[[^\]\r\n]*\]\? ?|\[confirm\])$")  # e.g. 'Destination filename [running-config]?'
+
+
+class CLIChannel:
+    """
+    Line-oriented session with the CLI of a device over a plain TCP (telnet) connection. Every command waits for
+    the prompt that follows its output, and the telnet options asked for by the device are all refused.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.__pending = b""  # Start of a telnet command split across reads
+
+    @classmethod
+    async def open(cls, address: Address, **options) -> CLIChannel:
+        return cls(*await asyncio.open_connection(*address), **options)
+
+    def __filter(self, data: bytes) -> bytes:
+        # Drops the telnet commands from the data, and answers every option request with a refusal
+        data, self.__pending = self.__pending + data, b""
+        text, index = bytearray(), 0
+
+        while index < len(data):
+            if data[index] != IAC:
+                text.append(data[index])
+                index += 1
+                continue
+
+            if index + 1 >= len(data) or (data[index + 1] in (DO, DONT, WILL, WONT) and index + 2 >= len(data)):
+                self.__pending = data[index:]
+                break
+
+            command = data[index + 1]
+            if command == IAC:
+                text.append(IAC)
+                index += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if command in (DO, WILL):
+                    self.writer.write(bytes((IAC, WONT if command == DO else DONT, data[index + 2])))
+                index += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), index)
+                if end < 0:
+                    self.__pending = data[index:]
+                    break
+                index = end + 2
+            else:
+                index += 2
+
+        return bytes(text)
+
+    async def _receive(self) -> bytes:
+        # The next data from the device, without the telnet commands
+        chunk = await self.reader.read(65536)
+        if not chunk:
+            raise ConnectionError("Connection closed by the device")
+
+        return self.__filter(chunk)
+
+    async def read_until(self, *patterns: re.Pattern) -> Tuple[bytes, int]:
+        # Everything up to (and including) the first of the patterns found at the end of the data, and its index
+        data = b""
+        while True:
+            data += await self._receive()
+            for number, pattern in enumerate(patterns):
+                if pattern.search(data[-256:]):
+                    return data, number
+
+    async def login(self, username: str = None, password: str = None) -> None:
+        logins = 0
+        while True:
+            _, found = await self.read_until(PROMPT, LOGIN_PROMPT, PASSWORD_PROMPT)
+            if found == 0:
+                return
+
+            if username is None:
+                raise PermissionError("The device asks for a login, but no credentials were given")
+
+            # Asked for the username again, after the password
+            if found == 1:
+                logins += 1
+                if logins > 1:
+                    raise PermissionError(f"Login as '{username}' rejected by the device")
+
+            self.writer.write(f"{username if found == 1 else password}\r\n".encode())
+
+    async def command(self, command: str) -> List[str]:
+        # The output of the command, without its echo and the prompt that follows
+        self.writer.write(f"{command}\r\n".encode())
+        data, _ = await self.read_until(PROMPT)
+
+        lines = data.decode(errors="replace").replace("\r", "").split("\n")
+        return lines[1:-1]
+
+    async def confirmed_command(self, command: str) -> List[str]:
+        # The output of a command which asks for confirmations, taking the default answer to each of them
+        self.writer.write(f"{command}\r\n".encode())
+        data = b""
+        while True:
+            chunk, found = await self.read_until(PROMPT, CONFIRM_PROMPT)
+            data += chunk
+            if found == 0:
+                break
+            self.writer.write(b"\r\n")
+
+        lines = data.decode(errors="replace").replace("\r", "").split("\n")
+        return lines[1:-1]
+
+    async def send_lines(self, lines: List[str]) -> List[LineError]:
+        # The errors ('% ...') which the device answers the lines with
+        errors = []
+        for index, line in enumerate(lines):
+            output = await self.command(line)
+            errors.extend((index, message.strip()) for message in output if message.startswith("%"))
+
+        return errors
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class PipelinedChannel(CLIChannel):
+    """
+    CLI session which sends the lines in large chunks, without waiting for the prompt of each one. The device
+    answers every line in order, with its echo, any output and a new prompt, so the output is matched back to the
+    lines by counting the prompts as they come in, while the next chunks are being sent.
+
+    At most 'window' lines are sent ahead of the prompts, so the input buffer of the device is never flooded, and
+    the window is topped up every time half of it is answered.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, window: int = 200) -> None:
+        if window < 1:
+            raise ValueError(f"Invalid window '{window}': Must be at least 1 line")
+
+        super().__init__(reader, writer)
+        self.window = window
+        self.__answered = 0
+        self.__progress = asyncio.Event()
+
+    async def __write(self, lines: List[str]) -> None:
+        sent = 0
+        while sent < len(lines):
+            count = min(self.__answered + self.window, len(lines)) - sent
+            if count < min(max(self.window // 2, 1), len(lines) - sent):
+                self.__progress.clear()
+                await self.__progress.wait()
+                continue
+
+            self.writer.write(("\r\n".join(lines[sent:sent + count]) + "\r\n").encode())
+            sent += count
+            await self.writer.drain()
+
+    async def __read(self, count: int) -> List[LineError]:
+        errors, data = [], b""
+        counted = False  # Whether the prompt at the end of the data (with nothing after it yet) is counted already
+        while self.__answered < count:
+            *complete, data = (data + await self._receive()).split(b"\n")
+
+            for line in complete:
+                if PROMPT_LINE.match(line) and not counted:
+                    self.__answered += 1
+                elif line.startswith(b"%"):
+                    errors.append((self.__answered, line.decode(errors="replace").strip()))
+                counted = False
+
+            # The device is waiting for the next lines
+            if not counted and PROMPT.search(data):
+                self.__answered += 1
+                counted = True
+
+            self.__progress.set()
+
+        return errors
+
+    async def send_lines(self, lines: List[str]) -> List[LineError]:
+        self.__answered = 0
+        _, errors = await asyncio.gather(self.__write(lines), self.__read(len(lines)))
+        return errors
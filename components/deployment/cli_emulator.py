@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import urlsplit
+
+from components.devices.network_device import NetworkDevice
+from iptx_utils import NotFoundError, print_log
+
+INVALID_INPUT = "% Invalid input detected at '^' marker."
+COPY_COMMAND = re.compile(r"^copy\s+(http://\S+)\s+(system:)?running-config$")
+LOAD_COMMAND = re.compile(r"^load\s+(http://\S+)$")
+
+
+class EmulatedDevice:
+    def __init__(self, hostname: str) -> None:
+        self.hostname = hostname
+        self.running_config: List[str] = []  # Every configuration line received, in order (with the 'exit' lines)
+        self.saved_config: List[str] = []
+        self.sessions = 0
+        self.commands = 0
+
+        # Faults, for testing the clients
+        self.drop_sessions = 0  # The next sessions are closed right after connecting
+        self.command_delay = 0.0  # Seconds before answering each command
+        self.latency = 0.0  # Seconds before every answer reaches the client, like over a long link (it doesn't
+        # hold up the next commands, unlike the command delay)
+
+
+class CLIEmulator:
+    """
+    Stand-in for the command line of many devices on this machine, over plain TCP (like telnet, but without any
+    option negotiation), with each device listening on its own port of the local address.
+
+    A session logs in (when a username is set), and gets the privileged prompt of the device. It understands
+    'configure terminal', 'end', 'show running-config', 'write memory' and 'terminal length', and every line in
+    the configuration mode is taken as it is, except for the ones that match any of the 'invalid_commands'
+    patterns, which get the usual '% Invalid input' error. Since the emulator doesn't know which commands open a
+    section, 'exit' never leaves the configuration mode (only 'end' does). The running configuration is shown
+    indented by section, like on a real device (see NetworkDevice.running_config).
+
+    Configuration files are merged from an HTTP server with 'copy http://... running-config' (after asking for the
+    destination, like IOS does) or with 'load http://...' in the configuration mode (like IOS-XR), and each line of
+    the file that is rejected is repeated before its error.
+
+    Every line received is echoed back, followed by its output and the prompt, like a real device does.
+    """
+
+    def __init__(self, hostnames: Iterable[str] = (), host: str = "127.0.0.1", base_port: int = 0,
+                 username: str = None, password: str = None, invalid_commands: Iterable[str] = ()) -> None:
+        self.host = host
+        self.base_port = base_port  # 0 lets the system pick a free port for every device
+        self.username = username
+        self.password = password
+        self.invalid_commands = [re.compile(pattern) for pattern in invalid_commands]
+
+        self.__devices: Dict[str, EmulatedDevice] = {hostname: EmulatedDevice(hostname) for hostname in hostnames}
+        self.__servers: Dict[str, asyncio.AbstractServer] = {}
+        self.__sessions: Set[asyncio.Task] = set()
+
+    def device(self, hostname: str) -> EmulatedDevice:
+        try:
+            return self.__devices[hostname]
+        except KeyError:
+            raise NotFoundError(f"Emulated device '{hostname}' not found")
+
+    def add_device(self, hostname: str) -> EmulatedDevice:
+        return self.__devices.setdefault(hostname, EmulatedDevice(hostname))
+
+    # ******************************** SERVERS ********************************
+    async def start(self) -> Dict[str, Tuple[str, int]]:
+        # Hostname -> (address, port) of every device
+        for offset, (hostname, device) in enumerate(self.__devices.items()):
+            if hostname in self.__servers:
+                continue
+
+            port = self.base_port + offset if self.base_port else 0
+            self.__servers[hostname] = await asyncio.start_server(
+                lambda reader, writer, device=device: self.__session(device, reader, writer), self.host, port)
+
+        print_log(f"CLI emulator listening for {len(self.__servers)} devices on {self.host}")
+        return self.addresses()
+
+    def addresses(self) -> Dict[str, Tuple[str, int]]:
+        return {hostname: server.sockets[0].getsockname()[:2] for hostname, server in self.__servers.items()}
+
+    async def stop(self) -> None:
+        for server in self.__servers.values():
+            server.close()
+
+        # The sessions which are still open are dropped
+        for task in self.__sessions:
+            task.cancel()
+        await asyncio.gather(*self.__sessions, return_exceptions=True)
+
+        for server in self.__servers.values():
+            await server.wait_closed()
+
+        self.__servers.clear()
+
+    async def __aenter__(self) -> CLIEmulator:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
+
+    # ******************************** SESSIONS ********************************
+    @staticmethod
+    async def __read_line(reader: asyncio.StreamReader) -> str | None:
+        line = await reader.readline()
+        return line.decode(errors="replace").rstrip("\r\n") if line else None
+
+    async def __login(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        writer.write(b"\r\nUser Access Verification\r\n")
+        for _ in range(3):
+            writer.write(b"\r\nUsername: ")
+            username = await self.__read_line(reader)
+            writer.write(b"Password: ")
+            password = await self.__read_line(reader)
+
+            if username is None or password is None:
+                return False
+            if username == self.username and password == self.password:
+                return True
+
+            writer.write(b"% Login invalid\r\n")
+
+        return False
+
+    def _exec_command(self, device: EmulatedDevice, command: str) -> Tuple[List[str], bool]:
+        # Output of a privileged EXEC command, and whether the configuration mode is entered
+        words = command.split()
+        if not words or words[0] == "terminal":
+            return [], False
+
+        if "configure".startswith(words[0]) and len(words[0]) >= 4:
+            return ["Enter configuration commands, one per line.  End with CNTL/Z."], True
+
+        if words[0] == "show" and len(words) > 1 and "running-config".startswith(words[1]):
+            return ["Building configuration...", "", "Current configuration:", "!"] + \
+                NetworkDevice.running_config(device.running_config) + ["end"], False
+
+        if command in ("write memory", "wr", "copy running-config startup-config"):
+            device.saved_config = list(device.running_config)
+            return ["Building configuration...", "[OK]"], False
+
+        return [INVALID_INPUT], False
+
+    def _config_command(self, device: EmulatedDevice, command: str) -> List[str]:
+        # Output of a line in the configuration mode
+        if command.startswith("do "):
+            return self._exec_command(device, command[3:])[0]
+
+        if any(pattern.search(command) for pattern in self.invalid_commands):
+            return [INVALID_INPUT]
+
+        if command and command != "commit":
+            device.running_config.append(command)
+
+        return []
+
+    @staticmethod
+    async def __fetch(url: str) -> bytes:
+        # The body of an HTTP GET of the URL
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        try:
+            writer.write(f"GET {parts.path or '/'} HTTP/1.0\r\nHost: {parts.netloc}\r\n\r\n".encode())
+            response = await reader.read()
+        finally:
+            writer.close()
+
+        header, _, body = response.partition(b"\r\n\r\n")
+        status = header.split(b" ", 2)[1] if header.count(b" ") >= 2 else b""
+        if status != b"200":
+            raise FileNotFoundError(f"HTTP status {status.decode(errors='replace')}")
+
+        return body
+
+    async def _merge_file(self, device: EmulatedDevice, url: str, loading: bool) -> List[str]:
+        # Output of merging a configuration file, from 'copy' (or 'load', in the configuration mode)
+        output = ["Loading." if loading else f"Accessing {url}..."]
+        start = time.perf_counter()
+        try:
+            body = await self.__fetch(url)
+        except (OSError, ValueError, IndexError):
+            return output + [f"%Error opening {url} (No such file or directory)"]
+
+        for line in body.decode(errors="replace").splitlines():
+            if line.strip() == "end":
+                break
+
+            errors = self._config_command(device, line.strip())
+            if errors:
+                output += [line.strip()] + errors
+
+        elapsed = max(time.perf_counter() - start, 0.001)
+        if loading:
+            return output + [f"{len(body)} bytes parsed in {elapsed:.0f} sec ({len(body) / elapsed:.0f})bytes/sec"]
+
+        return output + [f"[OK - {len(body)} bytes]", "",
+                         f"{len(body)} bytes copied in {elapsed:.3f} secs ({len(body) / elapsed:.0f} bytes/sec)"]
+
+    async def __session(self, device: EmulatedDevice, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter) -> None:
+        device.sessions += 1
+        self.__sessions.add(asyncio.current_task())
+        try:
+            if device.drop_sessions:
+                device.drop_sessions -= 1
+                return
+
+            if self.username is not None and not await self.__login(reader, writer):
+                return
+
+            config_mode = False
+            writer.write(f"\r\n{device.hostname}#".encode())
+
+            while True:
+                command = await self.__read_line(reader)
+                if command is None:
+                    return
+
+                command = command.strip()
+                device.commands += 1
+                if device.command_delay:
+                    await asyncio.sleep(device.command_delay)
+
+                if not config_mode and command in ("exit", "logout", "quit"):
+                    writer.write(f"{command}\r\n".encode())
+                    return
+
+                echo = command
+                if not config_mode and COPY_COMMAND.match(command):
+                    # The destination is asked for, and the answer is the echo of the rest
+                    writer.write(f"{command}\r\nDestination filename [running-config]? ".encode())
+                    echo = await self.__read_line(reader)
+                    if echo is None:
+                        return
+                    output = await self._merge_file(device, COPY_COMMAND.match(command).group(1), False)
+                elif config_mode and LOAD_COMMAND.match(command):
+                    output = await self._merge_file(device, LOAD_COMMAND.match(command).group(1), True)
+                elif config_mode and command in ("end", "\x1a"):
+                    output, config_mode = [], False
+                elif config_mode:
+                    output = self._config_command(device, command)
+                else:
+                    output, config_mode = self._exec_command(device, command)
+
+                prompt = f"{device.hostname}(config)#" if config_mode else f"{device.hostname}#"
+                answer = "\r\n".join([echo] + output + [prompt]).encode()
+                if device.latency:
+                    asyncio.get_running_loop().call_later(device.latency, writer.write, answer)
+                else:
+                    writer.write(answer)
+                    await writer.drain()
+
+        # Closed by the client, or dropped by stop() (the task ends normally, since the server can't take a
+        # cancelled one)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+        finally:
+            self.__sessions.discard(asyncio.current_task())
+            writer.close()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import bisect
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+
+from components.deployment.file_transfer import staged_filename
+from components.devices.network_device import NetworkDevice
+from iptx_utils import NotFoundError, print_error, print_log
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+
+
+class PrefixIndex:
+    # Sorted keys (lowercase), for finding every key that starts with a prefix by bisection
+    def __init__(self, entries: List[Tuple[str, str]]) -> None:
+        self.__entries = sorted((key.lower(), value) for key, value in entries)
+        self.__keys = [key for key, _ in self.__entries]
+
+    def search(self, prefix: str, limit: int = None) -> List[str]:
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.__keys, prefix)
+        end = bisect.bisect_left(self.__keys, prefix + "\uffff", start)
+        if limit is not None:
+            end = min(end, start + limit)
+
+        return [value for _, value in self.__entries[start:end]]
+
+
+class ConfigExplorer:
+    """
+    Shows the configuration scripts of the devices of a topology, one device at a time, rendering each script the
+    first time its device is asked for, instead of every script up front.
+
+    Showing a device takes its pending commands (like generate_script always does), so a script can't be rendered
+    again: the 'cache_size' most recently rendered scripts are kept in memory, and the older ones are spilled to a
+    temporary directory, from where they are loaded back when asked for again.
+
+    Once a device is shown, its neighbors (the devices at the other end of its links) are previewed in the
+    background while there is room in the cache, since they are the likeliest to be asked for next. A preview
+    (see NetworkDevice.preview_script) leaves the pending commands in place, so a device the user never asks for
+    keeps them, and it's replaced by the real script the first time the device is shown.
+
+    Devices are found by their ID or hostname, or by a prefix of either, through a sorted index.
+    """
+
+    def __init__(self, topology: Topology, cache_size: int = 32, warm_neighbors: bool = True) -> None:
+        if cache_size < 1:
+            raise ValueError(f"Invalid cache size '{cache_size}': Must be at least 1")
+
+        self.topology = topology
+        self.cache_size = cache_size
+        self.warm_neighbors = warm_neighbors
+
+        devices = topology.get_all_devices()
+        self.__devices = {str(device.id()): device for device in devices}  # (The switches may have numeric IDs)
+        self.__ids = PrefixIndex([(str(device.id()), str(device.id())) for device in devices])
+        self.__hostnames = PrefixIndex([(device.hostname, str(device.id())) for device in devices])
+
+        self.__cache: OrderedDict[str, List[str]] = OrderedDict()  # Device ID -> script, least recent first
+        self.__spilled: Set[str] = set()
+        self.__directory: str | None = None
+        self.__rendering: Dict[str, Future] = {}  # Previews in the background
+        self.__taking: Dict[str, Future] = {}  # Scripts being rendered for the user
+        self.__taken: Set[str] = set()  # Devices whose cached script is the real one, not a preview
+        self.__lock = threading.RLock()
+        self.__executor = ThreadPoolExecutor(1, thread_name_prefix="config-explorer")
+
+        self.renders = 0
+        self.hits = 0
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        if self.__directory is not None:
+            shutil.rmtree(self.__directory, ignore_errors=True)
+            self.__directory = None
+
+    def __enter__(self) -> ConfigExplorer:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    # ******************************** SEARCH ********************************
+    def find(self, text: str, limit: int = 20) -> List[str]:
+        # IDs of the devices whose ID or hostname is the text, or else starts with it
+        text = text.strip()
+        if text in self.__devices:
+            return [text]
+
+        exact = [device_id for device_id in self.__hostnames.search(text) if
+                 self.__devices[device_id].hostname.lower() == text.lower()]
+        if exact:
+            return exact[:limit]
+
+        matches = list(dict.fromkeys(self.__ids.search(text, limit) + self.__hostnames.search(text, limit)))
+        return matches[:limit]
+
+    # ******************************** RENDERING ********************************
+    def __render(self, device_id: str, take: bool) -> List[str]:
+        try:
+            # Stored before the device is let go, and a preview never replaces the real script of the device
+            with self.topology._lock_devices(device_id):
+                device = self.__devices[device_id]
+                script = device.generate_script() if take else device.preview_script()
+
+                with self.__lock:
+                    if take or device_id not in self.__taken:
+                        self.renders += 1
+                        self.__store(device_id, script)
+                    if take:
+                        self.__taken.add(device_id)
+
+            return script
+
+        finally:
+            with self.__lock:
+                (self.__taking if take else self.__rendering).pop(device_id, None)
+
+    def __store(self, device_id: str, script: List[str]) -> None:
+        # The script becomes the most recent one, and the least recent ones go to the disk
+        self.__cache[device_id] = script
+        self.__cache.move_to_end(device_id)
+
+        while len(self.__cache) > self.cache_size:
+            old_id, old_script = self.__cache.popitem(last=False)
+            if self.__directory is None:
+                self.__directory = tempfile.mkdtemp(prefix="iptx-explorer-")
+
+            with open(os.path.join(self.__directory, staged_filename(old_id)), "w") as file:
+                file.write("\n".join(old_script))
+            self.__spilled.add(old_id)
+
+    def __cached(self, device_id: str) -> List[str] | None:
+        # With the lock held
+        if device_id in self.__cache:
+            self.__cache.move_to_end(device_id)
+            return self.__cache[device_id]
+
+        if device_id in self.__spilled:
+            with open(os.path.join(self.__directory, staged_filename(device_id))) as file:
+                script = file.read().split("\n")
+            self.__spilled.discard(device_id)
+            self.__store(device_id, script)
+            return script
+
+        return None
+
+    def __future(self, device_id: str) -> Future:
+        # The preview of the device, started in the background unless it already is
+        with self.__lock:
+            if device_id not in self.__rendering:
+                self.__rendering[device_id] = self.__executor.submit(self.__render, device_id, False)
+            return self.__rendering[device_id]
+
+    def script(self, device_id: str) -> List[str]:
+        # The script of the device, rendered (and its pending commands taken) the first time it's asked for
+        device_id = str(device_id)
+        if device_id not in self.__devices:
+            raise NotFoundError(f"ERROR: Device ID '{device_id}' not found in the topology")
+
+        with self.__lock:
+            if device_id in self.__taken:
+                self.hits += 1
+                return self.__cached(device_id)
+
+            # Rendered right here, unless another thread already is (a device is never rendered twice, since the
+            # second render would only have the commands added since the first one)
+            future = self.__taking.get(device_id)
+            render_here = future is None
+            if render_here:
+                future = self.__taking[device_id] = Future()
+                future.set_running_or_notify_cancel()
+
+        if render_here:
+            try:
+                future.set_result(self.__render(device_id, True))
+            except BaseException as error:
+                future.set_exception(error)
+
+        return future.result()
+
+    def neighbors(self, device_id: str) -> List[str]:
+        # IDs of the devices of the topology linked to the device
+        neighbor_ids = []
+        for interface in self.__devices[device_id].all_phys_interfaces():
+            remote = interface.remote_device
+            if remote is not None and str(remote.id()) in self.__devices:
+                neighbor_ids.append(str(remote.id()))
+
+        return list(dict.fromkeys(neighbor_ids))
+
+    def warm(self, device_ids: List[str]) -> None:
+        # Previews the devices in the background, as long as the cache has room for them
+        with self.__lock:
+            room = self.cache_size - len(self.__cache) - len(self.__rendering)
+            wanted = [device_id for device_id in device_ids if device_id not in self.__cache and
+                      device_id not in self.__spilled and device_id not in self.__rendering and
+                      device_id not in self.__taking]
+
+        for device_id in wanted[:max(room, 0)]:
+            self.__future(device_id)
+
+    def show(self, device_id: str, copy_to_clipboard: bool = False) -> List[str]:
+        script = self.script(device_id)
+        NetworkDevice.print_script(script)
+        print()
+        if copy_to_clipboard:
+            NetworkDevice.copy_script(script)
+
+        if self.warm_neighbors:
+            self.warm(self.neighbors(device_id))
+
+        return script
+
+    # ******************************** PROMPT ********************************
+    def explore(self, copy_to_clipboard: bool = True) -> None:
+        print('\n')
+        print("Enter device ID or hostname (or the start of either) to show configurations...")
+        prompt = input("> ")
+        while prompt != "exit":
+            matches = self.find(prompt) if prompt.strip() else []
+            if len(matches) == 1:
+                self.show(matches[0], copy_to_clipboard)
+
+            elif matches:
+                print_log(f"Devices matching '{prompt.strip()}':")
+                for device_id in matches:
+                    print(f"    {device_id} ({self.__devices[device_id].hostname})")
+                print()
+
+            elif prompt.strip():
+                print_error(f"Invalid Device ID '{prompt}'")
+
+            prompt = input("> ")
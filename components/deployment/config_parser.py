@@ -0,0 +1,688 @@
+from __future__ import annotations
+
+import ipaddress
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from tabulate import tabulate
+
+from components.devices.network_device import NetworkDevice
+from components.devices.router.router import Router
+from components.devices.router.virtual_route_forwarding import VRF
+from components.devices.router.xr_router import XRRouter
+from components.interfaces.loopback.loopback import Loopback
+from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
+from components.interfaces.physical_interfaces.router_interface import RouterInterface
+from components.interfaces.physical_interfaces.subinterface import SubInterface
+from iptx_utils import DeviceError, NetworkError, NotFoundError, print_success, print_warning, split_port_name
+
+CHUNK_SIZE = 64  # Configuration files parsed by a worker at a time
+
+# Interface names which IOS-XR shortens in its configuration
+INTERFACE_ALIASES = {"TenGigE": "TenGigabitEthernet", "GigE": "GigabitEthernet"}
+
+# The lines of a configuration which are never part of a section, whatever the indentation
+CLOSERS = {"exit", *NetworkDevice.section_closers}
+
+
+class ParsedInterface:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.address: str | None = None  # 'x.x.x.x/y.y.y.y'
+        self.description: str | None = None
+        self.shutdown = False  # The running configuration only shows 'shutdown' on the interfaces that are down
+        self.bandwidth: int | None = None
+        self.mtu: int | None = None
+        self.duplex: str | None = None
+        self.vrf: str | None = None
+        self.vlan: int | None = None  # 'encapsulation dot1q' of a sub-interface
+        self.xconnects: Set[str] = set()  # Neighbors of the pseudo-wires
+        self.service_instances: Set[int] = set()
+
+        # OSPF
+        self.ospf_process: int | None = None
+        self.ospf_area: int | None = None
+        self.ospf_p2p: bool | None = None
+        self.ospf_priority: int | None = None
+        self.ospf_passive: bool | None = None
+        self.mpls = False
+
+
+class ParsedVRF:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.rd: str | None = None  # 'AS:number'
+        self.imports: Set[str] = set()
+        self.exports: Set[str] = set()
+
+
+class ParsedConfig:
+    """
+    What a running configuration says about a router, in plain values, before any object of the model is built
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.lines = 0
+        self.xr = False
+        self.hostname: str | None = None
+        self.interfaces: Dict[str, ParsedInterface] = {}
+        self.vrfs: Dict[str, ParsedVRF] = {}
+
+        # OSPF
+        self.ospf_process: int | None = None
+        self.ospf_router_id: str | None = None
+        self.reference_bw: int | None = None
+        self.passive_default = False
+        self.passive_interfaces: Dict[str, bool] = {}  # 'passive-interface' (True) or 'no passive-interface'
+        self.ospf_networks: List[Tuple[int, int, int]] = []  # (network, wildcard, area)
+        self.ldp_autoconfig = False
+        self.ldp_sync = False
+        self.mpls = False
+
+        # BGP
+        self.as_number: int | None = None
+        self.bgp_router_id: str | None = None
+        self.cluster_id: str | None = None
+        self.neighbors: Dict[str, Dict[str, str | int | bool]] = {}  # IP -> 'remote-as', 'group', 'rr-client'
+        self.neighbor_groups: Dict[str, Dict[str, int | bool]] = {}
+        self.bgp_vrfs: Set[str] = set()  # The VRFs routed to the clients over BGP
+
+        # Static default routes, and the pseudo-wires of IOS-XR
+        self.static_next_hops: Set[str] = set()
+        self.xc_group_name: str | None = None
+        self.xc_p2p_identifier: str | None = None
+
+    def interface(self, name: str) -> ParsedInterface:
+        name = normalized_name(name)
+        if name not in self.interfaces:
+            self.interfaces[name] = ParsedInterface(name)
+
+        return self.interfaces[name]
+
+    def vrf(self, name: str) -> ParsedVRF:
+        return self.vrfs.setdefault(name, ParsedVRF(name))
+
+
+def normalized_name(name: str) -> str:
+    for alias, int_type in INTERFACE_ALIASES.items():
+        if name.startswith(alias) and name[len(alias):len(alias) + 1].isdigit():
+            return int_type + name[len(alias):]
+
+    return name
+
+
+def config_lines(path: str) -> Iterator[str]:
+    # The lines of the file, read through a memory map, so only the pages being parsed are ever in memory
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode(errors="replace").rstrip("\r\n")
+
+
+class RunningConfigParser:
+    """
+    Streaming parser of the running configuration of an IOS or IOS-XR router, one line at a time, which keeps
+    nothing but the values it's after (see ParsedConfig) and the sections which are open at the current line.
+
+    The sections are followed by the indentation of a 'show running-config', or, for the configurations without
+    any (e.g. the scripts rendered by the model), by the lines which open and close them, the same way as
+    NetworkDevice.script_sections(). The lines that are not understood are skipped.
+    """
+
+    def __init__(self, source: str = "") -> None:
+        self.config = ParsedConfig(source)
+        self.__sections: List[str] = []  # The lines which opened the sections of the current line, the outermost first
+        self.__indents: List[int] = []  # And their indentation
+        self.__indented: bool | None = None  # Unknown until the first line in a section
+        self.__ended = False
+        self.__xconnect_interface: str | None = None  # Last interface of the cross-connect being parsed
+        self.__interface: Tuple[str, ParsedInterface] | None = None  # The section of the interface being parsed
+
+    # ******************************** SECTIONS ********************************
+    @staticmethod
+    def __opens_section(line: str, sections: List[str]) -> bool:
+        # The same rules as NetworkDevice.script_sections(), for the lines of a flat configuration
+        if line[:3] == "vrf":
+            return not sections or not sections[-1].startswith("interface")
+
+        if any(pattern.search(line) for pattern in NetworkDevice.section_patterns):
+            return True
+
+        return line[:8] == "neighbor" and not any(option in line for option in NetworkDevice.neighbor_options)
+
+    def feed(self, raw_line: str) -> None:
+        line = raw_line.strip()
+        if self.__ended or not line or line[0] == "!":
+            if line.startswith("!!") and "IOS XR" in line:
+                self.config.xr = True
+            return
+
+        if line == "end" and raw_line[0] != " ":
+            self.__ended = True
+            return
+
+        self.config.lines += 1
+        indent = len(raw_line) - len(raw_line.lstrip())
+        if self.__indented is None and self.__sections:
+            self.__indented = indent > 0
+
+        if line in CLOSERS:
+            if not self.__indented and self.__sections:
+                self.__sections.pop()
+                self.__indents.pop()
+            return
+
+        if self.__indented:
+            while self.__indents and self.__indents[-1] >= indent:
+                self.__sections.pop()
+                self.__indents.pop()
+
+        self.__handle(line, line.split(), self.__sections)
+
+        if self.__indented or self.__opens_section(line, self.__sections):
+            self.__sections.append(line)
+            self.__indents.append(indent)
+
+    def parse(self, lines: Iterable[str]) -> ParsedConfig:
+        for line in lines:
+            self.feed(line)
+
+        return self.config
+
+    # ******************************** LINES ********************************
+    def __handle(self, line: str, words: List[str], path: List[str]) -> None:
+        if not path:
+            self.__global_line(line, words)
+        elif path[0].startswith("interface"):
+            if self.__interface is None or self.__interface[0] is not path[0]:
+                self.__interface = (path[0], self.config.interface(path[0].split()[1]))
+            self.__interface_line(self.__interface[1], words, path)
+        elif path[0].startswith("router ospf"):
+            self.__ospf_line(words, path)
+        elif path[0].startswith("router bgp"):
+            self.__bgp_line(words, path)
+        elif path[0].startswith("router static"):
+            if len(words) >= 2 and words[0].count(".") == 3:
+                self.config.static_next_hops.add(words[-1])
+        elif path[0].startswith(("vrf", "ip vrf")):
+            self.__vrf_line(self.config.vrf(path[0].split()[-1]), line, words, path)
+        elif path[0] == "mpls ldp":
+            if words[0] == "interface":
+                self.config.interface(words[1]).mpls = True
+            self.config.mpls = True
+        elif path[0] == "l2vpn":
+            self.__l2vpn_line(words, path)
+
+    def __global_line(self, line: str, words: List[str]) -> None:
+        config = self.config
+        if words[0] == "hostname" and len(words) > 1:
+            config.hostname = words[1]
+        elif words[0] == "interface" and len(words) > 1:
+            config.interface(words[1])
+            if "l2transport" in words[2:] or words[1].count("/") == 3:
+                config.xr = True
+        elif line.startswith("router ospf "):
+            config.ospf_process = int(words[2])
+        elif line.startswith("router bgp "):
+            config.as_number = int(words[2])
+        elif line.startswith("vrf definition ") or line.startswith("ip vrf "):
+            config.vrf(words[-1])
+        elif words[0] == "vrf" and len(words) == 2:
+            config.vrf(words[1])
+        elif line.startswith("mpls ldp") or line.startswith("mpls label protocol"):
+            config.mpls = True
+        elif line.startswith("ip route ") and len(words) > 2:
+            route = words[4:] if words[2] == "vrf" else words[2:]
+            if route[:2] == ["0.0.0.0", "0.0.0.0"] and len(route) > 2 and route[2].count(".") == 3:
+                config.static_next_hops.add(route[2])
+        elif line.startswith("route-policy "):
+            config.xr = True
+
+    def __interface_line(self, interface: ParsedInterface, words: List[str], path: List[str]) -> None:
+        # In a service instance of the interface
+        if len(path) > 1:
+            if path[1].startswith("service instance ") and words[0] == "xconnect":
+                interface.service_instances.add(int(path[1].split()[2]))
+            return
+
+        keyword, count = words[0], len(words)
+        if keyword in ("ip", "ipv4") and count > 2 and words[1] == "address" and "secondary" not in words:
+            interface.address = words[2] if "/" in words[2] else f"{words[2]}/{words[3]}"
+            self.config.xr = self.config.xr or keyword == "ipv4"
+        elif keyword == "description" and count > 1:
+            interface.description = " ".join(words[1:]).strip("\"")
+        elif keyword == "shutdown":
+            interface.shutdown = True
+        elif words[:2] == ["no", "shutdown"]:
+            interface.shutdown = False
+        elif keyword in ("bandwidth", "mtu") and count > 1 and words[1].isdigit():
+            setattr(interface, keyword, int(words[1]))
+        elif keyword == "duplex" and count > 1:
+            interface.duplex = words[1]
+        elif keyword == "vrf" and count > 1:
+            interface.vrf = words[-1]
+        elif words[:2] == ["ip", "vrf"] and count > 3:
+            interface.vrf = words[3]
+        elif keyword == "encapsulation" and count > 2 and words[1] == "dot1q":
+            interface.vlan = int(words[2])
+        elif keyword == "xconnect" and count > 1:
+            interface.xconnects.add(words[1])
+        elif words[:2] == ["mpls", "ip"]:
+            interface.mpls = True
+        elif words[:2] == ["ip", "ospf"] and count > 2:
+            self.__ospf_interface_line(interface, words[2:])
+        elif keyword == "service" and count > 2:
+            interface.service_instances.add(int(words[2]))
+
+    @staticmethod
+    def __ospf_interface_line(interface: ParsedInterface, words: List[str]) -> None:
+        # 'ip ospf ...' of IOS, or the lines of an interface in an OSPF area of IOS-XR
+        if len(words) > 2 and words[0].isdigit() and words[1] == "area":
+            interface.ospf_process, interface.ospf_area = int(words[0]), int(words[2])
+        elif words[0] == "network" and len(words) > 1:
+            interface.ospf_p2p = words[1] == "point-to-point"
+        elif words[0] == "priority" and len(words) > 1:
+            interface.ospf_priority = int(words[1])
+        elif words[0] == "passive":
+            interface.ospf_passive = words[1:] != ["disable"]
+
+    def __ospf_line(self, words: List[str], path: List[str]) -> None:
+        config = self.config
+        line = " ".join(words)
+
+        # IOS-XR: 'area N', then its interfaces
+        if len(path) > 1 and path[1].startswith("area "):
+            area = int(path[1].split()[1])
+            if len(path) == 2 and words[0] == "interface":
+                interface = config.interface(words[1])
+                interface.ospf_process, interface.ospf_area = config.ospf_process, area
+            elif len(path) == 3 and path[2].startswith("interface "):
+                interface = config.interface(path[2].split()[1])
+                if line == "mpls ldp sync":
+                    config.ldp_sync = True
+                else:
+                    self.__ospf_interface_line(interface, words)
+            return
+
+        if words[0] == "router-id" and len(words) > 1:
+            config.ospf_router_id = words[1]
+        elif line.startswith("auto-cost reference-bandwidth ") and len(words) > 2:
+            config.reference_bw = int(words[2])
+        elif line == "passive-interface default":
+            config.passive_default = True
+        elif words[0] == "passive-interface" and len(words) > 1:
+            config.passive_interfaces[normalized_name("".join(words[1:]))] = True
+        elif words[:2] == ["no", "passive-interface"] and len(words) > 2:
+            config.passive_interfaces[normalized_name("".join(words[2:]))] = False
+        elif line.startswith("mpls ldp auto"):
+            config.ldp_autoconfig = True
+        elif line == "mpls ldp sync":
+            config.ldp_sync = True
+        elif words[0] == "network" and len(words) > 4 and words[3] == "area":
+            network, wildcard = int(ipaddress.IPv4Address(words[1])), int(ipaddress.IPv4Address(words[2]))
+            config.ospf_networks.append((network, wildcard, int(words[4])))
+
+    def __bgp_line(self, words: List[str], path: List[str]) -> None:
+        config = self.config
+        count = len(words)
+
+        # IOS-XR: 'neighbor-group NAME', 'neighbor IP' and 'vrf NAME', each with its own section
+        if len(path) > 1 and path[1].startswith("neighbor-group "):
+            group = config.neighbor_groups.setdefault(path[1].split()[1], {})
+            if words[0] == "remote-as" and count > 1:
+                group["remote-as"] = int(words[1])
+            elif words[0] == "route-reflector-client":
+                group["rr-client"] = True
+            return
+
+        if len(path) > 1 and path[1].startswith("neighbor "):
+            neighbor = config.neighbors.setdefault(path[1].split()[1], {})
+            if words[0] == "remote-as" and count > 1:
+                neighbor["remote-as"] = int(words[1])
+            elif words[:2] == ["use", "neighbor-group"] and count > 2:
+                neighbor["group"] = words[2]
+            elif words[0] == "route-reflector-client":
+                neighbor["rr-client"] = True
+            return
+
+        if len(path) > 1 and path[1].startswith("vrf "):
+            vrf_name = path[1].split()[1]
+            config.bgp_vrfs.add(vrf_name)
+            if words[0] == "rd" and count > 1:
+                config.vrf(vrf_name).rd = words[1]
+            return
+
+        # IOS: 'address-family ipv4 vrf NAME' holds the neighbors of the clients in the VRF
+        if len(path) > 1 and path[1].startswith("address-family ipv4 vrf "):
+            config.bgp_vrfs.add(path[1].split()[3])
+            return
+
+        if words[0] == "bgp" and count > 2 and words[1] == "router-id":
+            config.bgp_router_id = words[2]
+        elif words[0] == "bgp" and count > 2 and words[1] == "cluster-id":
+            config.cluster_id = words[2]
+        elif words[0] == "address-family" and count > 3 and words[2] == "vrf":
+            config.bgp_vrfs.add(words[3])
+        elif words[0] == "vrf" and count > 1:
+            config.bgp_vrfs.add(words[1])
+        elif words[0] == "neighbor" and count > 2:
+            neighbor = config.neighbors.setdefault(words[1], {})
+            if words[2] == "remote-as" and count > 3:
+                neighbor["remote-as"] = int(words[3])
+            elif words[2] == "route-reflector-client":
+                neighbor["rr-client"] = True
+
+    @staticmethod
+    def __vrf_line(vrf: ParsedVRF, line: str, words: List[str], path: List[str]) -> None:
+        if words[0] == "rd" and len(words) > 1:
+            vrf.rd = words[1]
+
+        # IOS: 'route-target import|export|both AS:N'
+        elif words[0] == "route-target" and len(words) > 2:
+            if words[1] in ("import", "both"):
+                vrf.imports.add(words[2])
+            if words[1] in ("export", "both"):
+                vrf.exports.add(words[2])
+
+        # IOS-XR: 'import route-target AS:N', or 'import route-target' with the route-targets in its section
+        elif words[0] in ("import", "export") and line.startswith(f"{words[0]} route-target") and len(words) > 2:
+            (vrf.imports if words[0] == "import" else vrf.exports).add(words[2])
+        elif path[-1] in ("import route-target", "export route-target") and ":" in words[0]:
+            (vrf.imports if path[-1].startswith("import") else vrf.exports).add(words[0])
+
+    def __l2vpn_line(self, words: List[str], path: List[str]) -> None:
+        config = self.config
+        config.xr = True
+
+        if words[:2] == ["xconnect", "group"] and len(words) > 2:
+            config.xc_group_name = words[2]
+        elif words[0] == "p2p" and len(words) > 1:
+            config.xc_p2p_identifier = words[1]
+            self.__xconnect_interface = None
+        elif words[0] == "interface" and len(words) > 1:
+            self.__xconnect_interface = words[1]
+
+        # The neighbors of a point-to-point cross-connect are either in the section of its interface, or next to it
+        elif words[:2] == ["neighbor", "ipv4"] and len(words) > 2 and self.__xconnect_interface is not None:
+            config.interface(self.__xconnect_interface).xconnects.add(words[2])
+
+
+# ******************************** MODEL ********************************
+def _settle(obj: Router | Loopback | RouterInterface | SubInterface) -> None:
+    # The imported configuration is already on the device, so there's nothing pending to be rendered for it
+    obj._restore_pending_commands({kind: {attr: [] for attr in commands}
+                                   for kind, commands in obj._pending_commands().items()})
+
+
+def _in_subnet(address: str, cidr: str | None) -> bool:
+    return cidr is not None and ipaddress.IPv4Address(address) in ipaddress.IPv4Interface(cidr).network
+
+
+def _route_target(value: str, as_number: int) -> int | None:
+    # Only the route-targets of the AS of the VRF can be told by their number in the model
+    as_part, _, number = value.partition(":")
+    return int(number) if as_part == str(as_number) and number.isdigit() else None
+
+
+def router_id(config: ParsedConfig) -> str:
+    loopback = config.interfaces.get("Loopback0")
+    for candidate in (config.ospf_router_id, config.bgp_router_id,
+                      loopback.address.split("/")[0] if loopback is not None and loopback.address else None):
+        if candidate:
+            return candidate
+
+    raise DeviceError(f"ERROR in {config.source}: No router ID (OSPF or BGP router-id, or the address of "
+                      f"Loopback0) in the configuration")
+
+
+def build_router(config: ParsedConfig) -> Router:
+    """
+    The router (an XRRouter for an IOS-XR configuration) that the parsed configuration describes, with its
+    interfaces, sub-interfaces, loopbacks, OSPF, MPLS, BGP and VRFs. Since all of it is already configured on the
+    device, nothing is pending for the next script, and the interfaces are left unconnected (the links between the
+    routers aren't part of their configurations).
+    """
+    hostname = config.hostname or "Router"
+    device = (XRRouter if config.xr else Router)(router_id=router_id(config), hostname=hostname, interfaces=[])
+
+    sub_interfaces = []
+    for name, parsed in config.interfaces.items():
+        if "." in name:
+            sub_interfaces.append(parsed)
+            continue
+
+        try:
+            int_type, port = split_port_name(longname=name)
+        except ValueError:
+            continue
+
+        if int_type == "Loopback":
+            if int(port) == 0:
+                interface = device.loopback(0)
+                interface.ip_address, interface.subnet_mask = Loopback.get_ip_and_subnet(parsed.address)
+            else:
+                interface = Loopback(cidr=parsed.address, loopback_id=int(port))
+                device.add_interface(interface)
+            interface.description = parsed.description or ""
+
+        elif int_type in PhysicalInterface.BANDWIDTHS:
+            interface = RouterInterface(int_type, port, parsed.address)
+            device.add_interface(interface)
+            _import_phys_interface(interface, parsed, config)
+
+        else:
+            continue
+
+        _import_ospf(interface, parsed, config)
+
+    for parsed in sub_interfaces:
+        name, vlan_id = parsed.name.rsplit(".", 1)
+        try:
+            int_type, port = split_port_name(longname=name)
+        except ValueError:
+            continue
+
+        if int_type not in PhysicalInterface.BANDWIDTHS:
+            continue
+
+        try:
+            interface = device.interface(port)
+        except NotFoundError:
+            interface = RouterInterface(int_type, port)
+            device.add_interface(interface)
+
+        sub_interface = SubInterface(int_type, port, parsed.vlan or int(vlan_id), parsed.address,
+                                     parsed.mtu or interface.mtu)
+        sub_interface.xr_mode = interface.xr_mode
+        sub_interface.device_id = device.id()
+        sub_interface.description = parsed.description or ""
+        sub_interface.neighbor_ids = set(parsed.xconnects)
+        sub_interface.pw_redundancy_configured = interface.xr_mode
+        _settle(sub_interface)
+        interface.sub_interfaces.add(sub_interface)
+
+    for interface in device.all_interfaces():
+        _settle(interface)
+
+    # Routing
+    device.OSPF_PROCESS_ID = config.ospf_process or device.OSPF_PROCESS_ID
+    device.reference_bw = config.reference_bw or device.reference_bw
+    device._ospf_configured = config.ospf_process is not None
+    device._mpls_ldp_sync = config.ldp_sync
+    device._mpls_configured = config.mpls or device._any_mpls_interfaces()
+
+    if config.as_number is not None:
+        _import_bgp(device, config)
+
+    if isinstance(device, XRRouter):
+        device.xc_group_name = config.xc_group_name or device.xc_group_name
+        device.xc_p2p_identifier = config.xc_p2p_identifier or device.xc_p2p_identifier
+
+    # The hostname is set as it is (route-reflectors already have their suffix)
+    device.hostname = hostname
+    _settle(device)
+
+    return device
+
+
+def _import_phys_interface(interface: RouterInterface, parsed: ParsedInterface, config: ParsedConfig) -> None:
+    interface.description = parsed.description if parsed.description is not None else interface.description
+    interface.shutdown_state = parsed.shutdown
+    interface.bandwidth = parsed.bandwidth or interface.bandwidth
+    interface.mtu = parsed.mtu or interface.mtu
+    interface.duplex = parsed.duplex or interface.duplex
+    interface.mpls_enabled = parsed.mpls
+
+    # The interfaces in a VRF are the ones towards the clients
+    if parsed.vrf is not None:
+        interface.vrf_name = parsed.vrf
+        interface.egp = True
+        interface.ebgp_neighbor_confirmed = parsed.vrf in config.bgp_vrfs
+        interface.static_routing = any(_in_subnet(next_hop, parsed.address) for next_hop in config.static_next_hops)
+
+    if parsed.service_instances:
+        interface.use_service_instance = True
+        interface.vlans_in_service_instance = set(parsed.service_instances)
+
+
+def _import_ospf(interface: RouterInterface | Loopback, parsed: ParsedInterface, config: ParsedConfig) -> None:
+    area = parsed.ospf_area
+    if area is None and parsed.address is not None:
+        address = int(ipaddress.IPv4Address(parsed.address.split("/")[0]))
+        area = next((area for network, wildcard, area in config.ospf_networks
+                     if address & ~wildcard == network & ~wildcard), None)
+
+    if area is None or config.ospf_process is None:
+        return
+
+    interface.ospf_area = area
+    passive = parsed.ospf_passive
+    if passive is None:
+        passive = config.passive_interfaces.get(parsed.name, config.passive_default)
+    interface.ospf_allow_hellos = not passive
+
+    if isinstance(interface, RouterInterface):
+        interface.ospf_process_id = parsed.ospf_process or config.ospf_process
+        interface.ospf_p2p = parsed.ospf_p2p if parsed.ospf_p2p is not None else False
+        interface.ospf_priority = parsed.ospf_priority if parsed.ospf_priority is not None else 1
+
+        # LDP on every OSPF interface
+        if config.ldp_autoconfig and not passive and parsed.vrf is None:
+            interface.mpls_enabled = True
+
+
+def _import_bgp(device: Router, config: ParsedConfig) -> None:
+    device.as_number = config.as_number
+    device.rr_cluster_id = config.cluster_id if config.cluster_id != device.id() else None
+
+    for address, neighbor in config.neighbors.items():
+        group = config.neighbor_groups.get(neighbor.get("group"), {})
+        if neighbor.get("remote-as", group.get("remote-as")) == config.as_number:
+            device.ibgp_adjacent_router_ids.add(address)
+            if neighbor.get("rr-client") or group.get("rr-client"):
+                device.route_reflector = True
+
+    for parsed in config.vrfs.values():
+        as_part, _, number = (parsed.rd or "").partition(":")
+        if not (as_part.isdigit() and number.isdigit()):
+            continue
+
+        vrf = VRF(int(number), parsed.name, int(as_part))
+        vrf.route_targets = {target for target in (_route_target(value, vrf.as_number) for value in parsed.imports)
+                             if target is not None and target != vrf.rd}
+        vrf.export_targets = {target for target in (_route_target(value, vrf.as_number) for value in parsed.exports)
+                              if target is not None and target != vrf.rd}
+        vrf.clear_setup_cmd()
+
+        device.vrfs.add(vrf)
+        vrf.assigned_routers.add(device)
+
+
+# ******************************** IMPORT ********************************
+def parse_config(path: str) -> ParsedConfig:
+    return RunningConfigParser(path).parse(config_lines(path))
+
+
+def load_router(path: str) -> Router:
+    return build_router(parse_config(path))
+
+
+def _load_chunk(paths: List[str]) -> List[Tuple[Router | None, int, str | None]]:
+    # (router, lines parsed, error) of each file, in the worker
+    results = []
+    for path in paths:
+        try:
+            config = parse_config(path)
+            results.append((build_router(config), config.lines, None))
+        except (OSError, ValueError, TypeError, IndexError, DeviceError, NetworkError) as error:
+            results.append((None, 0, f"{type(error).__name__}: {error}"))
+
+    return results
+
+
+class ConfigImport:
+    def __init__(self) -> None:
+        self.routers: List[Router] = []
+        self.failures: Dict[str, str] = {}  # Path -> why it couldn't be imported
+        self.lines = 0
+        self.elapsed = 0.0
+
+
+def import_configs(paths: Iterable[str] | str, processes: int = None) -> ConfigImport:
+    """
+    Imports the running configurations of many routers (the files, or every file in a directory) as routers of
+    the model. The files are parsed in chunks over a process pool, each of them streamed from a memory map, so
+    the memory taken doesn't grow with the size of the files, only with the routers built out of them.
+
+    A configuration which can't be parsed, or whose router ID is already taken by another one, is left out and
+    reported in the failures.
+    """
+    if isinstance(paths, str):
+        paths = sorted(os.path.join(paths, name) for name in os.listdir(paths)
+                       if os.path.isfile(os.path.join(paths, name)))
+    paths = list(paths)
+
+    result = ConfigImport()
+    start = time.perf_counter()
+
+    chunks = [paths[index:index + CHUNK_SIZE] for index in range(0, len(paths), CHUNK_SIZE)]
+    if processes == 1 or len(chunks) <= 1:
+        loaded = [item for chunk in chunks for item in _load_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            loaded = [item for items in executor.map(_load_chunk, chunks) for item in items]
+
+    router_ids = set()
+    for path, (router, lines, error) in zip(paths, loaded):
+        if router is not None and router.id() in router_ids:
+            error = f"DeviceError: ERROR in {path}: Duplicate router ID {router.id()}"
+
+        if error is not None:
+            result.failures[path] = error
+            continue
+
+        router_ids.add(router.id())
+        result.routers.append(router)
+        result.lines += lines
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def print_import(result: ConfigImport, limit: int = 50) -> None:
+    xr_routers = sum(isinstance(router, XRRouter) for router in result.routers)
+    print_success(f"Imported {len(result.routers)} routers ({xr_routers} IOS-XR) from {result.lines} configuration "
+                  f"lines in {result.elapsed:.2f} seconds")
+
+    if result.failures:
+        print_warning(f"{len(result.failures)} configurations were not imported", prompt=False)
+        print()
+        print(tabulate(list(result.failures.items())[:limit], headers=["Configuration", "Problem"]))
+        print()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple, TYPE_CHECKING
+
+from tabulate import tabulate
+
+from components.deployment.cli_channel import Address, CLIChannel
+from components.deployment.config_parser import RunningConfigParser, build_router, config_lines
+from components.deployment.file_transfer import staged_filename
+from components.deployment.push_engine import CommandError, PushEngine, PushResult
+from components.devices.router.router import Router
+from components.devices.router.xr_router import XRRouter
+from iptx_utils import DeviceError, NetworkError, print_log, print_success, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+
+CHUNK_SIZE = 64  # Devices compared by a worker at a time
+
+Facts = Dict[str, str]  # 'section > setting' -> value, of a router
+
+
+def _address(interface) -> str:
+    return f"{interface.ip_address} {interface.subnet_mask}" if interface.ip_address else "unassigned"
+
+
+def config_facts(router: Router) -> Facts:
+    """
+    The settings of a router which are part of its configuration, in a normalized form that doesn't depend on how
+    (or in which order) they were configured, so the router of the model and the one imported from the running
+    configuration of the device (see config_parser) are compared setting by setting. The links and the rest of
+    the state that the configuration doesn't show are left out.
+    """
+    facts = {"hostname": router.hostname, "platform": "IOS-XR" if isinstance(router, XRRouter) else "IOS"}
+
+    ospf = router._ospf_configured
+    if ospf:
+        facts["router ospf > process"] = str(router.OSPF_PROCESS_ID)
+        facts["router ospf > reference-bandwidth"] = str(router.reference_bw)
+        facts["router ospf > mpls ldp sync"] = str(router._mpls_ldp_sync)
+
+    for interface in router.all_phys_interfaces():
+        section = f"interface {interface}"
+        facts[f"{section} > ip address"] = _address(interface)
+        facts[f"{section} > description"] = interface.description
+        facts[f"{section} > shutdown"] = str(interface.shutdown_state)
+        facts[f"{section} > bandwidth"] = str(interface.bandwidth)
+        facts[f"{section} > mtu"] = str(interface.mtu)
+        facts[f"{section} > mpls"] = str(interface.mpls_enabled)
+
+        if interface.vrf_name is not None:
+            facts[f"{section} > vrf"] = interface.vrf_name
+        if interface.use_service_instance:
+            facts[f"{section} > service instances"] = " ".join(map(str, sorted(interface.vlans_in_service_instance)))
+
+        if ospf and interface.ospf_process_id:
+            facts[f"{section} > ospf area"] = str(interface.ospf_area)
+            facts[f"{section} > ospf network"] = "point-to-point" if interface.ospf_p2p else "broadcast"
+            facts[f"{section} > ospf passive"] = str(not interface.ospf_allow_hellos)
+
+        for sub_interface in interface.sub_interfaces:
+            sub_section = f"interface {sub_interface}"
+            facts[f"{sub_section} > ip address"] = _address(sub_interface)
+            facts[f"{sub_section} > pseudo-wire neighbors"] = " ".join(sorted(sub_interface.neighbor_ids))
+
+    for loopback in router.all_loopbacks():
+        section = f"interface {loopback}"
+        facts[f"{section} > ip address"] = _address(loopback)
+        facts[f"{section} > description"] = loopback.description
+        if ospf:
+            facts[f"{section} > ospf area"] = str(loopback.ospf_area)
+
+    # BGP, only on the routers which run it
+    if router.ibgp_adjacent_router_ids or router.vrfs:
+        facts["router bgp > as"] = str(router.as_number)
+        facts["router bgp > route-reflector"] = str(router.route_reflector)
+        if router.route_reflector:
+            facts["router bgp > cluster-id"] = router.rr_cluster_id or router.id()
+        for neighbor_id in router.ibgp_adjacent_router_ids:
+            facts[f"router bgp > neighbor {neighbor_id}"] = "IBGP"
+
+    for vrf in router.vrfs:
+        facts[f"vrf {vrf.name} > rd"] = f"{vrf.as_number}:{vrf.rd}"
+        facts[f"vrf {vrf.name} > import"] = " ".join(map(str, sorted(vrf.route_targets)))
+        facts[f"vrf {vrf.name} > export"] = " ".join(map(str, sorted(vrf.export_targets)))
+
+    return facts
+
+
+class DeviceDrift:
+    def __init__(self, device_id: str, hostname: str) -> None:
+        self.device_id = device_id
+        self.hostname = hostname
+        self.missing: Dict[str, str] = {}  # In the model, but not on the device
+        self.unexpected: Dict[str, str] = {}  # On the device, but not in the model
+        self.changed: Dict[str, Tuple[str, str]] = {}  # (intended, running)
+        self.failure: str | None = None  # Why the running configuration couldn't be collected or parsed
+
+    @property
+    def drifted(self) -> bool:
+        return bool(self.missing or self.unexpected or self.changed or self.failure)
+
+    def differences(self) -> List[str]:
+        return [f"- {key}: {value}" for key, value in sorted(self.missing.items())] + \
+            [f"+ {key}: {value}" for key, value in sorted(self.unexpected.items())] + \
+            [f"~ {key}: {intended} -> {running}" for key, (intended, running) in sorted(self.changed.items())]
+
+
+def compare_facts(device_id: str, hostname: str, intended: Facts, running: Facts,
+                  ignored_sections: Set[str] = frozenset()) -> DeviceDrift:
+    # The sections that are ignored are only the ones which the model doesn't have (e.g. the unused ports)
+    drift = DeviceDrift(device_id, hostname)
+    intended_sections = {key.split(" > ")[0] for key in intended}
+    running_sections = {key.split(" > ")[0] for key in running}
+
+    # A whole section on one side only (e.g. an interface) is a single difference, with all of its settings
+    def add(differences: Dict[str, str], key: str, value: str, other_sections: Set[str]) -> None:
+        section, _, setting = key.partition(" > ")
+        if setting and section not in other_sections:
+            differences[section] = f"{differences[section]}; {setting} {value}" if section in differences \
+                else f"{setting} {value}"
+        else:
+            differences[key] = value
+
+    for key, value in intended.items():
+        if key not in running:
+            add(drift.missing, key, value, running_sections)
+        elif running[key] != value:
+            drift.changed[key] = (value, running[key])
+
+    for key, value in running.items():
+        if key not in intended and key.split(" > ")[0] not in ignored_sections:
+            add(drift.unexpected, key, value, intended_sections)
+
+    return drift
+
+
+def intended_state(router: Router) -> Tuple[str, str, Facts, Set[str]]:
+    # What the running configuration of the router is compared with, and the sections left out of the comparison
+    # (the ports which have never been used)
+    return (router.id(), router.hostname, config_facts(router),
+            {f"interface {int_type}{port}" for port, (_, int_type) in router.lazy_port_specs().items()})
+
+
+def _compare_chunk(tasks: List[Tuple[str, str, Facts, Set[str], List[str] | str]]) -> List[DeviceDrift]:
+    # In the worker: each running configuration (its lines, or the path of its file) is parsed and compared
+    drifts = []
+    for device_id, hostname, intended, ignored_sections, running_config in tasks:
+        lines = config_lines(running_config) if isinstance(running_config, str) else running_config
+        try:
+            running = config_facts(build_router(RunningConfigParser(device_id).parse(lines)))
+            drift = compare_facts(device_id, hostname, intended, running, ignored_sections)
+        except (OSError, ValueError, TypeError, IndexError, DeviceError, NetworkError) as error:
+            drift = DeviceDrift(device_id, hostname)
+            drift.failure = f"{type(error).__name__}: {error}"
+
+        drifts.append(drift)
+
+    return drifts
+
+
+class ConfigCollector(PushEngine):
+    """
+    Collects the running configuration of many devices at once, over their CLI ('show running-config'), with the
+    concurrency, timeouts and retries of the PushEngine
+    """
+
+    def __init__(self, addresses: Dict[str, Address], username: str = None, password: str = None, **options) -> None:
+        super().__init__(addresses, username, password, **options)
+        self.configs: Dict[str, List[str]] = {}
+
+    async def _send(self, channel: CLIChannel, device_id: str, script: List[str]) -> List[CommandError]:
+        await channel.command("terminal length 0")
+        self.configs[device_id] = await channel.command("show running-config")
+        return []
+
+    def collect(self, device_ids: Iterable[str]) -> Tuple[Dict[str, List[str]], List[PushResult]]:
+        # The running configuration of each device, and the results of the ones it couldn't be collected from
+        self.configs = {}
+        results = self.run({device_id: [] for device_id in device_ids})
+        return self.configs, [result for result in results if result.failure is not None]
+
+
+class DriftDetector:
+    """
+    Audits the devices of a topology: the running configuration of every router is either collected from the
+    device (see ConfigCollector) or loaded from a directory (a '<device ID>.cfg' file each, see staged_filename),
+    and compared with the intended configuration of the router in the model, including the changes that haven't
+    been pushed yet.
+
+    Both sides are normalized to the same settings (see config_facts), the running configurations by parsing them
+    the same way as an import (see config_parser), so neither the formatting nor the order of the lines counts as
+    drift. The parsing and the comparison are split in chunks over a process pool.
+    """
+
+    def __init__(self, topology: Topology, device_ids: Iterable[str] = None) -> None:
+        self.topology = topology
+        self.routers: List[Router] = [topology[device_id] for device_id in device_ids] if device_ids is not None \
+            else [device for device in topology.get_all_routers() if device.as_number == topology.as_number]
+
+    def __compare(self, running_configs: Dict[str, List[str] | str], processes: int = None) -> List[DeviceDrift]:
+        tasks = [(*intended_state(router), running_configs[router.id()])
+                 for router in self.routers if router.id() in running_configs]
+
+        chunks = [tasks[start:start + CHUNK_SIZE] for start in range(0, len(tasks), CHUNK_SIZE)]
+        if processes == 1 or len(chunks) <= 1:
+            return [drift for chunk in chunks for drift in _compare_chunk(chunk)]
+
+        with ProcessPoolExecutor(processes) as executor:
+            return [drift for drifts in executor.map(_compare_chunk, chunks) for drift in drifts]
+
+    def __missing(self, device_id: str, failure: str) -> DeviceDrift:
+        drift = DeviceDrift(device_id, self.topology[device_id].hostname)
+        drift.failure = failure
+        return drift
+
+    def audit(self, addresses: Dict[str, Address] = None, directory: str = None, username: str = None,
+              password: str = None, processes: int = None, **options) -> List[DeviceDrift]:
+        # The drift of every router, in the order of the topology. The options are the ones of the PushEngine
+        if (addresses is None) == (directory is None):
+            raise ValueError("The running configurations are either collected from the addresses of the devices, "
+                             "or loaded from a directory")
+
+        start = time.perf_counter()
+        failures: Dict[str, str] = {}
+        if directory is not None:
+            running_configs = {}
+            for router in self.routers:
+                path = os.path.join(directory, staged_filename(router.id()))
+                if os.path.isfile(path):
+                    running_configs[router.id()] = path
+                else:
+                    failures[router.id()] = f"No running configuration at {path}"
+        else:
+            reachable = [router.id() for router in self.routers if router.id() in addresses]
+            failures = {router.id(): "No CLI address" for router in self.routers if router.id() not in addresses}
+
+            running_configs, failed = ConfigCollector(addresses, username, password, **options).collect(reachable)
+            failures.update({result.device_id: result.failure for result in failed})
+            print_log(f"Collected {len(running_configs)} running configurations in "
+                      f"{time.perf_counter() - start:.2f} seconds")
+
+        drifts = {drift.device_id: drift for drift in self.__compare(running_configs, processes)}
+        drifts.update({device_id: self.__missing(device_id, failure) for device_id, failure in failures.items()})
+
+        print_log(f"Audited {len(self.routers)} routers in {time.perf_counter() - start:.2f} seconds")
+        return [drifts[router.id()] for router in self.routers]
+
+    @staticmethod
+    def print_report(drifts: List[DeviceDrift], limit: int = 50, details: int = 3) -> None:
+        drifted = [drift for drift in drifts if drift.drifted]
+        if not drifted:
+            print_success(f"No drift: the running configurations of the {len(drifts)} routers match the model")
+            return
+
+        print_warning(f"{len(drifted)} out of {len(drifts)} routers have drifted from the model", prompt=False)
+        data = [[
+            drift.device_id,
+            drift.hostname,
+            len(drift.missing),
+            len(drift.unexpected),
+            len(drift.changed),
+            drift.failure or "\n".join(drift.differences()[:details])
+        ] for drift in drifted[:limit]]
+
+        print()
+        print(tabulate(data, headers=["Device ID", "Hostname", "Missing", "Unexpected", "Changed", "Differences"]))
+        print()
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+from urllib.parse import quote, unquote
+
+from components.deployment.cli_channel import Address, CLIChannel
+from components.deployment.push_engine import CommandError, PushEngine, PushResult
+from iptx_utils import print_log
+
+EXEC_PREFIX = "do "  # Lines of a script which are run in the EXEC mode, instead of being configured
+TRANSFER_ERROR = re.compile(r"^%\s*Error", re.IGNORECASE)  # The file couldn't be fetched at all
+
+
+def staged_filename(device_id: str) -> str:
+    return re.sub(r"[^\w.-]", "_", str(device_id)) + ".cfg"
+
+
+def split_script(script: List[str]) -> Tuple[List[int], List[str]]:
+    # The indexes of the lines of the script which go in the configuration file, and the EXEC commands to be run
+    # after merging it ('do write memory', ...). The 'commit' and 'end' lines are taken care of by the engine
+    config_lines, exec_commands = [], []
+    for index, line in enumerate(script):
+        if line.startswith(EXEC_PREFIX):
+            exec_commands.append(line[len(EXEC_PREFIX):])
+        elif line not in ("commit", "end"):
+            config_lines.append(index)
+
+    return config_lines, exec_commands
+
+
+def stage_scripts(scripts: Dict[str, List[str]], directory: str) -> Dict[str, str]:
+    # Writes the configuration file of every device in the directory, and gives back their names by device ID
+    os.makedirs(directory, exist_ok=True)
+
+    filenames = {}
+    for device_id, script in scripts.items():
+        filenames[device_id] = staged_filename(device_id)
+        config_lines, _ = split_script(script)
+        with open(os.path.join(directory, filenames[device_id]), "w", newline="\n") as file:
+            file.write("".join(f"{script[index]}\n" for index in config_lines) + "end\n")
+
+    return filenames
+
+
+class TransferServer:
+    """
+    Minimal HTTP/1.0 server for the staged configuration files, which the devices fetch with 'copy http://...'
+    (IOS) or 'load http://...' (IOS-XR). Only the files right in the staging directory are served (GET and HEAD),
+    and each one is sent with sendfile() where the system has it, straight from the page cache to the socket,
+    so many devices are served at once without the files going through the event loop.
+
+    The devices reach the server at 'advertised_host' (the address it listens on, by default), which has to be set
+    when it listens on every address.
+    """
+
+    def __init__(self, directory: str, host: str = "127.0.0.1", port: int = 0, advertised_host: str = None) -> None:
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.advertised_host = advertised_host if advertised_host is not None else host
+
+        self.requests = 0
+        self.bytes_sent = 0
+        self.__server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> Address:
+        self.__server = await asyncio.start_server(self.__handle, self.host, self.port)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+        print_log(f"Transfer server for '{self.directory}' listening on {self.host}:{self.port}")
+        return self.host, self.port
+
+    def url(self, filename: str) -> str:
+        return f"http://{self.advertised_host}:{self.port}/{quote(filename)}"
+
+    async def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    async def __aenter__(self) -> TransferServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
+
+    @staticmethod
+    def __respond(writer: asyncio.StreamWriter, status: str, length: int = 0) -> None:
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain\r\nContent-Length: {length}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass
+
+            filename = unquote(path.split("?")[0].lstrip("/"))
+            file_path = os.path.join(self.directory, filename)
+            if method not in ("GET", "HEAD"):
+                self.__respond(writer, "405 Method Not Allowed")
+            elif not filename or "/" in filename or "\\" in filename or filename.startswith(".") or \
+                    not os.path.isfile(file_path):
+                self.__respond(writer, "404 Not Found")
+            else:
+                with open(file_path, "rb") as file:
+                    size = os.fstat(file.fileno()).st_size
+                    self.__respond(writer, "200 OK", size)
+                    await writer.drain()
+
+                    if method == "GET":
+                        await asyncio.get_running_loop().sendfile(writer.transport, file)
+                        self.bytes_sent += size
+
+                self.requests += 1
+
+            await writer.drain()
+
+        # Closed by the device, or not an HTTP request at all. The task ends normally, since the server can't take a
+        # cancelled one
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+
+        finally:
+            writer.close()
+
+
+class FileTransferEngine(PushEngine):
+    """
+    Deployment mode for the initial turn-up of devices, which pushes every script as a file instead of pasting it
+    into the CLI: the scripts are written to a staging directory (a temporary one by default) and served by a
+    TransferServer, and each device is told to fetch its file and merge it into its running configuration, all of
+    them in parallel (up to 'concurrency'):
+
+    - IOS: 'copy <url> running-config', then the EXEC commands of the script ('do write memory', ...)
+    - IOS-XR (the scripts which end with 'commit'): 'load <url>' in the configuration mode, then 'commit'
+
+    The errors which the device reports while merging are matched back to the lines of the script by the command
+    it repeats before each of them. The rest of the options (timeouts, retries...) are the ones of PushEngine.
+    """
+
+    def __init__(self, addresses: Dict[str, Address], username: str = None, password: str = None,
+                 directory: str = None, server_host: str = "127.0.0.1", server_port: int = 0,
+                 advertised_host: str = None, **options) -> None:
+        super().__init__(addresses, username, password, **options)
+        self.directory = directory  # Staging directory
+        self.server_host = server_host
+        self.server_port = server_port
+        self.advertised_host = advertised_host
+
+        self.__urls: Dict[str, str] = {}
+
+    @staticmethod
+    def __merge_errors(script: List[str], config_lines: List[int], output: List[str]) -> List[CommandError]:
+        # Each error follows the command that caused it, so the commands are looked for in the order of the file
+        line_errors, unmatched, position, command = [], [], 0, None
+        for line in output:
+            if line.startswith("%"):
+                index = None
+                if command is not None:
+                    index = next((number for number in range(position, len(config_lines))
+                                  if script[config_lines[number]].strip() == command), None)
+
+                if index is None:
+                    unmatched.append((0, command or "", "", line.strip()))
+                else:
+                    line_errors.append((config_lines[index], line.strip()))
+                    position = index + 1
+                command = None
+
+            elif line.strip() and line.strip() != "^":
+                command = line.strip()
+
+        return PushEngine._command_errors(script, line_errors) + unmatched
+
+    async def _send(self, channel: CLIChannel, device_id: str, script: List[str]) -> List[CommandError]:
+        url = self.__urls[device_id]
+        config_lines, exec_commands = split_script(script)
+
+        await channel.command("terminal length 0")
+        if script[-1:] == ["commit"]:
+            await channel.command("configure terminal")
+            output = await channel.command(f"load {url}")
+        else:
+            output = await channel.confirmed_command(f"copy {url} running-config")
+
+        # The device couldn't get the file at all, which may be worth another try
+        failure = next((line.strip() for line in output if TRANSFER_ERROR.match(line.strip())), None)
+        if failure is not None:
+            if script[-1:] == ["commit"]:
+                await channel.command("end")
+            raise ConnectionError(f"Transfer of {url} failed: {failure}")
+
+        errors = self.__merge_errors(script, config_lines, output)
+        if script[-1:] == ["commit"]:
+            await channel.command("commit")
+            await channel.command("end")
+
+        for command in exec_commands:
+            await channel.command(command)
+
+        return errors
+
+    async def push_all(self, scripts: Dict[str, List[str]]) -> List[PushResult]:
+        directory = self.directory if self.directory is not None else tempfile.mkdtemp(prefix="iptx-staging-")
+        try:
+            filenames = stage_scripts(scripts, directory)
+            async with TransferServer(directory, self.server_host, self.server_port, self.advertised_host) as server:
+                self.__urls = {device_id: server.url(filename) for device_id, filename in filenames.items()}
+                results = await super().push_all(scripts)
+
+            print_log(f"Served {server.requests} files ({server.bytes_sent / 1024:.0f} KB) to {len(scripts)} devices")
+            return results
+
+        finally:
+            if self.directory is None:
+                shutil.rmtree(directory, ignore_errors=True)
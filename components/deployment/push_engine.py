@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Tuple, TYPE_CHECKING
+
+from tabulate import tabulate
+
+from components.deployment.cli_channel import Address, CLIChannel, LineError, PipelinedChannel
+from components.devices.network_device import NetworkDevice
+from components.devices.router.xr_router import XRRouter
+from iptx_utils import NotFoundError, print_log, print_success, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+
+# (line number in the script, command, section of the configuration it is in, error message)
+CommandError = Tuple[int, str, str, str]
+
+
+class PushResult:
+    def __init__(self, device_id: str, address: Address, lines: int) -> None:
+        self.device_id = device_id
+        self.address = address
+        self.lines = lines  # Lines of the script
+        self.attempts = 0
+        self.elapsed = 0.0  # Seconds, over every attempt
+        self.errors: List[CommandError] = []  # Reported by the device
+        self.failure: str | None = None  # Why the script couldn't be sent (after the last attempt)
+
+    @property
+    def success(self) -> bool:
+        return self.failure is None and not self.errors
+
+
+class PushEngine:
+    """
+    Sends rendered scripts to many devices at the same time, over their CLI. Each script is sent in the
+    configuration mode, and the lines which the device answers with an error ('% ...') are collected in the result
+    of the device, along with the section of the configuration they are in.
+
+    The lines are sent in chunks of up to 'window' lines ahead of the prompts (see PipelinedChannel), or one at a
+    time, waiting for the prompt of each one, with a window of 0 (see CLIChannel).
+
+    At most 'concurrency' devices are configured at once, and every attempt has 'timeout' seconds to finish. An
+    attempt that fails to connect, times out or loses the connection is retried up to 'retries' times, after a
+    growing pause. The lines already sent are sent again, so the scripts should be safe to repeat (which the
+    configuration commands generally are). The errors reported by a device are not retried.
+    """
+
+    def __init__(self, addresses: Dict[str, Address], username: str = None, password: str = None,
+                 concurrency: int = 100, timeout: float = 30.0, retries: int = 2, backoff: float = 0.5,
+                 window: int = 200) -> None:
+        if concurrency < 1:
+            raise ValueError(f"Invalid concurrency '{concurrency}': Must be at least 1")
+
+        self.addresses = addresses  # Device ID -> (address, port) of its CLI
+        self.username = username
+        self.password = password
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.window = window  # Lines sent ahead of the prompts (0 to wait for the prompt of every line)
+
+    @staticmethod
+    def _command_errors(script: List[str], errors: List[LineError]) -> List[CommandError]:
+        if not errors:
+            return []
+
+        sections = NetworkDevice.script_sections(script)
+        return [(index + 1, script[index], " > ".join(sections[index]), message) for index, message in errors]
+
+    async def _send(self, channel: CLIChannel, device_id: str, script: List[str]) -> List[CommandError]:
+        await channel.command("terminal length 0")
+        await channel.command("configure terminal")
+
+        errors = await channel.send_lines(script)
+
+        if not script or script[-1] != "end":
+            await channel.command("end")
+
+        return self._command_errors(script, errors)
+
+    async def __attempt(self, device_id: str, address: Address, script: List[str]) -> List[CommandError]:
+        channel = await PipelinedChannel.open(address, window=self.window) if self.window else \
+            await CLIChannel.open(address)
+        try:
+            await channel.login(self.username, self.password)
+            return await self._send(channel, device_id, script)
+        finally:
+            await channel.close()
+
+    async def push(self, device_id: str, script: List[str], semaphore: asyncio.Semaphore = None) -> PushResult:
+        if device_id not in self.addresses:
+            raise NotFoundError(f"No CLI address for the device with ID '{device_id}'")
+
+        result = PushResult(device_id, self.addresses[device_id], len(script))
+        async with semaphore if semaphore is not None else asyncio.Semaphore():
+            start = time.perf_counter()
+
+            while True:
+                result.attempts += 1
+                try:
+                    result.errors = await asyncio.wait_for(self.__attempt(device_id, result.address, script),
+                                                           self.timeout)
+                    result.failure = None
+                    break
+
+                except PermissionError as error:
+                    # The same credentials won't work any better the next time
+                    result.failure = f"{type(error).__name__}: {error}"
+                    break
+                except asyncio.TimeoutError:
+                    result.failure = f"Timed out after {self.timeout} seconds"
+                except OSError as error:
+                    result.failure = f"{type(error).__name__}: {error}"
+
+                if result.attempts > self.retries:
+                    break
+
+                await asyncio.sleep(self.backoff * 2 ** (result.attempts - 1))
+
+            result.elapsed = time.perf_counter() - start
+
+        return result
+
+    async def push_all(self, scripts: Dict[str, List[str]]) -> List[PushResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return list(await asyncio.gather(*[self.push(device_id, script, semaphore)
+                                           for device_id, script in scripts.items()]))
+
+    def run(self, scripts: Dict[str, List[str]]) -> List[PushResult]:
+        return asyncio.run(self.push_all(scripts))
+
+    @staticmethod
+    def render(topology: Topology, device_ids: Iterable[str] = None) -> Dict[str, List[str]]:
+        # The pending commands of the devices (which are consumed), ready to be pushed
+        devices = [topology[device_id] for device_id in device_ids] if device_ids is not None else \
+            [device for device in topology.get_all_devices() if device.as_number == topology.as_number]
+
+        scripts = {}
+        for device in devices:
+            script = device.generate_script()
+            scripts[device.id()] = script + ["commit"] if isinstance(device, XRRouter) else script
+
+        return scripts
+
+    def push_topology(self, topology: Topology, device_ids: Iterable[str] = None) -> List[PushResult]:
+        results = self.run(self.render(topology, device_ids))
+        self.print_results(results)
+        return results
+
+    @staticmethod
+    def print_results(results: List[PushResult], limit: int = 50) -> None:
+        failed = [result for result in results if not result.success]
+        elapsed = max((result.elapsed for result in results), default=0)
+
+        if not failed:
+            print_success(f"Pushed the scripts of {len(results)} devices ({sum(r.lines for r in results)} lines)")
+            return
+
+        print_warning(f"{len(failed)} out of {len(results)} devices were not configured cleanly", prompt=False)
+        data = [[
+            result.device_id,
+            f"{result.address[0]}:{result.address[1]}",
+            result.attempts,
+            f"{result.elapsed:.2f}",
+            result.failure or "; ".join(f"line {number}: {command} ({message}, in '{section or 'global'}')"
+                                        for number, command, section, message in result.errors[:3])
+        ] for result in failed[:limit]]
+
+        print()
+        print_log(f"Slowest device took {elapsed:.2f} seconds")
+        print(tabulate(data, headers=["Device ID", "Address", "Attempts", "Seconds", "Problem"]))
+        print()
@@ -83,37 +83,35 @@ def gns3_ce_router(rtr_id: str, name: str, as_number: int = None) -> Router:
     return router
 
 
-def cisco_xr_9000(rtr_id: str, name: str) -> XRRouter:
+def cisco_xr_9000(rtr_id: str, name: str, lazy_interfaces: bool = False) -> XRRouter:
+    ports = [f"0/0/0/{number}" for number in range_(0, 7)]
+
+    # With lazy interfaces, the ports are only created (and rendered) when they are used
+    if lazy_interfaces:
+        router = XRRouter(router_id=rtr_id, hostname=name, interfaces=[], mpls_ldp_sync=True)
+        router.add_lazy_interfaces(RouterInterface, "GigabitEthernet", *ports)
+        return router
+
     return XRRouter(
         router_id=rtr_id,
         hostname=name,
-        interfaces=[
-            RouterInterface("GigabitEthernet", "0/0/0/0"),
-            RouterInterface("GigabitEthernet", "0/0/0/1"),
-            RouterInterface("GigabitEthernet", "0/0/0/2"),
-            RouterInterface("GigabitEthernet", "0/0/0/3"),
-            RouterInterface("GigabitEthernet", "0/0/0/4"),
-            RouterInterface("GigabitEthernet", "0/0/0/5"),
-            RouterInterface("GigabitEthernet", "0/0/0/6"),
-            RouterInterface("GigabitEthernet", "0/0/0/7")
-        ],
+        interfaces=[RouterInterface("GigabitEthernet", port) for port in ports],
         mpls_ldp_sync=True
     )
 
 
-def gns3_cisco_xr(rtr_id: str, name: str) -> XRRouter:
+def gns3_cisco_xr(rtr_id: str, name: str, lazy_interfaces: bool = False) -> XRRouter:
+    ports = [f"0/0/0/{number}" for number in range_(0, 7)]
+
+    # With lazy interfaces, the ports are only created (and rendered) when they are used
+    if lazy_interfaces:
+        router = XRRouter(router_id=rtr_id, hostname=name, interfaces=[], mpls_ldp_sync=False)
+        router.add_lazy_interfaces(RouterInterface, "GigabitEthernet", *ports)
+        return router
+
     return XRRouter(
         router_id=rtr_id,
         hostname=name,
-        interfaces=[
-            RouterInterface("GigabitEthernet", "0/0/0/0"),
-            RouterInterface("GigabitEthernet", "0/0/0/1"),
-            RouterInterface("GigabitEthernet", "0/0/0/2"),
-            RouterInterface("GigabitEthernet", "0/0/0/3"),
-            RouterInterface("GigabitEthernet", "0/0/0/4"),
-            RouterInterface("GigabitEthernet", "0/0/0/5"),
-            RouterInterface("GigabitEthernet", "0/0/0/6"),
-            RouterInterface("GigabitEthernet", "0/0/0/7")
-        ],
+        interfaces=[RouterInterface("GigabitEthernet", port) for port in ports],
         mpls_ldp_sync=False
-    )
\ No newline at end of file
+    )
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List, Iterable, Any, TYPE_CHECKING
+from typing import List, Iterable, Any, Dict, Tuple, Type, TYPE_CHECKING
 
 from iptx_utils import NetworkError
 from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
@@ -23,74 +23,98 @@ class NetworkDevice:
     hostname_pattern = r"^(?!-)[A-Za-z0-9-]{1,63}(?<!-)$"
     hostname_regex = re.compile(hostname_pattern)
 
-    # Print out the script
+    # Lines which open a section of the configuration, up to its 'exit'
+    section_patterns = [re.compile(pattern) for pattern in [
+        r"^interface",
+        r"^router ",
+        r"^area ",
+        r"^address-family",
+        r"^neighbor-group",
+        r"^service instance ",
+        r"^vrf",
+        r"^route-policy \S+$",
+        r"^mpls ldp$",
+        r"\bl2vpn\b",
+        r"^xconnect\s+group\s+\S+",
+        r"^p2p\s+\S+"
+    ]]
+    # Lines which close a section, besides 'exit'
+    section_closers = ["exit-address-family", "end-policy"]
+    # A 'neighbor' line with any of these only configures the neighbor, without opening its section
+    neighbor_options = ["remote-as", "update-source", "route-reflector", "activate", "send-community"]
+
     @staticmethod
-    def print_script(commands: Iterable[str], color=Fore.LIGHTYELLOW_EX):
+    def script_sections(commands: Iterable[str]) -> List[Tuple[str, ...]]:
+        # The sections which every line of the script is in, the outermost first
+        commands = list(commands)
+        sections, opened = [], []
+        allow_vrf_section = True
 
-        def find_sections(line):
-            regex_patterns = [
-                r"\bl2vpn\b",
-                r"^xconnect\s+group\s+\S+",
-                r"^p2p\s+\S+"
-            ]
-            for pattern in regex_patterns:
-                match = re.search(pattern, line)
-                if match:
-                    return match.group()  # Return the matched string
-            return None  # Return None if no match is found
-
-        indent_size = 0
-        allow_indenting_vrf = True
         for index, command_line in enumerate(commands):
+            sections.append(tuple(opened))
+
+            if command_line == "exit" or command_line in NetworkDevice.section_closers:
+                if opened:
+                    opened.pop()
+                continue
+
+            # The 'vrf' line right in an interface is just the forwarding of the interface
+            if command_line[:3] == "vrf":
+                if allow_vrf_section:
+                    opened.append(command_line)
+                allow_vrf_section = True
+                continue
+
+            if command_line[:9] == "interface" and index + 1 < len(commands) and "vrf" in commands[index + 1]:
+                allow_vrf_section = False
+
+            if any(pattern.search(command_line) for pattern in NetworkDevice.section_patterns):
+                opened.append(command_line)
+            elif command_line[:8] == "neighbor" and not any(option in command_line
+                                                            for option in NetworkDevice.neighbor_options):
+                opened.append(command_line)
+
+        return sections
 
-            indent = '  ' * indent_size
+    # Print out the script
+    @staticmethod
+    def print_script(commands: Iterable[str], color=Fore.LIGHTYELLOW_EX):
+        commands = list(commands)
+
+        for command_line, sections in zip(commands, NetworkDevice.script_sections(commands)):
+            indent = '  ' * len(sections)
 
             if command_line == "exit":
-                indent_size -= 1
-                indent = '  ' * indent_size
+                indent = '  ' * (len(sections) - 1)
                 print(f"{color}{indent}!{Style.RESET_ALL}")
+            elif command_line == "end-policy":
+                # At the level of its route-policy, like in the running configuration
+                indent = '  ' * (len(sections) - 1)
+                print(f"{color}{indent}{command_line}{Style.RESET_ALL}")
             else:
                 print(f"{color}{indent}{command_line}{Style.RESET_ALL}")
                 if command_line == "exit-address-family":
-                    indent_size -= 1
-                    indent = '  ' * indent_size
+                    indent = '  ' * (len(sections) - 1)
                     print(f"{color}{indent}!{Style.RESET_ALL}")
 
             if "hostname" in command_line:
                 print(f'{color}!{Style.RESET_ALL}')
 
-            if (command_line[:9] == "interface" or
-                    command_line[:7] == "router " or
-                    command_line[:5] == "area " or
-                    command_line[:14] == "address-family" or
-                    command_line[:14] == "neighbor-group" or
-                    command_line[:17] == "service instance " or
-                    command_line[:3] == "vrf"):
-
-                if command_line[:9] == "interface" and "vrf" in commands[index+1]:
-                    allow_indenting_vrf = False
-
-                if command_line[:3] == "vrf":
-                    if allow_indenting_vrf:
-                        indent_size += 1
-                    else:
-                        allow_indenting_vrf = True
-                else:
-                    indent_size += 1
-
-            if command_line == "mpls ldp":
-                indent_size += 1
-
-            if find_sections(command_line):
-                indent_size += 1
-
-            if command_line[:8] == "neighbor" and not command_line[:14] == "neighbor-group":
-                if not any(substr in command_line for substr in ["remote-as",
-                                                                 "update-source",
-                                                                 "route-reflector",
-                                                                 "activate",
-                                                                 "send-community"]):
-                    indent_size += 1
+    @staticmethod
+    def running_config(commands: Iterable[str]) -> List[str]:
+        # The script as a device shows it in its running configuration, indented by section, with '!' for 'exit'
+        commands = list(commands)
+        lines = []
+
+        for command_line, sections in zip(commands, NetworkDevice.script_sections(commands)):
+            if command_line == "exit":
+                lines.append(" " * (len(sections) - 1) + "!")
+            elif command_line in NetworkDevice.section_closers:
+                lines.append(" " * (len(sections) - 1) + command_line)
+            elif not command_line.startswith("do "):
+                lines.append(" " * len(sections) + command_line)
+
+        return lines
 
     @staticmethod
     def copy_script(commands: Iterable[str]):
@@ -113,10 +137,18 @@ class NetworkDevice:
         self.as_number: int = 0
         self.hostname: str = hostname
         self.__phys_interfaces: List[PhysicalInterface] = []
+        self.__phys_interfaces_by_port: Dict[str, PhysicalInterface] = {}
         self.__loopbacks: List[Loopback] = []
+
+        # Ports that are declared but not yet materialized (port -> (interface class, interface type))
+        self.__lazy_ports: Dict[str, Tuple[Type[PhysicalInterface], str]] = {}
+
         self.add_interface(*interfaces)
         self.node_color = "gray"
 
+        # Whether the next script shuts down the ports that have never been used (see harden_unused_ports())
+        self._harden_unused: bool = False
+
         # Cisco commands
         self._starter_commands: CommandsDict = {
             "timezone": ["clock timezone Dhaka 6 0"],
@@ -146,9 +178,13 @@ class NetworkDevice:
         return self.__device_id
 
     def interface(self, port: str) -> Any:
-        for interface in self.__phys_interfaces:
-            if port == interface.port:
-                return interface
+        interface = self.__phys_interfaces_by_port.get(port)
+        if interface is not None:
+            return interface
+
+        # Declared, but never used so far, so the interface is created on its first access
+        if port in self.__lazy_ports:
+            return self.__materialize(port)
 
         # Raise an error if it doesn't exist
         raise NotFoundError(f"ERROR in {str(self)}: Interface with port {port} is not included in "
@@ -178,11 +214,18 @@ class NetworkDevice:
     def all_interfaces(self) -> List[Any]:
         return self.__phys_interfaces + self.__loopbacks
 
+    def unused_ports(self) -> List[str]:
+        # Ports that are declared lazily, but were never accessed or connected
+        return list(self.__lazy_ports.keys())
+
     def get_max_bandwidth(self, in_mbps: bool = False) -> int:
+        bandwidths = [interface.bandwidth for interface in self.all_phys_interfaces()]
+        bandwidths.extend(PhysicalInterface.BANDWIDTHS[int_type] for _, int_type in self.__lazy_ports.values())
+
         if in_mbps:
-            return max(interface.bandwidth for interface in self.all_phys_interfaces()) // 1000
+            return max(bandwidths) // 1000
         else:
-            return max(interface.bandwidth for interface in self.all_phys_interfaces())
+            return max(bandwidths)
 
     def remote_device(self, port) -> NetworkDevice:
         device = self.interface(port).remote_device
@@ -204,6 +247,9 @@ class NetworkDevice:
         for interface in self.all_phys_interfaces():
             print(interface.port)
 
+        for port in self.__lazy_ports.keys():
+            print(f"{port} (unused)")
+
     # -----------------------------------------------------------------------
 
     # *** Setters and modifiers ***
@@ -233,19 +279,82 @@ class NetworkDevice:
 
             # Cannot contain duplicate ports
             if isinstance(interface, PhysicalInterface):
-                ports = [inf.port for inf in self.__phys_interfaces]
-
-                if interface.port in ports:
+                if interface.port in self.__phys_interfaces_by_port or interface.port in self.__lazy_ports:
                     raise NetworkError(f"ERROR: Overlapping ports in '{interface.port}'")
 
                 self.__phys_interfaces.append(interface)
+                self.__phys_interfaces_by_port[interface.port] = interface
 
-            # For Loopbacks
+            # For Loopbacks (numbered in order, unless given a number of their own)
             elif isinstance(interface, Loopback):
                 ports = [inf.port for inf in self.__loopbacks]
-                interface.port = smallest_missing_non_negative_integer(ports)
+                if not interface.port:
+                    interface.port = smallest_missing_non_negative_integer(ports)
+                elif interface.port in ports:
+                    raise NetworkError(f"ERROR: Overlapping ports in 'Loopback{interface.port}'")
                 self.__loopbacks.append(interface)
 
+    def add_lazy_interfaces(self, interface_class: Type[PhysicalInterface], int_type: str, *ports: str) -> None:
+        """
+        Declares ports without creating the interface objects. An interface is only created (and configured with
+        its defaults) when it is accessed through interface() or connected, so the untouched ports on a large line
+        card are neither stored nor rendered in the configuration script.
+        """
+        if not issubclass(interface_class, PhysicalInterface):
+            raise TypeError("Lazy interfaces should be a physical interface (e.g. GigabitEthernet)")
+
+        if int_type not in PhysicalInterface.BANDWIDTHS:
+            raise TypeError(f"ERROR: Invalid interface type '{int_type}' - Please use the following "
+                            f"interfaces {', '.join(PhysicalInterface.BANDWIDTHS.keys())}")
+
+        for port in ports:
+            PhysicalInterface.validate_port(int_type, port)
+
+            if port in self.__phys_interfaces_by_port or port in self.__lazy_ports:
+                raise NetworkError(f"ERROR: Overlapping ports in '{port}'")
+
+            self.__lazy_ports[port] = (interface_class, int_type)
+
+    def __materialize(self, port: str) -> PhysicalInterface:
+        interface_class, int_type = self.__lazy_ports.pop(port)
+        interface = interface_class(int_type, port)
+        self.add_interface(interface)
+
+        return interface
+
+    def harden_unused_ports(self) -> None:
+        # Explicitly shuts down every port that has never been used, for the next configuration script
+        self._harden_unused = True
+
+    def _generate_hardening_config(self) -> List[str]:
+        # Built from the ports that are still unused now, so a port used after harden_unused_ports() stays up
+        commands = []
+        if self._harden_unused:
+            for port, (interface_class, int_type) in self.__lazy_ports.items():
+                commands.extend([
+                    f"interface {int_type}{port}",
+                    "description \"UNCONNECTED\"",
+                    "shutdown",
+                    "exit"
+                ])
+
+        self._harden_unused = False
+        return commands
+
+    def lazy_port_specs(self) -> Dict[str, Tuple[Type[PhysicalInterface], str]]:
+        return dict(self.__lazy_ports)
+
+    # Pending (not yet generated) Cisco commands, used when the device is stored and restored
+    def _pending_commands(self) -> Dict[str, CommandsDict]:
+        return {
+            "starter": {attr: lines[:] for attr, lines in self._starter_commands.items()},
+            "hardening": {"unused_ports": self.unused_ports() if self._harden_unused else []}
+        }
+
+    def _restore_pending_commands(self, pending: Dict[str, CommandsDict]) -> None:
+        self._starter_commands.update({attr: lines[:] for attr, lines in pending.get("starter", {}).items()})
+        self._harden_unused = any(pending.get("hardening", {}).values())
+
     def get_remote_interface(self, port: str) -> PhysicalInterface | Any:
         remote_device = self.interface(port).remote_device
         remote_port = self.interface(port).remote_port
@@ -273,6 +382,17 @@ class NetworkDevice:
                 if interface.network_address() in networks:
                     raise NetworkError(f"ERROR: Overlapping networks in '{str(interface)}'")
 
+    # The script that generate_script() would give, with the pending commands left in place
+    def preview_script(self) -> List[str]:
+        objects = [self] + self.all_interfaces() + [sub_interface for interface in self.all_phys_interfaces()
+                                                     for sub_interface in getattr(interface, "sub_interfaces", ())]
+        pending = [(obj, obj._pending_commands()) for obj in objects]
+        try:
+            return self.generate_script()
+        finally:
+            for obj, commands in pending:
+                obj._restore_pending_commands(commands)
+
     # Generate a complete configuration script
     def generate_script(self) -> List[str]:
         # Start with an empty list
@@ -289,5 +409,8 @@ class NetworkDevice:
         for interface in self.all_interfaces():
             script.extend(interface.generate_config())
 
+        # Shut down any unused ports, if requested
+        script.extend(self._generate_hardening_config())
+
         script.append("end")
         return script
@@ -21,9 +21,14 @@ class Router(NetworkDevice):
         # BGP properties and attributes
         self.as_number: int = 0
         self.route_reflector: bool = False
+        self.rr_cluster_id: str | None = None  # Shared by the redundant route-reflectors of a cluster
         self.ibgp_adjacent_router_ids: set[str] = set()
         self._mpls_ldp_sync = False
 
+        # OSPF area -> its interfaces (by name), with the position of each interface in the router
+        self.__area_index: Dict[int, Dict[str, RouterInterface | Loopback]] = {}
+        self.__interface_positions: Dict[str, int] = {}
+
         super().__init__(device_id=router_id, hostname=hostname)
         self.add_interface(Loopback(cidr=router_id, description=f"LOOPBACK-FHL-{hostname}"))
         self.add_interface(*interfaces)
@@ -37,6 +42,9 @@ class Router(NetworkDevice):
         # MPLS
         self._mpls_configured: bool = False
 
+        # Whether the OSPF configuration has already been generated
+        self._ospf_configured: bool = False
+
         # Cisco commands
         self._starter_commands.update({
             "vrf": []
@@ -83,11 +91,28 @@ class Router(NetworkDevice):
 
         super().add_interface(*new_interfaces)
 
+        for interface in new_interfaces:
+            # Physical interfaces come before the loopbacks, same as all_interfaces()
+            is_loopback = isinstance(interface, Loopback)
+            self.__interface_positions[str(interface)] = len(self.__interface_positions) + is_loopback * (1 << 32)
+
+            interface._area_listener = self._move_interface
+            self._move_interface(interface, None, interface.ospf_area)
+
+    def _move_interface(self, interface: RouterInterface | Loopback, old_area: int | None, new_area: int) -> None:
+        if old_area is not None and old_area in self.__area_index:
+            self.__area_index[old_area].pop(str(interface), None)
+            if not self.__area_index[old_area]:
+                del self.__area_index[old_area]
+
+        self.__area_index.setdefault(new_area, {})[str(interface)] = interface
+
     def get_ints_by_ospf_area(self, area_number):
-        return [interface for interface in self.all_interfaces() if interface.ospf_area == area_number]
+        interfaces = self.__area_index.get(area_number, {})
+        return sorted(interfaces.values(), key=lambda interface: self.__interface_positions[str(interface)])
 
     def get_all_areas(self) -> Set[int]:
-        return set([interface.ospf_area for interface in self.all_interfaces()])
+        return set(self.__area_index)
 
     # Shortcut to setting up the OSPF area numbers for each router interface
     def set_ospf_area(self, area_number, ports: List[str] | str) -> None:
@@ -123,6 +148,26 @@ class Router(NetworkDevice):
 
         return None
 
+    def _pending_commands(self) -> Dict[str, Dict[str, List[str]]]:
+        pending = super()._pending_commands()
+        pending["routing"] = {attr: lines[:] for attr, lines in self._routing_commands.items()}
+        pending["bgp"] = {attr: lines[:] for attr, lines in self._bgp_commands.items()}
+
+        return pending
+
+    def _restore_pending_commands(self, pending: Dict[str, Dict[str, List[str]]]) -> None:
+        super()._restore_pending_commands(pending)
+        self._routing_commands.update({attr: lines[:] for attr, lines in pending.get("routing", {}).items()})
+        self._bgp_commands.update({attr: lines[:] for attr, lines in pending.get("bgp", {}).items()})
+
+    def preview_script(self) -> List[str]:
+        # The MPLS commands are only added to the first script
+        mpls_configured = self._mpls_configured
+        try:
+            return super().preview_script()
+        finally:
+            self._mpls_configured = mpls_configured
+
     def _consolidate_vrf_setup_commands(self) -> None:
         self._starter_commands["vrf"].clear()
         for vrf in self.vrfs:
@@ -134,9 +179,35 @@ class Router(NetworkDevice):
 
     def not_route_reflector(self) -> None:
         self.route_reflector = False
+        self.rr_cluster_id = None
         if self.hostname.endswith("-RR"):
             self.set_hostname(self.hostname.replace("-RR", ""))
 
+    def update_reference_bw(self, reference_bw: int) -> None:
+        # Nothing to change
+        if reference_bw == self.reference_bw:
+            return
+
+        self.reference_bw = reference_bw
+        auto_cost_cmd = f"auto-cost reference-bandwidth {self.reference_bw}"
+
+        # The OSPF commands haven't been rendered yet, so the existing line is replaced
+        if self._routing_commands["ospf"]:
+            for index, command in enumerate(self._routing_commands["ospf"]):
+                if command.startswith("auto-cost reference-bandwidth"):
+                    self._routing_commands["ospf"][index] = auto_cost_cmd
+                    return
+
+            self._routing_commands["ospf"].insert(1, auto_cost_cmd)
+
+        # Already configured, so only the change in the reference bandwidth is sent
+        elif self._ospf_configured:
+            self._routing_commands["ospf"] = [
+                f"router ospf {self.OSPF_PROCESS_ID}",
+                auto_cost_cmd,
+                "exit"
+            ]
+
     def begin_internal_routing(self) -> None:
         # Configure OSPF for all interfaces
         for interface in self.all_phys_interfaces():
@@ -167,16 +238,21 @@ class Router(NetworkDevice):
                 self._routing_commands["ospf"].append("mpls ldp sync")
 
         self._routing_commands["ospf"].append("exit")
+        self._ospf_configured = True
 
     def is_provider_edge(self) -> bool:
         return any(interface.egp for interface in self.all_phys_interfaces())
 
     def bgp_routing(self, initialization: bool = False, ibgp_neighbor_ids: Iterable[str] = None,
-                    redistribution_to_egp: bool = False) -> None:
+                    redistribution_to_egp: bool = False, rr_peer_ids: Iterable[str] = None) -> None:
 
         if ibgp_neighbor_ids is None:
             ibgp_neighbor_ids = []
 
+        # The route-reflectors of the other clusters (or of the same one), which are peers rather than clients
+        if rr_peer_ids is None:
+            rr_peer_ids = []
+
         # Step 1: Error/warning check
         def error_check():
             if self.as_number == 0:
@@ -201,7 +277,7 @@ class Router(NetworkDevice):
             ]
 
             if self.route_reflector:
-                self._bgp_commands["id"].append(f"bgp cluster-id {self.id()}")
+                self._bgp_commands["id"].append(f"bgp cluster-id {self.rr_cluster_id or self.id()}")
 
         # Step 3: Initialize address families
         def address_families():
@@ -209,9 +285,9 @@ class Router(NetworkDevice):
                 self._bgp_commands["af_vpn_v4"] = ["address-family vpnv4", "exit-address-family"]
 
         # Step 4: Assign neighbors
-        def assign_ibgp_neighbors():
+        def assign_ibgp_neighbors(neighbor_ids: Iterable[str], clients: bool):
             # Assign neighbor group to each adjacent routers to establish neighbor
-            for rtr_id in ibgp_neighbor_ids:
+            for rtr_id in neighbor_ids:
                 if rtr_id not in self.ibgp_adjacent_router_ids:
                     self.ibgp_adjacent_router_ids.add(rtr_id)
 
@@ -229,7 +305,7 @@ class Router(NetworkDevice):
                             f"neighbor {rtr_id} send-community both"
                         ]
 
-                    if self.route_reflector:
+                    if self.route_reflector and clients:
                         self._bgp_commands["neighbor"].append(f"neighbor {rtr_id} route-reflector-client")
                         self._bgp_commands["af_vpn_v4"].insert(-1, f"neighbor {rtr_id} route-reflector-client")
 
@@ -253,7 +329,9 @@ class Router(NetworkDevice):
                 define_router_id()
                 address_families()
             if ibgp_neighbor_ids:
-                assign_ibgp_neighbors()
+                assign_ibgp_neighbors(ibgp_neighbor_ids, clients=True)
+            if rr_peer_ids:
+                assign_ibgp_neighbors(rr_peer_ids, clients=False)
             if redistribution_to_egp:
                 redistribution_to_external_routes()
             close_out()
@@ -335,6 +413,9 @@ class Router(NetworkDevice):
         for interface in self.all_interfaces():
             script.extend(interface.generate_config())
 
+        # Shut down any unused ports, if requested
+        script.extend(self._generate_hardening_config())
+
         # Iterate through each routing command
         for attr in self._routing_commands.keys():
             script.extend(self._routing_commands[attr])
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, List, Any
+from typing import TYPE_CHECKING, List, Any, Set
 from components.interfaces.physical_interfaces.router_interface import RouterInterface
 from iptx_utils import print_warning, NotFoundError
 
@@ -6,31 +6,52 @@ if TYPE_CHECKING:
     from components.devices.router.router import Router
 
 
+class VPNPolicy:
+    # A VPN topology over many VRFs, made of route-targets that they share instead of one per pair of VRFs
+    def __init__(self, name: str, kind: str, members: List[str], route_targets: List[int], hub: str = None) -> None:
+        self.name = name
+        self.kind = kind  # "full-mesh" or "hub-and-spoke"
+        self.members = members  # IDs of the VRFs (the spokes, for a hub-and-spoke)
+        self.route_targets = route_targets  # [mesh] or [hub, spoke]
+        self.hub = hub
+
+
 class VRF:
     def __init__(self, rd: int, name: str, as_number: int, color: str = "gray"):
         self.rd: int = rd
         self.name: str = name
         self.as_number: int = as_number
-        self.route_targets: List[int] = []
+        self.route_targets: Set[int] = set()  # Imported
+        self.export_targets: Set[int] = set()  # Exported, besides its own RD (e.g. the route-targets of VPN policies)
         self.assigned_routers: set['Router'] = set()
 
         # Cisco commands
-        self.__setup_commands: list[str] = [
-            f"vrf definition {name}",
-            f"rd {self.as_number}:{self.rd}",
-            "address-family ipv4",
-            f"route-target export {self.as_number}:{self.rd}",
-            "exit-address-family",
-            "exit"
-        ]
+        self.__setup_commands: list[str] = self.__definition()
 
         self.color = color
 
     def __eq__(self, other: 'VRF') -> bool:
-        return self.rd == other.rd
+        if isinstance(other, VRF):
+            return (self.as_number, self.rd, self.name) == (other.as_number, other.rd, other.name)
+
+        return False
 
     def __hash__(self):
-        return hash(self.rd)
+        # Only the numbers, so that the sets of VRFs are in the same order in every process
+        return hash((self.as_number, self.rd))
+
+    def __definition(self) -> List[str]:
+        # The whole definition of the VRF, with all of its route-targets
+        return [
+            f"vrf definition {self.name}",
+            f"rd {self.as_number}:{self.rd}",
+            "address-family ipv4",
+            f"route-target export {self.as_number}:{self.rd}",
+            *[f"route-target export {self.as_number}:{route_target}" for route_target in sorted(self.export_targets)],
+            *[f"route-target import {self.as_number}:{route_target}" for route_target in sorted(self.route_targets)],
+            "exit-address-family",
+            "exit"
+        ]
 
     def get_setup_cmd(self) -> List[str]:
         return self.__setup_commands
@@ -64,6 +85,9 @@ class VRF:
 
         return cisco_xr_commands
 
+    def _restore_setup_cmd(self, setup_commands: List[str]) -> None:
+        self.__setup_commands = setup_commands[:]
+
     def clear_setup_cmd(self) -> None:
         self.__setup_commands.clear()
 
@@ -80,16 +104,10 @@ class VRF:
             self.assigned_routers.add(router)      # Add the router to the VRF
 
         if self.__setup_commands:
-            self.__setup_commands: list[str] = [
-                f"vrf definition {self.name}",
-                f"rd {self.as_number}:{self.rd}",
-                "address-family ipv4",
-                f"route-target export {self.as_number}:{self.rd}",
-                "exit-address-family",
-                "exit"
-            ]
+            self.__setup_commands: list[str] = self.__definition()
 
-    def set_route_targets(self, *new_route_targets: int) -> None:
+    def __pending_block(self) -> None:
+        # After the definition has been rendered, only the changes are sent within the VRF
         if not self.__setup_commands:
             self.__setup_commands: list[str] = [
                 f"vrf definition {self.name}",
@@ -98,19 +116,47 @@ class VRF:
                 "exit"
             ]
 
+    def set_route_targets(self, *new_route_targets: int) -> None:
+        self.__pending_block()
+
         for route_target in new_route_targets:
             if route_target not in self.route_targets:
-                self.route_targets.append(route_target)
+                self.route_targets.add(route_target)
                 self.__setup_commands.insert(-2, f"route-target import {self.as_number}:{route_target}")
 
+    def set_export_targets(self, *new_export_targets: int) -> None:
+        self.__pending_block()
+
+        for route_target in new_export_targets:
+            if route_target not in self.export_targets and route_target != self.rd:
+                self.export_targets.add(route_target)
+                self.__setup_commands.insert(-2, f"route-target export {self.as_number}:{route_target}")
+
+    def remove_route_targets(self, *old_route_targets: int) -> None:
+        # Stops importing the route-targets, leaving the rest of the VRF as it is
+        self.__pending_block()
+
+        for route_target in old_route_targets:
+            if route_target in self.route_targets:
+                self.route_targets.discard(route_target)
+
+                # Not sent to the routers yet, so it's enough to take the line back
+                command = f"route-target import {self.as_number}:{route_target}"
+                if command in self.__setup_commands:
+                    self.__setup_commands.remove(command)
+                else:
+                    self.__setup_commands.insert(-2, f"no {command}")
+
+    def export_route_targets(self) -> Set[int]:
+        return {self.rd, *self.export_targets}
+
+    def import_route_targets(self) -> Set[int]:
+        # Only what the definition imports, which doesn't include its own RD (so the sites of the VRF on other
+        # provider edges aren't imported, unless a route-target of the VRF brings them in)
+        return set(self.route_targets)
+
     def discard_route_targets(self, route_target: int) -> None:
-        if not self.__setup_commands:
-            self.__setup_commands: list[str] = [
-                f"vrf definition {self.name}",
-                "address-family ipv4",
-                "exit-address-family",
-                "exit"
-            ]
+        self.__pending_block()
 
         # Remove VRF address-family in BGP configuration
         print_warning("The VRF address-family in BGP will been removed from the router", prompt=False)
@@ -122,6 +168,7 @@ class VRF:
 
         # Remove VRF address-family in BGP configuration
         self.__setup_commands.insert(-2, f"no route-target import {self.as_number}:{route_target}")
+        self.route_targets.discard(route_target)
 
     def get_assigned_interfaces(self, router_id: str, ebgp_unconfirmed_only: bool = False) -> List[RouterInterface]:
 
@@ -222,5 +269,5 @@ class VRF:
             "RD": self.rd,
             "Name": self.name,
             "Routers: Interfaces": routers_and_ints_data,
-            "Exported to": str(self.route_targets)
+            "Exported to": str(sorted(self.route_targets))
         }
@@ -50,7 +50,7 @@ class XRRouter(Router):
         ]
 
         # Iterate through each area
-        for area_number in self.get_all_areas():
+        for area_number in sorted(self.get_all_areas()):
             self._routing_commands["ospf"].append(f"area {area_number}")
 
             # Iterate through each interface by area number
@@ -69,7 +69,7 @@ class XRRouter(Router):
         self._routing_commands["ospf"].append("exit")
 
     def bgp_routing(self, initialization: bool = False, ibgp_neighbor_ids: Iterable[str] = None,
-                    redistribution_to_egp: bool = False) -> None:
+                    redistribution_to_egp: bool = False, rr_peer_ids: Iterable[str] = None) -> None:
 
         # Step 1/2 is executed from the superclass
         super().bgp_routing(initialization=initialization, ibgp_neighbor_ids=None, redistribution_to_egp=False)
@@ -106,27 +106,20 @@ class XRRouter(Router):
         if ibgp_neighbor_ids is None:
             ibgp_neighbor_ids = []
 
-        # Step 4: Configure neighbor-group
-        def config_ibgp_neighbor_group():
-            neighbor_config_cmd = "!"
-
-            # Route-reflector or provider edge?
-            if self.route_reflector:
-                neighbor_config_cmd = "route-reflector-client"
+        if rr_peer_ids is None:
+            rr_peer_ids = []
 
-            elif self.is_provider_edge():
-                neighbor_config_cmd = "soft-reconfiguration inbound always"
-
-            # Introduce neighbor-group
-            self._bgp_commands["neighbor_group"] = [
-                f"neighbor-group {ibgp_nbrgrp_name()}",
+        # Step 4: Configure neighbor-group
+        def neighbor_group_commands(group_name: str, neighbor_config_cmd: str) -> List[str]:
+            commands = [
+                f"neighbor-group {group_name}",
                 f"remote-as {self.as_number}",
                 f"update-source {self.loopback(0)}"
             ]
 
             # Insert the commands
             if self._any_mpls_interfaces():
-                self._bgp_commands["neighbor_group"].extend(
+                commands.extend(
                     ["address-family ipv4 labeled-unicast",
                      neighbor_config_cmd,
                      "exit",
@@ -136,25 +129,45 @@ class XRRouter(Router):
                 )
 
             else:
-                self._bgp_commands["neighbor_group"].extend(
+                commands.extend(
                     ["address-family ipv4 unicast",
                      neighbor_config_cmd,
                      "exit"]
                 )
 
             # Exit out
-            self._bgp_commands["neighbor_group"].append("exit")
+            commands.append("exit")
+            return commands
+
+        def config_ibgp_neighbor_group():
+            neighbor_config_cmd = "!"
+
+            # Route-reflector or provider edge?
+            if self.route_reflector:
+                neighbor_config_cmd = "route-reflector-client"
+
+            elif self.is_provider_edge():
+                neighbor_config_cmd = "soft-reconfiguration inbound always"
+
+            # Introduce neighbor-group
+            self._bgp_commands["neighbor_group"] = neighbor_group_commands(ibgp_nbrgrp_name(), neighbor_config_cmd)
+
+        # The other route-reflectors are plain IBGP peers, so their updates are not reflected back to them
+        def config_rr_neighbor_group():
+            if "neighbor-group RR_TO_RR" not in self._bgp_commands["neighbor_group"]:
+                self._bgp_commands["neighbor_group"].extend(
+                    neighbor_group_commands("RR_TO_RR", "soft-reconfiguration inbound always"))
 
         # Step 5: Assign neighbors
-        def assign_ibgp_neighbors():
+        def assign_ibgp_neighbors(neighbor_ids: Iterable[str], group_name: str):
             # Assign neighbor group to each adjacent routers to establish neighbor
-            for rtr_id in ibgp_neighbor_ids:
+            for rtr_id in neighbor_ids:
                 if rtr_id not in self.ibgp_adjacent_router_ids:
                     self.ibgp_adjacent_router_ids.add(rtr_id)
 
                     self._bgp_commands["neighbor"].extend([
                         f"neighbor {rtr_id}",
-                        f"use neighbor-group {ibgp_nbrgrp_name()}",
+                        f"use neighbor-group {group_name}",
                         "exit"
                     ])
 
@@ -182,7 +195,10 @@ class XRRouter(Router):
                 address_families()
                 pass_routing_policy()
             if ibgp_neighbor_ids:
-                assign_ibgp_neighbors()
+                assign_ibgp_neighbors(ibgp_neighbor_ids, ibgp_nbrgrp_name())
+            if rr_peer_ids:
+                config_rr_neighbor_group()
+                assign_ibgp_neighbors(rr_peer_ids, "RR_TO_RR")
             if redistribution_to_egp:
                 redistribution_to_external_routes()
             close_out()
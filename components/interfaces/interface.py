@@ -130,6 +130,13 @@ class Interface:
     # Generate Cisco command to advertise OSPF route
     # Goes to router interface
 
+    # Pending (not yet generated) Cisco commands, used when the interface is stored and restored
+    def _pending_commands(self) -> dict[str, dict[str, list[str]]]:
+        return {"cisco": {attr: lines[:] for attr, lines in self._cisco_commands.items()}}
+
+    def _restore_pending_commands(self, pending: dict[str, dict[str, list[str]]]) -> None:
+        self._cisco_commands.update({attr: lines[:] for attr, lines in pending.get("cisco", {}).items()})
+
     # Generates a block of commands
     def generate_config(self):
         # Gets a new list of commands
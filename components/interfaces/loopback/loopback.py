@@ -1,4 +1,4 @@
-from typing import List
+from typing import Callable, List
 
 from components.interfaces.interface import Interface
 
@@ -9,6 +9,7 @@ class Loopback(Interface):
         super().__init__(int_type="Loopback", port=loopback_id, cidr=cidr)
 
         self.config(description=description)
+        self._area_listener: Callable[[Loopback, int | None, int], None] | None = None  # Set by the router
         self.ospf_area = 0
         self.ospf_allow_hellos = False    # Allow hello packets to be sent at fixed intervals
         self.xr_mode = False
@@ -20,6 +21,17 @@ class Loopback(Interface):
         # A separate list of commands for XR configuration for the OSPF configuration
         self.__ospf_xr_commands = []
 
+    @property
+    def ospf_area(self) -> int:
+        return self._ospf_area
+
+    @ospf_area.setter
+    def ospf_area(self, area: int) -> None:
+        # The router keeps its interfaces indexed by area, so it's told about every change
+        old_area, self._ospf_area = getattr(self, "_ospf_area", None), area
+        if self._area_listener is not None and old_area != area:
+            self._area_listener(self, old_area, area)
+
     # OSPF Initialization
     def ospf_config(self, process_id: int, area: int = None, allow_hellos: bool = None) -> None:
         if not (self.ip_address and self.subnet_mask):
@@ -41,6 +53,16 @@ class Loopback(Interface):
                 f"ip ospf {process_id} area {self.ospf_area}"
             ]
 
+    def _pending_commands(self) -> dict[str, dict[str, list[str]]]:
+        pending = super()._pending_commands()
+        pending["ospf_xr"] = {"ospf_xr": self.__ospf_xr_commands[:]}
+
+        return pending
+
+    def _restore_pending_commands(self, pending: dict[str, dict[str, list[str]]]) -> None:
+        super()._restore_pending_commands(pending)
+        self.__ospf_xr_commands = pending.get("ospf_xr", {}).get("ospf_xr", [])[:]
+
     def generate_config(self):
         if self.xr_mode:
             if self._cisco_commands["ip address"]:
@@ -1,6 +1,6 @@
 from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
 from components.interfaces.physical_interfaces.subinterface import SubInterface
-from typing import List, TYPE_CHECKING, Dict
+from typing import Callable, List, TYPE_CHECKING, Dict
 from components.devices.switch.switch import Switch
 from colorama import Fore, Style
 from iptx_utils import NetworkError, print_denied
@@ -18,6 +18,7 @@ class RouterInterface(PhysicalInterface):
         self.xr_mode: bool = False
 
         # OSPF Attributes
+        self._area_listener: Callable[[RouterInterface, int | None, int], None] | None = None  # Set by the router
         self.ospf_process_id: int = 0
         self.ospf_area: int = 0
         self.ospf_p2p: bool = True
@@ -54,6 +55,17 @@ class RouterInterface(PhysicalInterface):
             "mpls_ldp": []
         }
 
+    @property
+    def ospf_area(self) -> int:
+        return self._ospf_area
+
+    @ospf_area.setter
+    def ospf_area(self, area: int) -> None:
+        # The router keeps its interfaces indexed by area, so it's told about every change
+        old_area, self._ospf_area = getattr(self, "_ospf_area", None), area
+        if self._area_listener is not None and old_area != area:
+            self._area_listener(self, old_area, area)
+
     @staticmethod
     def p2p_ip_addresses(network_address: str):
 
@@ -126,6 +138,18 @@ class RouterInterface(PhysicalInterface):
             print_denied("This interface is for routing across autonomous systems "
                          "or configured as VRF, so OSPF cannot be configured")
 
+    def _pending_commands(self) -> Dict[str, Dict[str, List[str]]]:
+        pending = super()._pending_commands()
+        pending["ospf"] = {attr: lines[:] for attr, lines in self.__ospf_commands.items()}
+        pending["pseudo-wire"] = {str(vlan): lines[:] for vlan, lines in self.__pseudowire_commands.items()}
+
+        return pending
+
+    def _restore_pending_commands(self, pending: Dict[str, Dict[str, List[str]]]) -> None:
+        super()._restore_pending_commands(pending)
+        self.__ospf_commands.update({attr: lines[:] for attr, lines in pending.get("ospf", {}).items()})
+        self.__pseudowire_commands = {int(vlan): lines[:] for vlan, lines in pending.get("pseudo-wire", {}).items()}
+
     def ospf_passive_enable(self):
         self.ospf_allow_hellos = False
         if self.xr_mode:
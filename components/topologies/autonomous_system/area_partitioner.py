@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+
+from tabulate import tabulate
+
+from iptx_utils import NetworkError, print_log, print_success, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.backbone import Backbone
+
+BACKBONE_AREA = 0
+
+
+class AreaPlan:
+    def __init__(self, areas: Dict[int, List[str]], link_areas: Dict[Tuple[str, str], int],
+                 abrs: Dict[str, Set[int]]) -> None:
+        self.areas = areas  # Area number -> IDs of the routers in it
+        self.link_areas = link_areas  # (router ID, router ID) -> area of the link
+        self.abrs = abrs  # ID of each area border router -> the non-backbone areas it's attached to
+
+    def area_of(self, router_id: str) -> int:
+        for area, router_ids in self.areas.items():
+            if router_id in router_ids:
+                return area
+
+        raise KeyError(router_id)
+
+    def print_plan(self) -> None:
+        data = [[
+            area,
+            len(router_ids),
+            ", ".join(sorted(abr for abr, abr_areas in self.abrs.items() if area in abr_areas)) or "-"
+        ] for area, router_ids in sorted(self.areas.items())]
+
+        print()
+        print_log("The following OSPF areas have been planned:")
+        print(tabulate(data, headers=["Area", "Routers", "Area Border Routers"]))
+        print()
+
+
+class AreaPartitioner:
+    """
+    Splits the OSPF domain of a backbone into the backbone area and non-backbone areas of at most
+    'max_area_size' routers each, so that the LSDB of every router only holds its own areas.
+
+    The backbone area is grown around the most connected router (or the route-reflector). Every connected part
+    that remains outside of it becomes one non-backbone area, so each area is contiguous and attached to the
+    backbone area. A part that is too large is split into several areas, each grown from one of its routers next
+    to the backbone area. When that can't cover the whole part, the part gives up the router that splits it the
+    most (one of its routers next to the backbone area) to the backbone area and is split again. The backbone
+    routers with links into a non-backbone area are its area border routers.
+
+    Raises a NetworkError when the backbone area can't stay within 'backbone_area_size' routers.
+    """
+
+    def __init__(self, backbone: Backbone, max_area_size: int = 50, backbone_area_size: int = None) -> None:
+        if max_area_size < 1:
+            raise ValueError(f"Invalid maximum area size '{max_area_size}': Must be at least 1")
+
+        self.backbone = backbone
+        self.max_area_size = max_area_size
+        self.backbone_area_size = backbone_area_size if backbone_area_size is not None else max_area_size
+
+        # Internal links between the routers of the AS
+        routers = [router.id() for router in backbone.get_all_routers() if router.as_number == backbone.as_number]
+        self.__adjacency: Dict[str, Set[str]] = {router_id: set() for router_id in routers}
+
+        for device1, device2, data in backbone.get_all_links():
+            if not data.get("external") and device1.id() in self.__adjacency and device2.id() in self.__adjacency:
+                self.__adjacency[device1.id()].add(device2.id())
+                self.__adjacency[device2.id()].add(device1.id())
+
+    def __grow_backbone_area(self) -> Set[str]:
+        # Starting from the route-reflector (or the most connected router), the best connected neighbors first
+        route_reflector = getattr(self.backbone, "route_reflector", None)
+        seed = route_reflector if route_reflector in self.__adjacency else \
+            max(sorted(self.__adjacency), key=lambda router_id: len(self.__adjacency[router_id]))
+
+        backbone_area, heap = set(), [(0, seed)]
+        while heap and len(backbone_area) < self.backbone_area_size:
+            _, router_id = heapq.heappop(heap)
+            if router_id in backbone_area:
+                continue
+
+            backbone_area.add(router_id)
+            for neighbor in self.__adjacency[router_id]:
+                if neighbor not in backbone_area:
+                    heapq.heappush(heap, (-len(self.__adjacency[neighbor]), neighbor))
+
+        return backbone_area
+
+    def __parts(self, router_ids: Set[str], excluded: Set[str]) -> List[Set[str]]:
+        # Connected parts of the given routers, without going through the excluded ones
+        parts, visited = [], set()
+        for start in sorted(router_ids):
+            if start in visited:
+                continue
+
+            part, stack = {start}, [start]
+            visited.add(start)
+            while stack:
+                for neighbor in self.__adjacency[stack.pop()]:
+                    if neighbor in router_ids and neighbor not in excluded and neighbor not in visited:
+                        visited.add(neighbor)
+                        part.add(neighbor)
+                        stack.append(neighbor)
+
+            parts.append(part)
+
+        return parts
+
+    def __split(self, part: Set[str], backbone_area: Set[str]) -> List[Set[str]]:
+        # Areas of at most 'max_area_size' routers, grown in turns from the routers next to the backbone area
+        seeds = sorted((router_id for router_id in part if self.__adjacency[router_id] & backbone_area),
+                       key=lambda router_id: (-len(self.__adjacency[router_id] & part), router_id))
+        if not seeds:
+            return []
+
+        areas = [{seed} for seed in seeds]
+        queues = [sorted(self.__adjacency[seed] & part) for seed in seeds]
+        assigned = set(seeds)
+
+        grown = True
+        while grown:
+            grown = False
+            for area, queue in zip(areas, queues):
+                while queue and len(area) < self.max_area_size:
+                    router_id = queue.pop(0)
+                    if router_id in assigned:
+                        continue
+
+                    area.add(router_id)
+                    assigned.add(router_id)
+                    queue.extend(sorted(self.__adjacency[router_id] & part - assigned))
+                    grown = True
+                    break
+
+        # Only a split which covers the whole part keeps every area attached to the backbone area
+        return areas if assigned == part else []
+
+    def plan(self) -> AreaPlan:
+        if not self.__adjacency:
+            raise NetworkError(f"ERROR in AS_NUM {self.backbone.as_number}: There are no routers to partition")
+
+        backbone_area = self.__grow_backbone_area()
+        outside = set(self.__adjacency) - backbone_area
+
+        # Parts which are too large are split, or else give up one router at a time to the backbone area
+        pending, parts = self.__parts(outside, backbone_area), []
+        while pending:
+            part = pending.pop()
+            if len(part) <= self.max_area_size:
+                parts.append(part)
+                continue
+
+            split = self.__split(part, backbone_area)
+            if split:
+                parts.extend(split)
+                continue
+
+            # The router next to the backbone area with the most neighbors within the part (or in any of the part,
+            # when the part isn't linked to the backbone area at all)
+            border = [router_id for router_id in part if self.__adjacency[router_id] & backbone_area]
+            if not border:
+                print_warning(f"Routers {', '.join(sorted(part))} have no link to the backbone area, so the backbone "
+                              f"area won't be contiguous", prompt=False)
+                border = part
+
+            promoted = max(sorted(border), key=lambda router_id: len(self.__adjacency[router_id] & part))
+
+            backbone_area.add(promoted)
+            part.discard(promoted)
+            pending.extend(self.__parts(part, backbone_area))
+
+        if len(backbone_area) > self.backbone_area_size:
+            raise NetworkError(f"ERROR in AS_NUM {self.backbone.as_number}: The backbone area needs "
+                               f"{len(backbone_area)} routers (more than {self.backbone_area_size}), so that no other "
+                               f"area exceeds {self.max_area_size} routers - Please allow larger areas")
+
+        # Numbered in a stable order, by the lowest router ID of each area
+        areas = {BACKBONE_AREA: sorted(backbone_area)}
+        router_areas = {router_id: BACKBONE_AREA for router_id in backbone_area}
+
+        for number, part in enumerate(sorted(parts, key=min), start=1):
+            areas[number] = sorted(part)
+            router_areas.update({router_id: number for router_id in part})
+
+        # A link belongs to the area of its non-backbone end, so the backbone end becomes an ABR
+        link_areas, abrs = {}, {}
+        for router_id, neighbors in self.__adjacency.items():
+            for neighbor in neighbors:
+                if router_id < neighbor:
+                    area = max(router_areas[router_id], router_areas[neighbor])
+                    link_areas[(router_id, neighbor)] = area
+
+                    if area != BACKBONE_AREA:
+                        for end in (router_id, neighbor):
+                            if router_areas[end] == BACKBONE_AREA:
+                                abrs.setdefault(end, set()).add(area)
+
+        return AreaPlan(areas, link_areas, abrs)
+
+    def apply(self, plan: AreaPlan) -> None:
+        # Sets the area of every interface, before the OSPF configuration is generated
+        if any(self.backbone[router_id]._ospf_configured for router_ids in plan.areas.values()
+               for router_id in router_ids):
+            raise NetworkError(f"ERROR in AS_NUM {self.backbone.as_number}: OSPF has already been configured, so "
+                               f"the areas have to be applied before begin_internal_routing()")
+
+        # The loopbacks and the unused interfaces stay in the area of their router
+        for area, router_ids in plan.areas.items():
+            for router_id in router_ids:
+                for interface in self.backbone[router_id].all_interfaces():
+                    interface.ospf_area = area
+
+        for device1, device2, data in self.backbone.get_all_links():
+            area = plan.link_areas.get((device1.id(), device2.id()), plan.link_areas.get((device2.id(), device1.id())))
+            if area is None:
+                continue
+
+            # The edges are undirected, so the ports are matched against the interfaces of the first device
+            port1, port2 = data["d1_port"], data["d2_port"]
+            if not any(interface.remote_device is device2 and interface.port == port1
+                       for interface in device1.all_phys_interfaces()):
+                port1, port2 = port2, port1
+
+            device1.interface(port1).ospf_area = area
+            device2.interface(port2).ospf_area = area
+
+        print_success(f"AS {self.backbone.as_number}: OSPF split into {len(plan.areas)} areas "
+                      f"with {len(plan.abrs)} area border routers")
+
+    def partition(self) -> AreaPlan:
+        plan = self.plan()
+        self.apply(plan)
+        return plan
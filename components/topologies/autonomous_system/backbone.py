@@ -2,8 +2,9 @@ from components.topologies.topology import Topology, Switch, Router, Edge
 from components.interfaces.physical_interfaces.router_interface import RouterInterface
 from typing import Iterable
 from tabulate import tabulate
+from components.topologies.mutation_journal import journaled
 
-from iptx_utils import NetworkError, print_log, smallest_missing_non_negative_integer, NotFoundError
+from iptx_utils import NetworkError, print_log, smallest_missing_non_negative_integer, NotFoundError, MaxMultiset
 
 
 class Backbone(Topology):
@@ -16,21 +17,26 @@ class Backbone(Topology):
 
         self.name: str = name
         self.reference_bw: int = 1  # Reference bandwidth in M bits/s
+        self.__link_bandwidths = MaxMultiset()  # Bandwidths of all the internal links, in k bits/s
+
+        # SCRs and network addresses which are in use, but whose links are not loaded (see TopologyStore)
+        self._reserved_scrs: set[int] = set()
+        self._reserved_network_addresses: set[str] = set()
 
     def get_link_by_scr(self, scr: int) -> Edge:
-        for edge in self._graph.edges(data=True):
-            if edge[2]['scr'] == scr:
+        for edge in self.get_all_links():
+            if edge[2].get('scr') == scr:
                 return edge
 
         raise IndexError(f"Edge with key '{scr}' not found")
 
     def print_backbone_links(self) -> None:
-        links = sorted(self._graph.edges(data=True), key=lambda link: link[2]["scr"])
+        links = sorted(self.get_all_links(), key=lambda link: link[2]["scr"])
 
         data = [[
             str(link[2]['scr']),
             f"{link[0]} ({link[2]['d1_port']}) ---> {link[1]} ({link[2]['d2_port']})",
-            link[2]['network_address'],
+            link[2].get('network_address'),
             f"{link[2]['bandwidth']}"
         ] for link in links if not link[2]['external']]
 
@@ -42,7 +48,7 @@ class Backbone(Topology):
         print()
 
     def print_client_links(self) -> None:
-        links = sorted(self._graph.edges(data=True), key=lambda link: link[2]["scr"])
+        links = sorted(self.get_all_links(), key=lambda link: link[2]["scr"])
 
         data = [[
             str(link[2]['scr']),
@@ -57,13 +63,29 @@ class Backbone(Topology):
         print(tabulate(data, headers=headers))
         print()
 
-    def __update_reference_bw(self, new_bandwidth: int) -> None:  # new_bandwidth in k bits/s
-        if (new_bandwidth // 1000) > self.reference_bw:
-            self.reference_bw = new_bandwidth // 1000
+    def __update_reference_bw(self, *device_ids: str) -> None:
+        # Takes the device locks by itself, so it must be called without holding any
+        with self._graph_lock:
+            # The reference bandwidth follows the fastest internal link (at least 1 M bits/s)
+            new_reference_bw = max(1, self.__link_bandwidths.max(default=0) // 1000)
+
+            # Only push the change to all the routers if the effective value has actually changed
+            if new_reference_bw != self.reference_bw:
+                self.print_log(f"Reference bandwidth changed from {self.reference_bw} to {new_reference_bw} M bits/s")
+                self.reference_bw = new_reference_bw
+                device_ids = tuple(router.id() for router in self.get_all_routers()
+                                   if router.as_number == self.as_number)
+
+        with self._lock_devices(*device_ids):
+            for device_id in device_ids:
+                # The latest value is pushed, in case another thread has changed it meanwhile
+                self[device_id].update_reference_bw(self.reference_bw)
 
     # Ensures that a unique key is passed. If the number is not given, the smallest missing number is used instead
     def __assign_scr(self, device_id1: str, device_id2: str, number: int = None) -> None:
+        # Called with the graph lock held
         keys = [edge[2]["scr"] for edge in self._graph.edges(data=True) if "scr" in edge[2]]
+        keys.extend(self._reserved_scrs)
 
         # If the number in the parameter is passed
         if number is not None:
@@ -78,50 +100,68 @@ class Backbone(Topology):
 
         self.get_link(device_id1, device_id2)[2]["scr"] = scr
 
+    @journaled
     def assign_network_ip_address(self, network_address: str,
                                   device_id1: str = None, device_id2: str = None,
                                   scr: int = None) -> None:
 
-        # (BKB => Backbone)
-        bkb_network_addresses = [edge[2]["network_address"] for edge in self._graph.edges(data=True)
-                                 if "network_address" in edge[2] and not edge[2]["external"]]
+        # The devices are needed beforehand, for locking them
+        if not (device_id1 and device_id2):
+            if not scr:
+                raise TypeError("Please provide either both device_id1 and device_id2, or just the SCR/key")
 
-        if network_address in bkb_network_addresses:
-            raise NetworkError(f"Network address '{network_address}' is already used in "
-                               f"another network in the backbone.")
+            device1, device2, _ = self.get_link_by_scr(scr)
+            device_id1, device_id2 = device1.id(), device2.id()
+
+        # The check and the assignment of the address happen at once, so two links can't take the same address
+        with self._lock_devices(device_id1, device_id2), self._graph_lock:
+            # (BKB => Backbone)
+            bkb_network_addresses = [edge[2]["network_address"] for edge in self._graph.edges(data=True)
+                                     if "network_address" in edge[2] and not edge[2]["external"]]
+
+            if network_address in bkb_network_addresses or network_address in self._reserved_network_addresses:
+                raise NetworkError(f"Network address '{network_address}' is already used in "
+                                   f"another network in the backbone.")
 
-        # If any parameters are passed
-        if device_id1 and device_id2:
             edge = self.get_link(device_id1, device_id2)
-        elif scr:
-            edge = self.get_link_by_scr(scr)
-        else:
-            raise TypeError("Please provide either both device_id1 and device_id2, or just the SCR/key")
 
-        port1 = edge[2]["d1_port"]
-        port2 = edge[2]["d2_port"]
+            port1 = edge[2]["d1_port"]
+            port2 = edge[2]["d2_port"]
+
+            ip1, ip2 = RouterInterface.p2p_ip_addresses(network_address)
 
-        ip1, ip2 = RouterInterface.p2p_ip_addresses(network_address)
+            # Assign the IP address to Device 1
+            if isinstance(self[device_id1], Router):
+                self[device_id1].interface(port1).config(cidr=ip1)
 
-        # Assign the IP address to Device 1
-        if isinstance(self[device_id1], Router):
-            self[device_id1].interface(port1).config(cidr=ip1)
+            # Assign the IP address to Device 2
+            if isinstance(self[device_id2], Router):
+                self[device_id2].interface(port2).config(cidr=ip2)
 
-        # Assign the IP address to Device 2
-        if isinstance(self[device_id2], Router):
-            self[device_id2].interface(port2).config(cidr=ip2)
+            if isinstance(self[device_id1], Router) or isinstance(self[device_id2], Router):
+                edge[2]["network_address"] = network_address
 
-        if isinstance(self[device_id1], Router) or isinstance(self[device_id2], Router):
-            edge[2]["network_address"] = network_address
+    # Used by the topology store, where only some of the links are loaded into the graph
+    def _restore_link_bandwidths(self, bandwidths: Iterable[int]) -> None:
+        self.__link_bandwidths = MaxMultiset(bandwidths)
+        self.reference_bw = max(1, self.__link_bandwidths.max(default=0) // 1000)
 
+    @journaled
     def connect_devices(self, device_id1: str, port1: str, device_id2: str, port2: str,
                         scr: int = None, cable_bandwidth: int = float('inf')) -> None:
 
-        super().connect_devices(device_id1, port1, device_id2, port2, cable_bandwidth)
+        # The link shows up in the graph along with its SCR (the device locks are only re-entered by the super call)
+        with self._lock_devices(device_id1, device_id2), self._graph_lock:
+            super().connect_devices(device_id1, port1, device_id2, port2, cable_bandwidth)
 
-        # Assign the SCRs
-        self.__assign_scr(device_id1, device_id2, scr)  # This is used to check whether the SCR is already in
+            # Assign the SCRs
+            self.__assign_scr(device_id1, device_id2, scr)  # This is used to check whether the SCR is already in
 
+            # Until the caller says otherwise, a link is external if it leaves the autonomous system
+            self.get_link(device_id1, device_id2)[2]["external"] = \
+                self[device_id1].as_number != self[device_id2].as_number
+
+    @journaled
     def connect_internal_devices(self, device_id1: str, port1: str, device_id2: str, port2: str,
                                  network_address: str = None, scr: int = None,
                                  cable_bandwidth: int = float('inf')) -> None:
@@ -133,59 +173,77 @@ class Backbone(Topology):
             raise NetworkError(f"Unequal AS Numbers for {device_id1} and {device_id2}")
 
         self.print_log(f"Connecting backbone devices {self[device_id1]} to {self[device_id2]}...")
-        self.connect_devices(device_id1, port1, device_id2, port2, scr, cable_bandwidth)
+        with self._lock_devices(device_id1, device_id2):
+            self.connect_devices(device_id1, port1, device_id2, port2, scr, cable_bandwidth)
+
+            # Put in the network IP address
+            self.assign_network_ip_address(network_address, device_id1, device_id2)
+
+            # Enable MPLS to routers, if both the routers are within the same autonomous system
+            self[device_id1].interface(port1).mpls_enable()
+            self[device_id2].interface(port2).mpls_enable()
+
+            # Configure the description for both the interfaces
+            self[device_id1].interface(port1).config(description=f"BACKBONE_P2P_CONN_WITH::{self[device_id2]}")
+            self[device_id2].interface(port2).config(description=f"BACKBONE_P2P_CONN_WITH::{self[device_id1]}")
+
+            with self._graph_lock:
+                # They are internal connections
+                self.get_link(device_id1, device_id2)[2]["external"] = False
+                self.__link_bandwidths.add(self.get_link(device_id1, device_id2)[2]["bandwidth"])
 
-        # Put in the network IP address
-        self.assign_network_ip_address(network_address, device_id1, device_id2)
+        # Update the reference bandwidth (after releasing the device locks, since it may lock all the routers)
+        self.__update_reference_bw(device_id1, device_id2)
 
-        # Update the reference bandwidth
-        new_ref_bandwidth: int = self.get_link(device_id1, device_id2)[2]["bandwidth"]
-        self.__update_reference_bw(new_ref_bandwidth)
-        self[device_id1].reference_bw = self.reference_bw
-        self[device_id2].reference_bw = self.reference_bw
+    @journaled
+    def disconnect_devices(self, device_id1: str, device_id2: str) -> None:
+        with self._lock_devices(device_id1, device_id2), self._graph_lock:
+            link_data = self.get_link(device_id1, device_id2)[2]
+            super().disconnect_devices(device_id1, device_id2)
 
-        # Enable MPLS to routers, if both the routers are within the same autonomous system
-        self[device_id1].interface(port1).mpls_enable()
-        self[device_id2].interface(port2).mpls_enable()
+            self._reserved_scrs.discard(link_data.get("scr"))
+            self._reserved_network_addresses.discard(link_data.get("network_address"))
 
-        # Configure the description for both the interfaces
-        self[device_id1].interface(port1).config(description=f"BACKBONE_P2P_CONN_WITH::{self[device_id2]}")
-        self[device_id2].interface(port2).config(description=f"BACKBONE_P2P_CONN_WITH::{self[device_id1]}")
+            if not link_data.get("external", True):
+                self.__link_bandwidths.discard(link_data["bandwidth"])
 
-        # They are internal connections
-        self.get_link(device_id1, device_id2)[2]["external"] = False
+        # An internal link is gone, so the reference bandwidth might decrease
+        if not link_data.get("external", True):
+            self.__update_reference_bw()
 
+    @journaled
     def connect_client(self, client_device: Router | Switch, client_port: str,
                        bkb_router_id: str | int, bkb_router_port: str, custom_scr: int = None,
                        cable_bandwidth: int = float('inf')):
 
         self.print_log(f"Requesting external connection of Client {str(client_device)} to the backbone...")
 
-        # Add the client to the topology
-        if isinstance(client_device, Router):
-            # First, check if the AS numbers are different or not
-            if client_device.as_number == self[bkb_router_id].as_number:
-                raise NetworkError(f"This is for external routing, so the AS number of the client "
-                                   f"{client_device.as_number} should not match the AS number of the backbone.")
+        with self._lock_devices(bkb_router_id, client_device.id()):
+            # Add the client to the topology
+            if isinstance(client_device, Router):
+                # First, check if the AS numbers are different or not
+                if client_device.as_number == self[bkb_router_id].as_number:
+                    raise NetworkError(f"This is for external routing, so the AS number of the client "
+                                       f"{client_device.as_number} should not match the AS number of the backbone.")
 
-            self.add_router(client_device, is_guest=True)
+                self.add_router(client_device, is_guest=True)
 
-        elif isinstance(client_device, Switch):
-            self.add_switch(client_device)
+            elif isinstance(client_device, Switch):
+                self.add_switch(client_device)
 
-        self.connect_devices(bkb_router_id, bkb_router_port, client_device.id(), client_port, custom_scr,
-                             cable_bandwidth)
+            self.connect_devices(bkb_router_id, bkb_router_port, client_device.id(), client_port, custom_scr,
+                                 cable_bandwidth)
 
-        # Switch the interfaces to EGP on both sides, since it's an external route
-        self[client_device.id()].interface(client_port).egp = True
-        self[bkb_router_id].interface(bkb_router_port).egp = True
-        self.get_link(client_device.id(), bkb_router_id)[2]["external"] = True
+            # Switch the interfaces to EGP on both sides, since it's an external route
+            self[client_device.id()].interface(client_port).egp = True
+            self[bkb_router_id].interface(bkb_router_port).egp = True
+            self.get_link(client_device.id(), bkb_router_id)[2]["external"] = True
 
-        # Configure the description for both the interfaces
-        (self[client_device.id()].interface(client_port)
-         .config(description=f"BACKBONE_CONNECTION_WITH_{self[bkb_router_id]}_AS:{self.as_number}"))
-        (self[bkb_router_id].interface(bkb_router_port)
-         .config(description=f"CLIENT_CONNECTION_WITH::{self[client_device.id()]}"))
+            # Configure the description for both the interfaces
+            (self[client_device.id()].interface(client_port)
+             .config(description=f"BACKBONE_CONNECTION_WITH_{self[bkb_router_id]}_AS:{self.as_number}"))
+            (self[bkb_router_id].interface(bkb_router_port)
+             .config(description=f"CLIENT_CONNECTION_WITH::{self[client_device.id()]}"))
 
     def get_all_client_devices(self) -> list[Router | Switch]:
         return ([device for device in self.get_all_routers() if device.as_number != self.as_number]
@@ -198,10 +256,12 @@ class Backbone(Topology):
 
         raise NotFoundError(f"Client with ID {client_id} not found")
 
+    @journaled
     def begin_internal_routing(self) -> None:
-        for router in self.get_all_routers():
+        routers = [router for router in self.get_all_routers() if router.as_number == self.as_number]
 
-            if router.as_number == self.as_number:
+        with self._lock_devices(*[router.id() for router in routers]):
+            for router in routers:
                 print_log(f"Beginning route in {str(router)}...")
                 router.reference_bw = self.reference_bw
                 router.begin_internal_routing()
@@ -1,26 +1,45 @@
+from components.analysis.pseudowire_paths import LABEL_SIZE, PW_LABELS, Pseudowire, PseudowirePaths
 from components.devices.router.xr_router import XRRouter
 from components.topologies.autonomous_system.backbone import Backbone, Router, RouterInterface
 from components.devices.switch.vlan import VLAN
+from components.topologies.mutation_journal import journaled
 from typing import Iterable
 
 from iptx_utils import print_success
 
 class L2VPNBackbone(Backbone):
-    def __init__(self, as_number: int, name: str, devices: Iterable[Router] = None):
+    def __init__(self, as_number: int, name: str, devices: Iterable[Router] = None, label_headroom: bool = False):
 
         print(f"\n==================== IPTx L2VPN BACKBONE {as_number}: '{name}' ====================\n")
         super().__init__(as_number, name, devices)
         self.__vlans: list[VLAN] = []
         self.__color_index = 0
         self.mtu = 9178
+        self.label_headroom = label_headroom  # Internal links get room for the pseudowire labels on top of the MTU
 
     def get_vlan(self, vlan_id: int) -> VLAN | None:
-        for vlan in self.__vlans:
-            if vlan.vlan_id == vlan_id:
-                return vlan
+        with self._graph_lock:
+            for vlan in self.__vlans:
+                if vlan.vlan_id == vlan_id:
+                    return vlan
 
         return None
 
+    def get_all_vlans(self) -> list[VLAN]:
+        with self._graph_lock:
+            return list(self.__vlans)
+
+    def get_pseudowires(self) -> list[Pseudowire]:
+        # (VLAN ID, gateway router ID, gateway router ID) of every pseudowire
+        return [(vlan.vlan_id, interface1.device_id, interface2.device_id) for vlan in self.get_all_vlans()
+                for interface1, interface2 in vlan.pseudowire_graph.edges()]
+
+    def check_pseudowires(self, payload: int = None) -> bool:
+        # Whether the LSP of every pseudowire fits the payload (the MTU of the backbone) along with its labels
+        # (which the internal links only have room for with the label headroom)
+        return PseudowirePaths(self, payload=payload).validate()
+
+    @journaled
     def add_vlan(self, vlan_id: int, name: str = None, cidr: str = None):
         def get_colour():
             # Helper function for colour picking, to help distinguish between routes
@@ -51,38 +70,50 @@ class L2VPNBackbone(Backbone):
 
             return color
 
-        if self.get_vlan(vlan_id):
-            raise ValueError(f"VLAN {vlan_id} already exists")
+        with self._graph_lock:
+            if self.get_vlan(vlan_id):
+                raise ValueError(f"VLAN {vlan_id} already exists")
 
-        self.__vlans.append(VLAN(vlan_id, name, cidr, get_colour()))
+            self.__vlans.append(VLAN(vlan_id, name, cidr, get_colour()))
         print_success(f"VLAN {vlan_id} with name '{name}' added!")
 
+    @journaled
     def connect_devices(self, device_id1: str, port1: str, device_id2: str, port2: str,
                         scr: int = None, cable_bandwidth: int = float('inf')) -> None:
 
-        super().connect_devices(device_id1, port1, device_id2, port2, scr, cable_bandwidth)
-
-        # Change the MTU
-        interfaces = (self[device_id1].interface(port1), self[device_id2].interface(port2))
-
-        for interface in interfaces:
-            if isinstance(interface, RouterInterface):
-                if interface.xr_mode:
-                    interface.config(mtu=self.mtu + 14)
+        with self._lock_devices(device_id1, device_id2):
+            super().connect_devices(device_id1, port1, device_id2, port2, scr, cable_bandwidth)
+
+            # Change the MTU (with the label headroom, the internal links carry the label stack of the pseudowires
+            # on top of the payload)
+            interfaces = (self[device_id1].interface(port1), self[device_id2].interface(port2))
+            mtu = self.mtu
+            if self.label_headroom and not self.get_link(device_id1, device_id2)[2]["external"]:
+                mtu += PW_LABELS * LABEL_SIZE
+
+            for interface in interfaces:
+                if isinstance(interface, RouterInterface):
+                    if interface.xr_mode:
+                        interface.config(mtu=mtu + 14)
+                    else:
+                        interface.config(mtu=mtu)
                 else:
-                    interface.config(mtu=self.mtu)
-            else:
-                interface.config(mtu=self.mtu)
+                    interface.config(mtu=mtu)
 
+    @journaled
     def establish_pseudowire(self, client_id1: str, client_id2: str, vlan_id: int, vlan_name: str = None,
                              xc_group_name: str = None, p2p_identifier: str = None) -> None:
-        if self.get_vlan(vlan_id) is None:
-            self.add_vlan(vlan_id, vlan_name)
+        with self._graph_lock:
+            if self.get_vlan(vlan_id) is None:
+                self.add_vlan(vlan_id, vlan_name)
 
         interfaces = (self.get_gateway_inf_from_client(client_id1), self.get_gateway_inf_from_client(client_id2))
-        self.get_vlan(vlan_id).establish_pseudowire(*interfaces)
 
-        for interface in interfaces:
-            if isinstance(interface, RouterInterface):
-                if interface.xr_mode:
-                    self[interface.device_id].l2vpn_xc_config(xc_group_name, p2p_identifier)
+        # The VLAN is shared by both the provider edges, so it's changed under the graph lock
+        with self._lock_devices(*[interface.device_id for interface in interfaces]), self._graph_lock:
+            self.get_vlan(vlan_id).establish_pseudowire(*interfaces)
+
+            for interface in interfaces:
+                if isinstance(interface, RouterInterface):
+                    if interface.xr_mode:
+                        self[interface.device_id].l2vpn_xc_config(xc_group_name, p2p_identifier)
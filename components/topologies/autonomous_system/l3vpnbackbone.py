@@ -1,10 +1,15 @@
 from components.topologies.topology import Router, plt
 import networkx as nx
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Tuple
 
+from components.analysis.vpn_reachability import VPNReachability
 from components.topologies.autonomous_system.backbone import Backbone, tabulate, print_log
-from components.devices.router.virtual_route_forwarding import VRF
-from iptx_utils import NetworkError, NotFoundError, print_warning, print_success
+from components.topologies.autonomous_system.rr_placement import RRPlacement, RRPlan
+from components.devices.router.virtual_route_forwarding import VPNPolicy, VRF
+from components.topologies.mutation_journal import journaled
+from iptx_utils import IDAllocator, NetworkError, NotFoundError, print_warning, print_success
+
+POLICY_RT_BASE = 1_000_000  # Route-targets of the VPN policies, well above the RDs of the VRFs
 
 
 class L3VPNBackbone(Backbone):
@@ -20,38 +25,91 @@ class L3VPNBackbone(Backbone):
         else:
             self.route_reflector: str | None = None
 
+        # Route-reflector clusters, which replace the single route-reflector when they're placed
+        self.rr_plan: RRPlan | None = None
+
         # VPN Configuration
         self.__vpn_graph = nx.MultiDiGraph()
-        self.__vrf_index = 0
+        self.__vrfs: Dict[str, VRF] = {}  # VRF ID -> VRF, in the order they were added
+        self.__vrf_ids_by_name: Dict[str, List[str]] = {}
+        self.__rd_allocator = IDAllocator(1)
+        self.__vpn_policies: Dict[str, VPNPolicy] = {}
+        self.__policy_rt_allocator = IDAllocator(POLICY_RT_BASE)
 
         self.__color_index = 0
 
+    @journaled
     def select_route_reflector(self, router_id: str) -> None:
         # Route-reflection is of no use with a single router
         if len([router.id() for router in self.get_all_routers()]) <= 2:
             print_warning("This autonomous system only has one or two routers. So there's no use of route-reflecting")
 
-        # If this autonomous system already has a router
-        if any(router.route_reflector for router in self.get_all_routers()):
-            raise NetworkError(f"This autonomous system already has a route-reflector with ID {self.route_reflector}")
+        with self._lock_devices(router_id), self._graph_lock:
+            # If this autonomous system already has a router
+            if any(router.route_reflector for router in self.get_all_routers()):
+                raise NetworkError(f"This autonomous system already has a route-reflector with ID "
+                                   f"{self.route_reflector}")
 
-        self.route_reflector = router_id
-        self.get_device(router_id).set_as_route_reflector()
+            self.route_reflector = router_id
+            self.get_device(router_id).set_as_route_reflector()
 
         print_success(f"{self.get_device(router_id)} with ID {router_id} chosen as Route-reflector client")
 
+    @journaled
+    def place_route_reflectors(self, clusters: int = 2, redundancy: int = 2,
+                               candidates: Iterable[str] = None) -> RRPlan:
+        # Chooses the route-reflectors of every cluster by their OSPF distance to the provider edges
+        plan = RRPlacement(self, clusters, redundancy, candidates).plan()
+        route_reflector_ids = plan.route_reflectors()
+
+        with self._lock_devices(*route_reflector_ids), self._graph_lock:
+            if any(router.route_reflector for router in self.get_all_routers()):
+                raise NetworkError(f"This autonomous system already has a route-reflector with ID "
+                                   f"{self.route_reflector}")
+
+            for cluster in plan.clusters:
+                for router_id in cluster.route_reflectors:
+                    self[router_id].set_as_route_reflector()
+                    self[router_id].rr_cluster_id = cluster.cluster_id
+
+            # The first route-reflector stays the one that the rest of the backbone refers to
+            self.route_reflector = route_reflector_ids[0]
+            self.rr_plan = plan
+
+        print_success(f"{len(route_reflector_ids)} route-reflectors placed in {len(plan.clusters)} clusters")
+        return plan
+
     def get_all_vrfs(self, name_rd_only: bool = False) -> List[VRF] | List[str]:
-        if name_rd_only:
-            return [vrf_id for vrf_id, data in self.__vpn_graph.nodes(data=True)]
-        else:
-            return [data["node_object"] for vrf_id, data in self.__vpn_graph.nodes(data=True)]
+        with self._graph_lock:
+            if name_rd_only:
+                return list(self.__vrfs.keys())
+            else:
+                return list(self.__vrfs.values())
+
+    def vrf_snapshot(self) -> Tuple[List[str], List[VRF]]:
+        # The IDs of the VRFs and the VRFs themselves, in the same order and from the same point in time
+        with self._graph_lock:
+            return list(self.__vrfs.keys()), list(self.__vrfs.values())
 
     def get_vrf(self, vrf_id: str) -> VRF:
         try:
-            return self.__vpn_graph.nodes[vrf_id]['node_object']
+            with self._graph_lock:
+                return self.__vrfs[vrf_id]
         except KeyError:
             raise NotFoundError(f"VRF with name-rd '{vrf_id}' cannot be found")
 
+    def get_vrf_ids_by_name(self, vrf_name: str) -> List[str]:
+        # Every VRF with the same name (one per route-distinguisher)
+        with self._graph_lock:
+            return list(self.__vrf_ids_by_name.get(vrf_name, []))
+
+    def __index_vrf(self, vrf_id: str, vrf: VRF) -> None:
+        self.__vpn_graph.add_node(node_for_adding=vrf_id, node_object=vrf)
+        self.__vrfs[vrf_id] = vrf
+        self.__vrf_ids_by_name.setdefault(vrf.name, []).append(vrf_id)
+        self.__rd_allocator.reserve(vrf.rd)
+
+    @journaled
     def add_vrf(self, vrf_name: str, router_id: str = None, port: str = None) -> str:
 
         def get_colour():
@@ -83,28 +141,75 @@ class L3VPNBackbone(Backbone):
 
             return color
 
-        rd = len(self.get_all_vrfs(name_rd_only=True)) + 1  # rd = route-distinguisher
-        vrf_id = f"{vrf_name}-{rd}"
-
-        self.__vpn_graph.add_node(node_for_adding=vrf_id,
-                                  node_object=VRF(rd, vrf_name, self.as_number, get_colour()))
+        with self._graph_lock:
+            rd = self.__rd_allocator.allocate()  # rd = route-distinguisher
+            vrf_id = f"{vrf_name}-{rd}"
+            self.__index_vrf(vrf_id, VRF(rd, vrf_name, self.as_number, get_colour()))
 
         if router_id and port:
             self.set_vrf_to_port(f"{vrf_name}-{rd}", router_id, port)
 
         return vrf_id
 
+    @journaled
+    def remove_vrf(self, vrf_id: str) -> None:
+        with self._graph_lock:
+            vrf = self.get_vrf(vrf_id)
+            if vrf.assigned_routers:
+                raise NetworkError(f"ERROR in AS_NUM {self.as_number}: VRF '{vrf_id}' is still assigned to "
+                                   f"{', '.join(str(router) for router in vrf.assigned_routers)}")
+
+            # The VRFs importing its routes stop doing so, before its RD can be given to another VRF
+            for source in list(self.__vpn_graph.predecessors(vrf_id)):
+                if source != vrf_id:
+                    self.get_vrf(source).remove_route_targets(vrf.rd)
+
+            for policy in self.__vpn_policies.values():
+                if vrf_id in policy.members:
+                    policy.members.remove(vrf_id)
+
+            self.__vpn_graph.remove_node(vrf_id)
+            del self.__vrfs[vrf_id]
+            self.__vrf_ids_by_name[vrf.name].remove(vrf_id)
+            if not self.__vrf_ids_by_name[vrf.name]:
+                del self.__vrf_ids_by_name[vrf.name]
+
+            self.__rd_allocator.release(vrf.rd)
+
+        print_success(f"VRF '{vrf_id}' removed")
+
+    def get_route_targets(self) -> List[tuple[str, str]]:
+        # Every (source, destination) pair, where the source VRF imports the routes of the destination VRF
+        with self._graph_lock:
+            return list(self.__vpn_graph.edges())
+
+    # Used by the topology store, to put back a VRF or a route-target without configuring anything
+    def _restore_vrf(self, vrf_id: str, vrf: VRF) -> None:
+        self.__index_vrf(vrf_id, vrf)
+
+    def _reserve_rds(self, rds: Iterable[int]) -> None:
+        # The RDs of the VRFs which haven't been loaded (yet), so they're not handed out again
+        for rd in rds:
+            self.__rd_allocator.reserve(rd)
+
+    def _restore_route_target(self, source: str, destination: str) -> None:
+        if not self.__vpn_graph.has_edge(source, destination):
+            self.__vpn_graph.add_edge(source, destination)
+
+    @journaled
     def set_vrf_to_port(self, vrf_id: str, router_id: str, port: str) -> None:
 
         if self[router_id].as_number != self.as_number:
             raise NetworkError(f"This router with ID {router_id} is not within the AS")
 
-        self.get_vrf(vrf_id).add_router(self[router_id])
-        self.get_vrf(vrf_id).assign_interface(router_id, port)
+        # The VRF is shared by all its routers, so it's changed under the graph lock
+        with self._lock_devices(router_id), self._graph_lock:
+            self.get_vrf(vrf_id).add_router(self[router_id])
+            self.get_vrf(vrf_id).assign_interface(router_id, port)
 
     def print_vrfs(self) -> None:
         # vrfs = sorted(self.__vpn_graph.nodes(data=True))
-        data = [data["node_object"].get_dictionary() for vrf_id, data in self.__vpn_graph.nodes(data=True)]
+        data = [vrf.get_dictionary() for vrf in self.get_all_vrfs()]
 
         # Print the table
         print()
@@ -112,69 +217,84 @@ class L3VPNBackbone(Backbone):
         print(tabulate(data, headers="keys", tablefmt='grid'))
         print()
 
+    @journaled
     def vpn_route_target(self, source: str, destination: str, two_way: bool = False) -> None:
 
         print_log(f"VRF route target {source} ---> {destination}")
-        # Prevent duplicate edges
-        if not self.__vpn_graph.has_edge(source, destination):
-            self.__vpn_graph.add_edge(source, destination)
+        with self._graph_lock:
+            # Prevent duplicate edges
+            if not self.__vpn_graph.has_edge(source, destination):
+                self.__vpn_graph.add_edge(source, destination)
 
-        # Assign the destination RD inside the VRF
-        destination_rd: int = self.get_vrf(destination).rd
-        self.get_vrf(source).set_route_targets(destination_rd)
+            # Assign the destination RD inside the VRF
+            destination_rd: int = self.get_vrf(destination).rd
+            self.get_vrf(source).set_route_targets(destination_rd)
 
         if two_way:
             self.vpn_route_target(destination, source, two_way=False)
 
-
-    # def vpn_two_way_connection(self, vrf1: int | str, vrf2: int | str) -> None:
-    #     # If a name is passed for the VRF 1, take the corresponding RD
-    #     if isinstance(vrf1, str):
-    #         source = self.get_vrf(vrf1)[0]
-    #
-    #     # If a name is passed for the VRF 2, take the corresponding RD
-    #     if isinstance(vrf2, str):
-    #         destination = self.get_vrf(vrf2)[0]
-    #
-    #     # Use the previous function to establish route-targets, but do not print the log
-    #     self.vpn_connection(vrf1, vrf2, allow_log=False)
-    #     self.vpn_connection(vrf2, vrf1, allow_log=False)
-    #
-    #     # Log-printing will be used here
-    #     print_log(f"VRF Route-target: {self.__vpn_graph.nodes[vrf1]['name']} <---> "
-    #               f"{self.__vpn_graph.nodes[vrf2]['name']}", 0)
-    #
-    # def vrf_hub_and_spoke(self, hub: int | str) -> None:
-    #     if isinstance(hub, str):
-    #         hub = self.get_vrf(hub)[0]
-    #
-    #     print_log(f"VRF Hub and spoke confirmed, with {self.__vpn_graph.nodes[hub]['name']} as the hub")
-    #
-    #     for rd in self.__vpn_graph.nodes():
-    #         if rd != hub:
-    #             self.vpn_two_way_connection(hub, rd)
-    #
-    #     print()
-    #
-    # def vrf_full_mesh(self) -> None:
-    #
-    #     print_log(f"VRF Full mesh confirmed")
-    #     edges = list(permutations(self.__vpn_graph.nodes(), 2))
-    #     for src, destination in edges:
-    #         self.vpn_connection(src, destination, allow_log=False)
-    #
-    #     print_log(f"VRF Route-target: ALL <---> ALL", 0)
-    #     print()
-
-    def get_receivers(self, client_id: str):
-        def get_vrf_by_client_id(client_id: str):
-            for link in self._graph.edges(data=True):
-                if link[2]['external'] and link[1].id() == client_id:
-
-                    return link[2]["vrf"]
-
-            return None
-        print(get_vrf_by_client_id(client_id))
+    def __add_vpn_policy(self, name: str | None, kind: str, members: List[str], route_targets: int,
+                         hub: str = None) -> VPNPolicy:
+        # The route-targets are only allocated once the policy is known to be valid
+        if name in self.__vpn_policies:
+            raise NetworkError(f"ERROR in AS_NUM {self.as_number}: VPN policy '{name}' already exists")
+
+        allocated = [self.__policy_rt_allocator.allocate() for _ in range(route_targets)]
+        policy = VPNPolicy(name or f"{kind.upper()}-{allocated[0] - POLICY_RT_BASE}", kind, members, allocated, hub)
+
+        self.__vpn_policies[policy.name] = policy
+        return policy
+
+    @journaled
+    def vrf_full_mesh(self, vrf_ids: Iterable[str] = None, name: str = None) -> str:
+        # Every VRF (or only the given ones) exports and imports the same route-target
+        with self._graph_lock:
+            members = list(vrf_ids) if vrf_ids is not None else self.get_all_vrfs(name_rd_only=True)
+            vrfs = [self.get_vrf(vrf_id) for vrf_id in members]
+
+            policy = self.__add_vpn_policy(name, "full-mesh", members, 1)
+            route_target = policy.route_targets[0]
+
+            for vrf in vrfs:
+                vrf.set_export_targets(route_target)
+                vrf.set_route_targets(route_target)
+
+        print_log(f"VRF Full mesh confirmed for {len(members)} VRFs, with route-target {self.as_number}:{route_target}")
+        return policy.name
+
+    @journaled
+    def vrf_hub_and_spoke(self, hub: str, spoke_vrf_ids: Iterable[str] = None, name: str = None) -> str:
+        # The hub imports the route-target of the spokes, and the spokes only import the one of the hub
+        with self._graph_lock:
+            spokes = [vrf_id for vrf_id in (spoke_vrf_ids if spoke_vrf_ids is not None
+                                            else self.get_all_vrfs(name_rd_only=True)) if vrf_id != hub]
+            hub_vrf, spoke_vrfs = self.get_vrf(hub), [self.get_vrf(vrf_id) for vrf_id in spokes]
+
+            policy = self.__add_vpn_policy(name, "hub-and-spoke", spokes, 2, hub)
+            hub_rt, spoke_rt = policy.route_targets
+
+            hub_vrf.set_export_targets(hub_rt)
+            hub_vrf.set_route_targets(spoke_rt)
+            for vrf in spoke_vrfs:
+                vrf.set_export_targets(spoke_rt)
+                vrf.set_route_targets(hub_rt)
+
+        print_log(f"VRF Hub and spoke confirmed, with {hub} as the hub of {len(spokes)} spokes")
+        return policy.name
+
+    def get_vpn_policies(self) -> List[VPNPolicy]:
+        with self._graph_lock:
+            return list(self.__vpn_policies.values())
+
+    # Used by the topology store
+    def _restore_vpn_policy(self, policy: VPNPolicy) -> None:
+        self.__vpn_policies[policy.name] = policy
+        for route_target in policy.route_targets:
+            self.__policy_rt_allocator.reserve(route_target)
+
+    def get_receivers(self, client_id: str) -> List[str]:
+        # The IDs of the other clients that this client can reach through its VRF
+        return VPNReachability(self).reachable_sites(client_id)
 
     def show_vpn_graph(self) -> None:
         pos = nx.spring_layout(self.__vpn_graph)  # Positions for all nodes
@@ -184,6 +304,7 @@ class L3VPNBackbone(Backbone):
                 width = 2, node_size = 1000)
         plt.show()
 
+    @journaled
     def connect_client(self, client_device: Router, client_port: str,
                        bkb_router_id: str, bkb_router_port: str, cable_bandwidth: int = float('inf'),
                        custom_scr: int = None, network_address: str = None, new_vrf: str = None,
@@ -193,44 +314,47 @@ class L3VPNBackbone(Backbone):
         if not (new_vrf or existing_vrf_id):
             raise TypeError("Missing parameters for either 'new_vrf' or 'existing_vrf': VRF is required!")
 
-        super().connect_client(client_device, client_port, bkb_router_id, bkb_router_port, custom_scr, cable_bandwidth)
+        with self._lock_devices(bkb_router_id, client_device.id()):
+            super().connect_client(client_device, client_port, bkb_router_id, bkb_router_port, custom_scr, cable_bandwidth)
 
-        # Network Address Assignment
-        self.assign_network_ip_address(network_address, bkb_router_id, client_device.id())
+            # Network Address Assignment
+            self.assign_network_ip_address(network_address, bkb_router_id, client_device.id())
 
-        # VRF Assignment
-        vrf: str = "Unknown"
+            # VRF Assignment
+            vrf: str = "Unknown"
 
-        if new_vrf is not None:
-            vrf = self.add_vrf(new_vrf, bkb_router_id, bkb_router_port)
-        elif existing_vrf_id is not None:
-            vrf = existing_vrf_id
-            self.set_vrf_to_port(vrf, bkb_router_id, bkb_router_port)
+            if new_vrf is not None:
+                vrf = self.add_vrf(new_vrf, bkb_router_id, bkb_router_port)
+            elif existing_vrf_id is not None:
+                vrf = existing_vrf_id
+                self.set_vrf_to_port(vrf, bkb_router_id, bkb_router_port)
 
-        self.get_link(client_device.id(), bkb_router_id)[2]["vrf"] = vrf
-        self[client_device.id()].node_color = self.get_vrf(vrf).color
+            self.get_link(client_device.id(), bkb_router_id)[2]["vrf"] = vrf
+            self[client_device.id()].node_color = self.get_vrf(vrf).color
 
-        # Static or dynamic
-        self[client_device.id()].interface(client_port).static_routing = static_routing
-        self[bkb_router_id].interface(bkb_router_port).static_routing = static_routing
-        self.get_link(client_device.id(), bkb_router_id)[2]["static_routing"] = static_routing
+            # Static or dynamic
+            self[client_device.id()].interface(client_port).static_routing = static_routing
+            self[bkb_router_id].interface(bkb_router_port).static_routing = static_routing
+            self.get_link(client_device.id(), bkb_router_id)[2]["static_routing"] = static_routing
 
-        # Client routing configuration
-        self[client_device.id()].client_connection_routing(client_port)
+            # Client routing configuration
+            self[client_device.id()].client_connection_routing(client_port)
 
-        # Update client description
-        (self[bkb_router_id].interface(bkb_router_port)
-         .config(description=f"CLIENT_{vrf}::CONNECTION_WITH_{self[client_device.id()]}"))
+            # Update client description
+            (self[bkb_router_id].interface(bkb_router_port)
+             .config(description=f"CLIENT_{vrf}::CONNECTION_WITH_{self[client_device.id()]}"))
 
+    @journaled
     def clear_vrf_setup_commands(self) -> None:
-        for vrf in self.get_all_vrfs():
-            vrf.clear_setup_cmd()
+        with self._graph_lock:
+            for vrf in self.get_all_vrfs():
+                vrf.clear_setup_cmd()
 
     def print_client_links(self) -> None:
         def bool_to_str(bool_value: bool) -> str:
             return "Static" if bool_value else "Dynamic"
 
-        links = sorted(self._graph.edges(data=True), key=lambda link: link[2]["scr"])
+        links = sorted(self.get_all_links(), key=lambda link: link[2]["scr"])
 
         data = [[
             str(link[2]['scr']),
@@ -248,21 +372,58 @@ class L3VPNBackbone(Backbone):
         print(tabulate(data, headers=headers))
         print()
 
+    @journaled
     def begin_bgp_routing(self) -> None:
         provider_edges = [router for router in self.get_all_routers() if router.as_number == self.as_number
                           and router.is_provider_edge() and not router.route_reflector]
 
-        print_log(f"Beginning BGP routing in {self[self.route_reflector]}...")
-        self.get_device(self.route_reflector).bgp_routing(
-            initialization=True,
-            ibgp_neighbor_ids=[router.id() for router in provider_edges],
-            redistribution_to_egp=True
-        )
+        if self.rr_plan is not None:
+            self.__begin_clustered_bgp_routing(provider_edges)
+            return
 
-        for router in provider_edges:
-            print_log(f"Beginning BGP routing in {router}...")
-            router.bgp_routing(
+        with self._lock_devices(self.route_reflector, *[router.id() for router in provider_edges]):
+            print_log(f"Beginning BGP routing in {self[self.route_reflector]}...")
+            self.get_device(self.route_reflector).bgp_routing(
                 initialization=True,
-                ibgp_neighbor_ids=[self.route_reflector],
+                ibgp_neighbor_ids=[router.id() for router in provider_edges],
                 redistribution_to_egp=True
             )
+
+            for router in provider_edges:
+                print_log(f"Beginning BGP routing in {router}...")
+                router.bgp_routing(
+                    initialization=True,
+                    ibgp_neighbor_ids=[self.route_reflector],
+                    redistribution_to_egp=True
+                )
+
+    def __begin_clustered_bgp_routing(self, provider_edges: List[Router]) -> None:
+        # Every client peers with all the route-reflectors of its cluster, and the route-reflectors are fully meshed
+        route_reflector_ids = self.rr_plan.route_reflectors()
+        planned = {router_id for cluster in self.rr_plan.clusters for router_id in cluster.clients}
+        new_clients = [router.id() for router in provider_edges if router.id() not in planned]
+        if new_clients:
+            self.rr_plan.add_clients(self, new_clients)
+
+        clusters = {router.id(): self.rr_plan.cluster_of(router.id()) for router in provider_edges}
+
+        with self._lock_devices(*route_reflector_ids, *clusters.keys()):
+            for cluster in self.rr_plan.clusters:
+                clients = [router_id for router_id, client_cluster in clusters.items() if client_cluster is cluster]
+
+                for router_id in cluster.route_reflectors:
+                    print_log(f"Beginning BGP routing in {self[router_id]} (cluster {cluster.cluster_id})...")
+                    self[router_id].bgp_routing(
+                        initialization=True,
+                        ibgp_neighbor_ids=clients,
+                        redistribution_to_egp=True,
+                        rr_peer_ids=[peer_id for peer_id in route_reflector_ids if peer_id != router_id]
+                    )
+
+            for router in provider_edges:
+                print_log(f"Beginning BGP routing in {router}...")
+                router.bgp_routing(
+                    initialization=True,
+                    ibgp_neighbor_ids=clusters[router.id()].route_reflectors,
+                    redistribution_to_egp=True
+                )
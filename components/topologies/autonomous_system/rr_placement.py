@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from typing import Iterable, List, TYPE_CHECKING
+
+import numpy as np
+from tabulate import tabulate
+
+from components.analysis.spf import SPFEngine, topology_snapshot
+from iptx_utils import NetworkError, NotFoundError, print_log
+
+if TYPE_CHECKING:
+    from components.topologies.autonomous_system.backbone import Backbone
+
+UNREACHABLE = 1 << 40  # Distance used for the clients which can't reach a candidate, so it's never picked for them
+MAX_ITERATIONS = 100
+
+
+class RRCluster:
+    def __init__(self, cluster_id: str, route_reflectors: List[str], clients: List[str]) -> None:
+        self.cluster_id = cluster_id  # The ID of the first route-reflector, shared by the redundant ones
+        self.route_reflectors = route_reflectors
+        self.clients = clients  # IDs of the provider edges
+
+
+class RRPlan:
+    def __init__(self, clusters: List[RRCluster]) -> None:
+        self.clusters = clusters
+
+    def route_reflectors(self) -> List[str]:
+        return [router_id for cluster in self.clusters for router_id in cluster.route_reflectors]
+
+    def cluster_of(self, router_id: str) -> RRCluster:
+        # The cluster of a client or of a route-reflector
+        for cluster in self.clusters:
+            if router_id in cluster.clients or router_id in cluster.route_reflectors:
+                return cluster
+
+        raise NotFoundError(f"Router with ID '{router_id}' is not in any route-reflector cluster")
+
+    def add_clients(self, backbone: Backbone, client_ids: Iterable[str], engine: SPFEngine = None) -> None:
+        # Provider edges onboarded after the placement join the cluster of the closest medoid (the first
+        # route-reflector), by the same OSPF distance as the placement, without moving any route-reflector
+        engine = engine if engine is not None else SPFEngine(*topology_snapshot(backbone))
+        trees = [engine.reverse_tree(cluster.cluster_id) for cluster in self.clusters]
+
+        for client_id in client_ids:
+            distances = [tree.distances.get(client_id, UNREACHABLE) for tree in trees]
+            cluster = self.clusters[int(np.argmin(distances))]
+            cluster.clients.append(client_id)
+            print_log(f"Router with ID {client_id} added to the route-reflector cluster {cluster.cluster_id}")
+
+    def print_plan(self) -> None:
+        data = [[
+            cluster.cluster_id,
+            ", ".join(cluster.route_reflectors),
+            len(cluster.clients)
+        ] for cluster in self.clusters]
+
+        print()
+        print_log("The following route-reflector clusters have been planned:")
+        print(tabulate(data, headers=["Cluster ID", "Route-reflectors", "Clients"]))
+        print()
+
+
+class RRPlacement:
+    """
+    Places the route-reflectors of a backbone in 'clusters' clusters of 'redundancy' route-reflectors each, so that
+    the provider edges are as close as possible (by the OSPF cost) to the route-reflectors of their cluster.
+
+    The first route-reflector of each cluster is chosen as a k-medoid: the provider edges are assigned to their
+    closest medoid, and each medoid is moved to the candidate with the lowest total distance to its clients, until
+    nothing changes. The redundant route-reflectors are the next best candidates for the same clients.
+
+    By default, the candidates are the routers which are not provider edges (or every router, if there are none).
+    """
+
+    def __init__(self, backbone: Backbone, clusters: int = 2, redundancy: int = 2,
+                 candidates: Iterable[str] = None, engine: SPFEngine = None) -> None:
+        if clusters < 1 or redundancy < 1:
+            raise ValueError(f"Invalid number of clusters '{clusters}' or redundancy '{redundancy}': "
+                             f"Must be at least 1")
+
+        self.backbone = backbone
+        self.clusters = clusters
+        self.redundancy = redundancy
+        self.engine = engine if engine is not None else SPFEngine(*topology_snapshot(backbone))
+
+        routers = [router for router in backbone.get_all_routers() if router.as_number == backbone.as_number]
+        self.__clients = [router.id() for router in routers if router.is_provider_edge()]
+
+        if candidates is not None:
+            self.__candidates = list(candidates)
+        else:
+            self.__candidates = [router.id() for router in routers if not router.is_provider_edge()] or \
+                                [router.id() for router in routers]
+
+    def __distances(self) -> np.ndarray:
+        # Candidate x client: the OSPF cost from the client to the candidate
+        distances = np.full((len(self.__candidates), len(self.__clients)), UNREACHABLE, dtype=np.int64)
+        for row, candidate in enumerate(self.__candidates):
+            tree = self.engine.reverse_tree(candidate)
+            for column, client in enumerate(self.__clients):
+                if client in tree.distances:
+                    distances[row, column] = tree.distances[client]
+
+        return distances
+
+    def plan(self) -> RRPlan:
+        as_number = self.backbone.as_number
+        if not self.__clients:
+            raise NetworkError(f"ERROR in AS_NUM {as_number}: There are no provider edges to be clients")
+
+        if len(self.__candidates) < self.clusters * self.redundancy:
+            raise NetworkError(f"ERROR in AS_NUM {as_number}: {self.clusters} clusters of {self.redundancy} "
+                               f"route-reflectors need {self.clusters * self.redundancy} candidates, "
+                               f"but there are only {len(self.__candidates)}")
+
+        distances = self.__distances()
+        clusters = min(self.clusters, len(self.__clients))
+
+        # Starting medoids: each one is the candidate that lowers the total distance the most (greedy BUILD)
+        medoids: List[int] = []
+        closest = np.full(len(self.__clients), UNREACHABLE, dtype=np.int64)
+        for _ in range(clusters):
+            costs = np.minimum(distances, closest).sum(axis=1)
+            costs[medoids] = np.iinfo(np.int64).max
+            medoids.append(int(np.argmin(costs)))
+            closest = np.minimum(closest, distances[medoids[-1]])
+
+        # Each client goes to its closest medoid, and each medoid moves to the best candidate for its clients
+        for _ in range(MAX_ITERATIONS):
+            assignment = np.argmin(distances[medoids], axis=0)
+
+            new_medoids = []
+            for number in range(clusters):
+                costs = distances[:, assignment == number].sum(axis=1)
+                costs[new_medoids] = np.iinfo(np.int64).max
+                new_medoids.append(int(np.argmin(costs)))
+
+            if new_medoids == medoids:
+                break
+
+            medoids = new_medoids
+
+        # The redundant route-reflectors of each cluster are the next best candidates for its clients
+        chosen, plan_clusters = set(medoids), []
+        for number, medoid in enumerate(medoids):
+            costs = distances[:, assignment == number].sum(axis=1)
+            route_reflectors = [medoid]
+
+            for candidate in np.argsort(costs, kind="stable"):
+                if len(route_reflectors) == self.redundancy:
+                    break
+                if int(candidate) not in chosen:
+                    chosen.add(int(candidate))
+                    route_reflectors.append(int(candidate))
+
+            route_reflector_ids = [self.__candidates[index] for index in route_reflectors]
+            clients = [self.__clients[index] for index in np.flatnonzero(assignment == number)]
+            plan_clusters.append(RRCluster(route_reflector_ids[0], route_reflector_ids, clients))
+
+        # A provider edge that has become a route-reflector is not a client anymore
+        route_reflector_ids = {self.__candidates[index] for index in chosen}
+        for cluster in plan_clusters:
+            cluster.clients = [client for client in cluster.clients if client not in route_reflector_ids]
+
+        return RRPlan(plan_clusters)
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from tabulate import tabulate
+
+from components.devices.router.router import Router
+from components.interfaces.physical_interfaces.router_interface import RouterInterface
+from components.topologies.autonomous_system.backbone import Backbone
+from iptx_utils import NetworkError, NotFoundError, print_log, print_success
+
+# Requests sent to a shard worker
+CALL = "call"  # Method of the backbone
+DEVICE_CALL = "device"  # Method of a device in the backbone
+RUN = "run"  # Module-level function, called with the backbone as the first argument
+STOP = "stop"
+
+
+# ******************************** WORKER SIDE ********************************
+def _device_ids(backbone: Backbone) -> List[str]:
+    return [device.id() for device in backbone.get_all_devices()]
+
+
+def _link_rows(backbone: Backbone, external: bool) -> List[Dict[str, Any]]:
+    # Plain data of the links, since the links themselves hold the whole graph of devices
+    rows = []
+    for device1, device2, data in backbone.get_all_links():
+        if bool(data.get("external")) != external:
+            continue
+
+        rows.append({
+            "scr": data.get("scr"),
+            "link": f"{device1} ({data['d1_port']}) ---> {device2} ({data['d2_port']})",
+            "network_address": data.get("network_address"),
+            "vrf": data.get("vrf"),
+            "bandwidth": data.get("bandwidth")
+        })
+
+    return rows
+
+
+def _render_all(backbone: Backbone) -> Dict[str, List[str]]:
+    return {device.id(): device.generate_script() for device in backbone.get_all_devices()
+            if device.as_number == backbone.as_number}
+
+
+def _interface_spec(backbone: Backbone, device_id: str, port: str) -> Dict[str, Any]:
+    device = backbone[device_id]
+    return {
+        "device_id": device_id,
+        "hostname": device.hostname,
+        "as_number": device.as_number,
+        "port": port,
+        "int_type": device.interface(port).int_type
+    }
+
+
+def _connect_remote_shard(backbone: Backbone, local_id: str, local_port: str, remote: Dict[str, Any],
+                          network_address: str, first: bool) -> None:
+    # The router of the other shard is represented in this shard by a client router with just the connected port
+    stand_in = Router(router_id=remote["device_id"], hostname=remote["hostname"],
+                      interfaces=[RouterInterface(remote["int_type"], remote["port"])])
+    stand_in.as_number = remote["as_number"]
+
+    # The plain external connection (without any VRF), since the link belongs to both shards
+    Backbone.connect_client(backbone, stand_in, remote["port"], local_id, local_port)
+
+    # Both ends use the same /30, so the first end of the link takes the first address
+    ip1, ip2 = RouterInterface.p2p_ip_addresses(network_address)
+    backbone[local_id].interface(local_port).config(cidr=ip1 if first else ip2)
+    stand_in.interface(remote["port"]).config(cidr=ip2 if first else ip1)
+
+    link_data = backbone.get_link(local_id, remote["device_id"])[2]
+    link_data["network_address"] = network_address
+    link_data.setdefault("vrf", None)
+    link_data.setdefault("static_routing", False)
+    link_data["inter_shard"] = True
+
+
+def _shard_worker(connection: Connection, factory: Callable[..., Backbone], args: tuple, kwargs: dict) -> None:
+    try:
+        backbone = factory(*args, **kwargs)
+    except Exception as error:
+        connection.send(("error", error))
+        return
+
+    device_ids = _device_ids(backbone)
+    connection.send(("ok", device_ids))
+
+    while True:
+        request = connection.recv()
+        if request[0] == STOP:
+            break
+
+        try:
+            if request[0] == CALL:
+                _, method_name, call_args, call_kwargs = request
+                result = getattr(backbone, method_name)(*call_args, **call_kwargs)
+
+            elif request[0] == DEVICE_CALL:
+                _, device_id, method_name, call_args, call_kwargs = request
+                result = getattr(backbone[device_id], method_name)(*call_args, **call_kwargs)
+
+            else:
+                _, function, call_args, call_kwargs = request
+                result = function(backbone, *call_args, **call_kwargs)
+
+        except Exception as error:
+            status, result = "error", error
+        else:
+            status = "ok"
+
+        # The routing table of the federation is refreshed whenever the devices have changed (added, removed or
+        # given another ID), even by a call which failed halfway
+        current_ids = _device_ids(backbone)
+        connection.send((status, result, current_ids if current_ids != device_ids else None))
+        device_ids = current_ids
+
+
+# ******************************** FEDERATION ********************************
+class _Shard:
+    def __init__(self, name: str, process: multiprocessing.Process, connection: Connection) -> None:
+        self.name = name
+        self.process = process
+        self.connection = connection
+
+
+class BackboneFederation:
+    """
+    Runs each Backbone (e.g. one per region or AS) as a shard in its own worker process, so the operations on
+    different shards run on different cores. Calls are routed to the right shard by device ID.
+
+    The shards are built inside their workers by a factory (which has to be a module-level function), and only
+    plain data travels between the processes - the results of the calls should not be devices or links.
+    """
+
+    def __init__(self) -> None:
+        self.__shards: Dict[str, _Shard] = {}
+        self.__device_shards: Dict[str, str] = {}  # Device ID -> name of the shard
+        self.__context = multiprocessing.get_context()
+
+    def __enter__(self) -> BackboneFederation:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __update_devices(self, shard_name: str, device_ids: Iterable[str]) -> None:
+        for device_id in [d_id for d_id, name in self.__device_shards.items() if name == shard_name]:
+            del self.__device_shards[device_id]
+
+        for device_id in device_ids:
+            # Stand-ins for the routers of other shards don't belong to this shard
+            self.__device_shards.setdefault(device_id, shard_name)
+
+    def __response(self, shard: _Shard) -> Tuple[str, Any]:
+        # The status ("ok" or "error") and the result (or the error) of the last call sent to the shard
+        status, result, device_ids = shard.connection.recv()
+        if device_ids is not None:
+            self.__update_devices(shard.name, device_ids)
+
+        return status, result
+
+    def __receive(self, shard: _Shard) -> Any:
+        status, result = self.__response(shard)
+        if status == "error":
+            raise result
+
+        return result
+
+    def __receive_all(self) -> Dict[str, Any]:
+        # Every shard is answered before anything is raised, or the unread answers would be taken for the answers
+        # of the next calls
+        responses = {shard.name: self.__response(shard) for shard in self.__shards.values()}
+        errors = {name: result for name, (status, result) in responses.items() if status == "error"}
+
+        if len(errors) == 1:
+            raise next(iter(errors.values()))
+        if errors:
+            details = "; ".join(f"'{name}': {type(error).__name__}: {error}" for name, error in errors.items())
+            raise NetworkError(f"ERROR in {len(errors)} shards - {details}") from next(iter(errors.values()))
+
+        return {name: result for name, (_, result) in responses.items()}
+
+    def __shard(self, shard_name: str) -> _Shard:
+        try:
+            return self.__shards[shard_name]
+        except KeyError:
+            raise NotFoundError(f"Shard '{shard_name}' not found in the federation")
+
+    # ******************************** SHARDS ********************************
+    def add_shards(self, factories: Dict[str, Tuple[Callable[..., Backbone], tuple]]) -> None:
+        # Starts all the workers first, and then waits for them, so that the shards are built in parallel
+        started = []
+        for shard_name, (factory, args) in factories.items():
+            if shard_name in self.__shards:
+                raise NetworkError(f"Shard '{shard_name}' already exists in the federation")
+
+            parent_connection, child_connection = self.__context.Pipe()
+            process = self.__context.Process(target=_shard_worker, name=f"shard-{shard_name}",
+                                             args=(child_connection, factory, args, {}), daemon=True)
+            process.start()
+            started.append(_Shard(shard_name, process, parent_connection))
+
+        for shard in started:
+            response = shard.connection.recv()
+            if response[0] == "error":
+                shard.process.join()
+                raise response[1]
+
+            self.__shards[shard.name] = shard
+            self.__update_devices(shard.name, response[1])
+            print_success(f"Shard '{shard.name}' started with {len(response[1])} devices")
+
+    def add_shard(self, shard_name: str, factory: Callable[..., Backbone], *args: Any) -> None:
+        self.add_shards({shard_name: (factory, args)})
+
+    def shard_names(self) -> List[str]:
+        return list(self.__shards.keys())
+
+    def shard_of(self, device_id: str) -> str:
+        try:
+            return self.__device_shards[device_id]
+        except KeyError:
+            raise NotFoundError(f"Device with ID '{device_id}' not found in any shard")
+
+    def close(self) -> None:
+        for shard in self.__shards.values():
+            shard.connection.send((STOP,))
+            shard.process.join()
+            shard.connection.close()
+
+        self.__shards.clear()
+        self.__device_shards.clear()
+
+    # ******************************** CALLS ********************************
+    def call(self, shard_name: str, method_name: str, *args: Any, **kwargs: Any) -> Any:
+        # Calls a method of the backbone in the given shard
+        shard = self.__shard(shard_name)
+        shard.connection.send((CALL, method_name, args, kwargs))
+        return self.__receive(shard)
+
+    def route(self, device_id: str, method_name: str, *args: Any, **kwargs: Any) -> Any:
+        # Calls a method of the backbone that holds the given device
+        return self.call(self.shard_of(device_id), method_name, *args, **kwargs)
+
+    def device_call(self, device_id: str, method_name: str, *args: Any, **kwargs: Any) -> Any:
+        # Calls a method of the device itself, e.g. generate_script()
+        shard = self.__shard(self.shard_of(device_id))
+        shard.connection.send((DEVICE_CALL, device_id, method_name, args, kwargs))
+        return self.__receive(shard)
+
+    def run(self, shard_name: str, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        # Runs a module-level function with the backbone of the shard as the first argument
+        shard = self.__shard(shard_name)
+        shard.connection.send((RUN, function, args, kwargs))
+        return self.__receive(shard)
+
+    def run_all(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        # Same as run(), but on every shard in parallel
+        for shard in self.__shards.values():
+            shard.connection.send((RUN, function, args, kwargs))
+
+        return self.__receive_all()
+
+    def broadcast(self, method_name: str, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        # Calls a method of the backbone on every shard in parallel
+        for shard in self.__shards.values():
+            shard.connection.send((CALL, method_name, args, kwargs))
+
+        return self.__receive_all()
+
+    # ******************************** INTER-SHARD LINKS ********************************
+    def connect_inter_shard(self, device_id1: str, port1: str, device_id2: str, port2: str,
+                            network_address: str) -> None:
+        shard1, shard2 = self.shard_of(device_id1), self.shard_of(device_id2)
+        if shard1 == shard2:
+            raise NetworkError(f"Devices {device_id1} and {device_id2} are in the same shard '{shard1}'")
+
+        print_log(f"Connecting {device_id1} in '{shard1}' to {device_id2} in '{shard2}'...")
+        spec1 = self.run(shard1, _interface_spec, device_id1, port1)
+        spec2 = self.run(shard2, _interface_spec, device_id2, port2)
+
+        if spec1["as_number"] == spec2["as_number"]:
+            raise NetworkError(f"Shards '{shard1}' and '{shard2}' have the same AS number {spec1['as_number']}, "
+                               f"so they cannot be connected as external neighbors")
+
+        # Each shard represents the other end with a stand-in router
+        self.run(shard1, _connect_remote_shard, device_id1, port1, spec2, network_address, True)
+        self.run(shard2, _connect_remote_shard, device_id2, port2, spec1, network_address, False)
+
+    # ******************************** REPORTS ********************************
+    def render_all(self) -> Dict[str, List[str]]:
+        # Configuration scripts of every backbone router, rendered by all the shards in parallel
+        scripts = {}
+        for shard_scripts in self.run_all(_render_all).values():
+            scripts.update(shard_scripts)
+
+        return scripts
+
+    def __print_links(self, external: bool, message: str) -> None:
+        data = []
+        for shard_name, rows in self.run_all(_link_rows, external).items():
+            data.extend([shard_name, str(row["scr"]), row["link"], row["network_address"], row["vrf"],
+                         row["bandwidth"]] for row in rows)
+
+        data.sort(key=lambda row: (row[0], int(row[1]) if row[1] != "None" else -1))
+        headers = ["Shard", "SCR", "Source/Destination", "Network Address", "VRF", "Bandwidth (KB/s)"]
+
+        print()
+        print_log(message)
+        print(tabulate(data, headers=headers))
+        print()
+
+    def print_backbone_links(self) -> None:
+        self.__print_links(False, "The following connections have been recognized within the federation:")
+
+    def print_client_links(self) -> None:
+        self.__print_links(True, "The following external connections have been acknowledged by the federation:")
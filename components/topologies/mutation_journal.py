@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import functools
+import io
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Callable, Iterator, List, Tuple, TYPE_CHECKING
+
+from iptx_utils import NotFoundError, print_log, print_warning
+
+if TYPE_CHECKING:
+    from components.topologies.topology import Topology
+    from components.topologies.topology_store import TopologyStore
+
+# File header: magic number and the sequence number of the checkpoint the journal continues from
+JOURNAL_MAGIC = b"IPTXJRN1"
+HEADER = struct.Struct("<8sQ")
+
+# Entry header: sequence number, payload length, CRC32 of the payload, flags
+ENTRY = struct.Struct("<QIIB")
+FLAG_COMPRESSED = 0x01
+COMPRESSION_THRESHOLD = 256  # Payloads larger than this (in bytes) are compressed
+
+JournalEntry = Tuple[int, str, tuple, dict]  # (sequence number, method name, args, kwargs)
+RawEntry = Tuple[int, bytes]  # (sequence number, uncompressed payload)
+
+
+class _CallPickler(pickle.Pickler):
+    # Devices which are already in the topology are stored by their ID, instead of the whole connected graph
+    def __init__(self, file, topology: Topology) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__device_ids = {id(device): device.id() for device in topology.get_all_devices()}
+
+    def persistent_id(self, obj):
+        if id(obj) in self.__device_ids:
+            return "device", self.__device_ids[id(obj)]
+
+        return None
+
+
+class _CallUnpickler(pickle.Unpickler):
+    def __init__(self, file, topology: Topology | None) -> None:
+        super().__init__(file)
+        self.__topology = topology
+
+    def persistent_load(self, pid):
+        kind, device_id = pid
+
+        # Without a topology (e.g. just listing the entries), the ID is returned instead
+        return self.__topology[device_id] if self.__topology is not None else device_id
+
+
+def journaled(method: Callable) -> Callable:
+    """
+    Records a public mutation of a topology in its journal (if one is attached). Only the outermost call is
+    recorded, so the calls a mutation makes to other mutations (or to super()) are replayed as part of it.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        journal: MutationJournal | None = getattr(self, "_journal", None)
+        if journal is None or journal.recording:
+            return method(self, *args, **kwargs)
+
+        # The arguments are encoded before the call, since the call might change them (e.g. connecting a device)
+        payload = journal.encode(method.__name__, args, kwargs)
+
+        journal.recording = True
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            journal.recording = False
+
+        # Only the successful mutations are recorded
+        journal.append(payload)
+        return result
+
+    return wrapper
+
+
+class MutationJournal:
+    """
+    Append-only binary journal of the public mutations of a topology, for crash recovery.
+
+    Every journaled call is appended as one entry (a pickled method name with its arguments, compressed when
+    large, with a CRC32 to detect a torn write at the end of the file). Every 'checkpoint_every' entries, the
+    whole topology is saved to the TopologyStore and the journal is compacted down to an empty file that
+    continues from that checkpoint. Recovery loads the checkpoint and replays only the entries after it.
+
+    NOTE: Only the calls on the topology itself are journaled. Changes made directly on a device or an interface
+    are only kept by the next checkpoint. Concurrent mutations are recorded in the order they finish, so with
+    several threads, take the checkpoints at a quiet moment (checkpoint_every=0 and calling checkpoint()).
+    """
+
+    def __init__(self, path: str, store: TopologyStore, checkpoint_every: int = 1000, fsync: bool = False) -> None:
+        self.path = path
+        self.store = store
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+
+        self.__local = threading.local()  # Each thread records its own outermost call
+        self.__lock = threading.RLock()
+        self.__topology: Topology | None = None
+        self.__file = None
+        self.__sequence = 0
+        self.__entries_since_checkpoint = 0
+
+    @property
+    def recording(self) -> bool:
+        # Set while a journaled call is running in the current thread
+        return getattr(self.__local, "recording", False)
+
+    @recording.setter
+    def recording(self, value: bool) -> None:
+        self.__local.recording = value
+
+    # ******************************** FILE FORMAT ********************************
+    def encode(self, method_name: str, args: tuple, kwargs: dict) -> Tuple[bytes, int]:
+        # Returns the payload of a journal entry along with its flags
+        buffer = io.BytesIO()
+        _CallPickler(buffer, self.__topology).dump((method_name, args, kwargs))
+        payload, flags = buffer.getvalue(), 0
+
+        if len(payload) > COMPRESSION_THRESHOLD:
+            payload = zlib.compress(payload)
+            flags |= FLAG_COMPRESSED
+
+        return payload, flags
+
+    @staticmethod
+    def __decode(payload: bytes, topology: Topology | None) -> Tuple[str, tuple, dict]:
+        return _CallUnpickler(io.BytesIO(payload), topology).load()
+
+    def __read(self) -> Tuple[int, List[RawEntry], int]:
+        # Returns the checkpoint sequence, the entries and the size of the valid part of the file
+        if not os.path.exists(self.path):
+            return 0, [], 0
+
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        if len(data) < HEADER.size:
+            return 0, [], 0
+
+        magic, base_sequence = HEADER.unpack_from(data, 0)
+        if magic != JOURNAL_MAGIC:
+            raise ValueError(f"ERROR: '{self.path}' is not a mutation journal")
+
+        entries, offset = [], HEADER.size
+        while offset + ENTRY.size <= len(data):
+            sequence, length, crc, flags = ENTRY.unpack_from(data, offset)
+            payload = data[offset + ENTRY.size:offset + ENTRY.size + length]
+
+            # A torn or corrupted entry ends the journal
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                print_warning(f"Journal '{self.path}' ends with an incomplete entry, which is discarded",
+                              prompt=False)
+                break
+
+            if flags & FLAG_COMPRESSED:
+                payload = zlib.decompress(payload)
+
+            entries.append((sequence, payload))
+            offset += ENTRY.size + length
+
+        return base_sequence, entries, offset
+
+    def __compact(self, base_sequence: int) -> None:
+        # Replaces the journal with an empty one that continues from the given checkpoint
+        if self.__file is not None:
+            self.__file.close()
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(JOURNAL_MAGIC, base_sequence))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, self.path)
+        self.__file = open(self.path, "ab")
+
+    def entries(self) -> Iterator[JournalEntry]:
+        # The devices in the arguments which were already in the topology are shown by their IDs
+        for sequence, payload in self.__read()[1]:
+            yield sequence, *self.__decode(payload, None)
+
+    # ******************************** RECORDING ********************************
+    def attach(self, topology: Topology) -> None:
+        # Starts journaling the topology, continuing the existing journal (if any)
+        base_sequence, entries, valid_size = self.__read()
+        checkpoint = self.store.journal_sequence(topology.as_number)
+
+        self.__topology = topology
+        self.__sequence = entries[-1][0] if entries else max(base_sequence, checkpoint or 0)
+
+        if checkpoint is None or not os.path.exists(self.path):
+            # Nothing to recover from yet, so the current state is the first checkpoint
+            self.checkpoint()
+        else:
+            # Cut off any torn entry at the end
+            with open(self.path, "r+b") as file:
+                file.truncate(valid_size)
+
+            self.__file = open(self.path, "ab")
+            self.__entries_since_checkpoint = len(entries)
+
+        topology._journal = self
+
+    def detach(self) -> None:
+        if self.__topology is not None:
+            self.__topology._journal = None
+            self.__topology = None
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def append(self, encoded_call: Tuple[bytes, int]) -> None:
+        payload, flags = encoded_call
+        with self.__lock:
+            self.__sequence += 1
+            self.__file.write(ENTRY.pack(self.__sequence, len(payload), zlib.crc32(payload), flags) + payload)
+            self.__file.flush()
+
+            if self.fsync:
+                os.fsync(self.__file.fileno())
+
+            self.__entries_since_checkpoint += 1
+            if self.checkpoint_every and self.__entries_since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+
+    def checkpoint(self) -> None:
+        # Saves the complete topology, then compacts the journal
+        with self.__lock:
+            print_log(f"AS {self.__topology.as_number}: Journal checkpoint at entry {self.__sequence}")
+            self.store.save(self.__topology, journal_sequence=self.__sequence)
+            self.__compact(self.__sequence)
+            self.__entries_since_checkpoint = 0
+
+    # ******************************** RECOVERY ********************************
+    def recover(self, as_number: int) -> Topology:
+        # Loads the last checkpoint and replays the journal entries recorded after it
+        checkpoint = self.store.journal_sequence(as_number)
+        if checkpoint is None:
+            raise NotFoundError(f"No checkpoint of AS {as_number} found in '{self.store.path}'")
+
+        topology = self.store.load(as_number)
+        _, entries, _ = self.__read()
+
+        # The journal may not have been compacted yet, if the process died right after a checkpoint
+        pending_entries = [entry for entry in entries if entry[0] > checkpoint]
+        print_log(f"AS {as_number}: Replaying {len(pending_entries)} journal entries after checkpoint {checkpoint}")
+
+        # Each entry is decoded right before it's replayed, since it may refer to devices added by the previous ones
+        for sequence, payload in pending_entries:
+            method_name, args, kwargs = self.__decode(payload, topology)
+            getattr(topology, method_name)(*args, **kwargs)
+
+        return topology
+
+    def recover_or_create(self, as_number: int, create: Callable[[], Topology]) -> Topology:
+        # Recovers the topology if there's a checkpoint, otherwise creates it. The journal is attached either way.
+        if self.store.journal_sequence(as_number) is None:
+            topology = create()
+        else:
+            topology = self.recover(as_number)
+
+        self.attach(topology)
+        return topology
@@ -1,19 +1,33 @@
-from typing import Iterable, List, Any, Tuple, Dict
+import threading
+from contextlib import contextmanager, ExitStack
+from typing import Iterable, List, Any, Tuple, Dict, Iterator, TYPE_CHECKING
 
 import networkx as nx
 import matplotlib.pyplot as plt
 from components.devices.switch.switch import Switch
 from components.devices.router.router import Router
-from components.devices.network_device import NetworkDevice
 from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
+from components.topologies.mutation_journal import journaled
 
-from iptx_utils import (NetworkError, NotFoundError, smallest_missing_non_negative_integer, print_log, print_success,
-                        print_error)
+from iptx_utils import NetworkError, NotFoundError, smallest_missing_non_negative_integer, print_log, print_success
 import os
 
+if TYPE_CHECKING:
+    from components.deployment.drift_detection import DeviceDrift
+    from components.deployment.push_engine import PushResult
+
 # Referenced Data Types
 Edge = Tuple[Switch | Router, Switch | Router, Dict[str, Any]]
 
+# Thread safety: the mutations of a topology can be called from several threads at once. The locks are always
+# acquired in this order:
+#   1. Device locks (see _lock_devices), all at once and in ascending order of device ID. A mutation locks every
+#      device it configures up front, so the mutations it calls in turn only re-enter the locks it already holds.
+#   2. The graph lock, which guards the graph and the rest of the shared state of the topology (the device index,
+#      SCRs, network addresses, VRFs, VLANs...). It is only held briefly, and no device lock is waited for while
+#      holding it.
+# So independent devices (e.g. two PEs onboarding their clients) are configured in parallel.
+
 
 class Topology:
     def __init__(self, as_number: int, devices: Iterable[Switch | Router] = None):
@@ -22,55 +36,82 @@ class Topology:
 
         self.as_number = as_number
         self._graph = nx.Graph()
+        self._graph_lock = threading.RLock()
+        self._journal = None  # Mutation journal, if attached (see MutationJournal)
+
+        self.__devices_by_id: Dict[str | int, Switch | Router] = {}
+        self.__device_locks: Dict[str, threading.RLock] = {}
+
         self.add_devices(devices)
 
     def print_log(self, text: str) -> None:
         print_log(f"AS {self.as_number}: {text}")
 
+    @contextmanager
+    def _lock_devices(self, *device_ids: str | int) -> Iterator[None]:
+        # Locks the devices in ascending order of ID, so that two mutations can never wait for each other
+        with self._graph_lock:
+            locks = [self.__device_locks.setdefault(device_id, threading.RLock())
+                     for device_id in sorted({str(device_id) for device_id in device_ids})]
+
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+
+            yield
+
     def get_all_devices(self) -> List[Switch | Router]:
-        return list(self._graph.nodes())
+        with self._graph_lock:
+            return list(self._graph.nodes())
 
     def get_all_routers(self) -> List[Router]:
-        return [node for node in self._graph.nodes() if isinstance(node, Router)]
+        return [node for node in self.get_all_devices() if isinstance(node, Router)]
 
     def get_all_switches(self) -> List[Switch]:
-        return [node for node in self._graph.nodes() if isinstance(node, Switch)]
+        return [node for node in self.get_all_devices() if isinstance(node, Switch)]
 
     def __getitem__(self, device_id: str) -> Switch | Router:
-        for device in self._graph.nodes():
-            if device_id == device.id():
-                return device
-
-        raise NotFoundError(f"ERROR in AS_NUM {self.as_number}: Device with ID '{device_id}' "
-                            f"invalid or not found")
+        try:
+            return self.__devices_by_id[device_id]
+        except KeyError:
+            raise NotFoundError(f"ERROR in AS_NUM {self.as_number}: Device with ID '{device_id}' "
+                                f"invalid or not found")
 
     def get_device(self, device_id: str) -> Switch | Router:
-        for device in self._graph.nodes():
-            if device_id == device.id():
-                return device
-
-        raise NotFoundError(f"ERROR in AS_NUM {self.as_number}: Device with ID '{device_id}' "
-                            f"invalid or not found")
+        return self[device_id]
 
     def get_link(self, device_id1: str, device_id2: str) -> Edge:
-        return self[device_id1], self[device_id2], self._graph[self[device_id1]][self[device_id2]]
+        with self._graph_lock:
+            return self[device_id1], self[device_id2], self._graph[self[device_id1]][self[device_id2]]
+
+    def __add_node(self, device: Switch | Router) -> None:
+        self._graph.add_node(device)
+        self.__devices_by_id[device.id()] = device
 
+    def __remove_node(self, device: Switch | Router) -> None:
+        self._graph.remove_node(device)
+        self.__devices_by_id.pop(device.id(), None)
+
+    @journaled
     def add_switch(self, switch: Switch) -> None:
         if not isinstance(switch, Switch):
             raise TypeError(f"ERROR in AS_NUM {self.as_number}: Device {switch.hostname} is not a switch")
 
-        # If the ID is not given, then we add the default ID
-        if switch.id() is None:
-            all_ids = [device_.id() for device_ in self._graph.nodes() if isinstance(device_.id(), int)]
-            switch.update_id(smallest_missing_non_negative_integer(all_ids, 1))
+        with self._graph_lock:
+            # If the ID is not given, then we add the default ID
+            if switch.id() is None:
+                all_ids = [device_.id() for device_ in self._graph.nodes() if isinstance(device_.id(), int)]
+                switch.update_id(smallest_missing_non_negative_integer(all_ids, 1))
+
+            if self._graph.has_node(switch):
+                raise NetworkError(f"ERROR in AS_NUM {self.as_number}: There's already a device with identical "
+                                   f"hostname or ID. Please try a different name.")
 
-        if self._graph.has_node(switch):
-            raise NetworkError(f"ERROR in AS_NUM {self.as_number}: There's already a device with identical "
-                               f"hostname or ID. Please try a different name.")
+            self.__add_node(switch)
 
-        self._graph.add_node(switch)
         print_success(f"{str(switch)} added!")
 
+    @journaled
     def add_router(self, router: Router, is_guest: bool = False) -> None:
 
         if not is_guest:
@@ -79,17 +120,19 @@ class Topology:
         if not isinstance(router, Router):
             raise TypeError(f"ERROR in AS_NUM {self.as_number}: Device {router.hostname} is not a router")
 
-        if self._graph.has_node(router):
-            raise NetworkError(f"ERROR in AS_NUM {self.as_number}: There's already a device with identical "
-                               f"ID {router.id()}. Please try a different one.")
+        with self._graph_lock:
+            if self._graph.has_node(router):
+                raise NetworkError(f"ERROR in AS_NUM {self.as_number}: There's already a device with identical "
+                                   f"ID {router.id()}. Please try a different one.")
 
-        self._graph.add_node(router)
+            self.__add_node(router)
 
         if is_guest:
             print_success(f"{str(router)} added as a client!")
         else:
             print_success(f"{str(router)} added!")
 
+    @journaled
     def add_devices(self, devices: Iterable[Router | Switch]):
         for device in devices:
             if isinstance(device, Router):
@@ -99,42 +142,67 @@ class Topology:
             else:
                 raise TypeError(f"ERROR in AS_NUM {self.as_number}: Invalid device type {str(device)}")
 
+    @journaled
     def remove_device(self, device: Switch | Router) -> None:
-        if not self._graph.has_node(device):
-            raise NetworkError(f"ERROR in AS_NUM {self.as_number}: Device {device.hostname} not found in the topology, "
-                               f"so cannot be removed.")
+        with self._lock_devices(device.id()), self._graph_lock:
+            if not self._graph.has_node(device):
+                raise NetworkError(f"ERROR in AS_NUM {self.as_number}: Device {device.hostname} not found in the "
+                                   f"topology, so cannot be removed.")
 
-        self._graph.remove_node(device)
+            self.__remove_node(device)
 
+    @journaled
     def remove_device_by_id(self, device_id: str):
-        for device in self.get_all_devices():
-            if device_id == device.id():
-                self._graph.remove_node(device)
-                break
+        with self._lock_devices(device_id), self._graph_lock:
+            if device_id in self.__devices_by_id:
+                self.__remove_node(self.__devices_by_id[device_id])
 
+    @journaled
     def connect_devices(self, device_id1: str, port1: str, device_id2: str, port2: str,
                         cable_bandwidth: int = float('inf')) -> None:
 
         ethernet_types = list(PhysicalInterface.BANDWIDTHS.keys())[1:5]
 
-        # Should be of the same interface type
-        if not (self[device_id1].interface(port1).int_type in ethernet_types
-                and self[device_id2].interface(port2).int_type in ethernet_types):
+        with self._lock_devices(device_id1, device_id2):
+            # Should be of the same interface type
+            if not (self[device_id1].interface(port1).int_type in ethernet_types
+                    and self[device_id2].interface(port2).int_type in ethernet_types):
+
+                if self[device_id1].interface(port1).int_type != self[device_id2].interface(port2).int_type:
+                    raise ConnectionError(f"Incompatible interface types: Cannot connect "
+                                          f"{str(self[device_id1].interface(port1))} with "
+                                          f"{str(self[device_id2].interface(port2))}")
+
+            self[device_id1].interface(port1).connect_to(self[device_id2], port2, cable_bandwidth)
+            self[device_id2].interface(port2).connect_to(self[device_id1], port1, cable_bandwidth)
+            link_bandwidth = self[device_id1].interface(port1).bandwidth
+
+            with self._graph_lock:
+                self._graph.add_edge(self[device_id1], self[device_id2], d1_port=port1, d2_port=port2,
+                                     bandwidth=link_bandwidth)
+
+    # Puts back a device (e.g. from the topology store) as it is, without any checks or configuration
+    def _restore_device(self, device: Switch | Router) -> None:
+        self.__add_node(device)
+
+    # Puts back an established link, by reconnecting the interfaces without configuring them again
+    def _restore_link(self, device1: Switch | Router, port1: str, device2: Switch | Router, port2: str,
+                      link_data: Dict[str, Any]) -> None:
 
-            if self[device_id1].interface(port1).int_type != self[device_id2].interface(port2).int_type:
-                raise ConnectionError(f"Incompatible interface types: Cannot connect "
-                                      f"{str(self[device_id1].interface(port1))} with "
-                                      f"{str(self[device_id2].interface(port2))}")
+        interface1, interface2 = device1.interface(port1), device2.interface(port2)
+        interface1.remote_device, interface1.remote_port = device2, port2
+        interface2.remote_device, interface2.remote_port = device1, port1
 
-        self[device_id1].interface(port1).connect_to(self[device_id2], port2, cable_bandwidth)
-        self[device_id2].interface(port2).connect_to(self[device_id1], port1, cable_bandwidth)
-        link_bandwidth = self[device_id1].interface(port1).bandwidth
+        self._graph.add_edge(device1, device2, d1_port=port1, d2_port=port2, **link_data)
 
-        self._graph.add_edge(self[device_id1], self[device_id2], d1_port=port1, d2_port=port2,
-                             bandwidth=link_bandwidth)
+    def get_all_links(self) -> List[Edge]:
+        with self._graph_lock:
+            return list(self._graph.edges(data=True))
 
+    @journaled
     def disconnect_devices(self, device_id1: str, device_id2: str):
-        self._graph.remove_edge(self[device_id1], self[device_id2])
+        with self._lock_devices(device_id1, device_id2), self._graph_lock:
+            self._graph.remove_edge(self[device_id1], self[device_id2])
 
     def show_topology_graph(self, layout: str = "spring"):
         if layout.lower() == "spring":
@@ -158,23 +226,28 @@ class Topology:
 
         plt.show()
 
-    def explore_configs(self, copy_to_clipboard=True):
-        print('\n')
-        all_configs = {device.id(): device.generate_script() for device in self.get_all_devices()}
-
-        print("Enter device ID to show configurations...")
-        prompt = input("> ")
-        while prompt != "exit":
-            try:
-                # os.system("cls")
-                NetworkDevice.print_script(all_configs[prompt])
-                print()
-                if copy_to_clipboard:
-                    NetworkDevice.copy_script(all_configs[prompt])
-
-            except KeyError:
-                if prompt.strip():
-                    print_error(f"Invalid Device ID '{prompt}'")
-            finally:
-
-                prompt = input("> ")
+    def explore_configs(self, copy_to_clipboard=True, cache_size: int = 32):
+        # Shows the scripts of the devices asked for, each rendered when it's first asked for (see ConfigExplorer)
+        from components.deployment.config_explorer import ConfigExplorer
+        with ConfigExplorer(self, cache_size) as explorer:
+            explorer.explore(copy_to_clipboard)
+
+    def push_configs(self, addresses: Dict[str, Tuple[str, int]], username: str = None, password: str = None,
+                     transfer: bool = False, **options) -> List["PushResult"]:
+        # Sends the pending scripts of the devices to their CLI (see PushEngine for the options), or as files which
+        # the devices fetch from a local server (see FileTransferEngine)
+        from components.deployment.file_transfer import FileTransferEngine
+        from components.deployment.push_engine import PushEngine
+        engine = FileTransferEngine if transfer else PushEngine
+        return engine(addresses, username, password, **options).push_topology(self, addresses)
+
+    def audit_configs(self, addresses: Dict[str, Tuple[str, int]] = None, directory: str = None,
+                      username: str = None, password: str = None, processes: int = None,
+                      **options) -> List["DeviceDrift"]:
+        # Compares the running configurations of the routers (collected from their CLI, or loaded from a directory)
+        # with the model, and reports the ones which have drifted (see DriftDetector)
+        from components.deployment.drift_detection import DriftDetector
+        detector = DriftDetector(self)
+        drifts = detector.audit(addresses, directory, username, password, processes, **options)
+        detector.print_report(drifts)
+        return drifts
@@ -0,0 +1,619 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from components.devices.router.router import Router
+from components.devices.router.xr_router import XRRouter
+from components.devices.router.virtual_route_forwarding import VPNPolicy, VRF
+from components.interfaces.loopback.loopback import Loopback
+from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
+from components.interfaces.physical_interfaces.router_interface import RouterInterface
+from components.interfaces.physical_interfaces.subinterface import SubInterface
+from components.topologies.topology import Topology
+from components.topologies.autonomous_system.backbone import Backbone
+from components.topologies.autonomous_system.l2vpnbackbone import L2VPNBackbone
+from components.topologies.autonomous_system.l3vpnbackbone import L3VPNBackbone
+from components.topologies.autonomous_system.rr_placement import RRCluster, RRPlan
+from iptx_utils import NotFoundError, print_log, print_warning
+
+# Supported classes, by the name stored in the database
+TOPOLOGY_CLASSES: Dict[str, Type[Topology]] = {
+    "Topology": Topology,
+    "Backbone": Backbone,
+    "L2VPNBackbone": L2VPNBackbone,
+    "L3VPNBackbone": L3VPNBackbone
+}
+DEVICE_CLASSES: Dict[str, Type[Router]] = {
+    "Router": Router,
+    "XRRouter": XRRouter
+}
+INTERFACE_CLASSES: Dict[str, Type[PhysicalInterface]] = {
+    "PhysicalInterface": PhysicalInterface,
+    "RouterInterface": RouterInterface
+}
+
+# Attributes which are stored as they are (everything else is either a column or rebuilt)
+ROUTER_STATE = ("as_number", "node_color", "OSPF_PROCESS_ID", "priority", "route_reflector", "rr_cluster_id",
+                "reference_bw", "_mpls_ldp_sync", "_mpls_configured", "_ospf_configured")
+XR_ROUTER_STATE = ("xc_group_name", "xc_p2p_identifier")
+PHYS_INTERFACE_STATE = ("description", "shutdown_state", "max_allowable_bw", "bandwidth", "mtu", "duplex", "egp")
+ROUTER_INTERFACE_STATE = ("ospf_process_id", "ospf_area", "ospf_p2p", "ospf_priority", "ospf_allow_hellos",
+                          "mpls_enabled", "vrf_name", "static_routing", "use_service_instance",
+                          "ebgp_neighbor_confirmed")
+LOOPBACK_STATE = ("description", "ospf_area", "ospf_allow_hellos")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topologies (
+    as_number INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT,
+    state TEXT NOT NULL,
+    journal_sequence INTEGER
+);
+CREATE TABLE IF NOT EXISTS devices (
+    topology_as INTEGER NOT NULL,
+    device_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    state TEXT NOT NULL,
+    pending TEXT NOT NULL,
+    PRIMARY KEY (topology_as, device_id)
+);
+CREATE TABLE IF NOT EXISTS interfaces (
+    topology_as INTEGER NOT NULL,
+    device_id TEXT NOT NULL,
+    port TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    int_type TEXT NOT NULL,
+    cidr TEXT,
+    state TEXT NOT NULL,
+    pending TEXT NOT NULL,
+    PRIMARY KEY (topology_as, device_id, kind, port)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    topology_as INTEGER NOT NULL,
+    device_id1 TEXT NOT NULL,
+    port1 TEXT NOT NULL,
+    device_id2 TEXT NOT NULL,
+    port2 TEXT NOT NULL,
+    scr INTEGER,
+    network_address TEXT,
+    bandwidth INTEGER,
+    external INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (topology_as, device_id1, port1)
+);
+CREATE INDEX IF NOT EXISTS edges_by_device2 ON edges (topology_as, device_id2);
+CREATE TABLE IF NOT EXISTS vrfs (
+    topology_as INTEGER NOT NULL,
+    vrf_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    rd INTEGER NOT NULL,
+    as_number INTEGER NOT NULL,
+    color TEXT,
+    route_targets TEXT NOT NULL,
+    pending TEXT NOT NULL,
+    PRIMARY KEY (topology_as, vrf_id)
+);
+CREATE TABLE IF NOT EXISTS vrf_routers (
+    topology_as INTEGER NOT NULL,
+    vrf_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    PRIMARY KEY (topology_as, device_id, vrf_id)
+);
+CREATE TABLE IF NOT EXISTS route_targets (
+    topology_as INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    PRIMARY KEY (topology_as, source, destination)
+);
+CREATE INDEX IF NOT EXISTS route_targets_by_destination ON route_targets (topology_as, destination);
+"""
+
+
+class _Session:
+    # Keeps track of what has been loaded into a topology opened from the store
+    def __init__(self) -> None:
+        # Devices whose links are all loaded, and devices loaded only as the other end of such a link
+        self.devices: set[str] = set()
+        self.neighbor_devices: set[str] = set()
+
+        # VRFs whose route-targets are all loaded, and VRFs loaded as the other end of a route-target
+        self.vrfs: set[str] = set()
+        self.neighbor_vrfs: set[str] = set()
+
+
+class TopologyStore:
+    """
+    Persistent store for a Topology, Backbone, L2VPNBackbone or L3VPNBackbone in a local SQLite file.
+
+    A topology can either be loaded as a whole with load(), or opened empty with open() and hydrated device by
+    device with hydrate(). Hydrating a device loads its row, its interfaces, its links (and the routers on the
+    other end of them), and its VRFs with their route-targets - nothing else. sync() writes the loaded part back.
+
+    Only routers are stored. The switches of a topology, and their links, are left out (with a warning), so they
+    aren't there when the topology is loaded again.
+
+    NOTE: Hydrate every device that is going to be modified. The routers on the other end of a link are loaded
+    with that link only, so their other links are not visible in the topology (they stay intact in the store).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__connection = sqlite3.connect(path)
+        self.__connection.executescript(SCHEMA)
+        self.__sessions: Dict[int, _Session] = {}
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __enter__(self) -> TopologyStore:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    # ******************************** SERIALIZATION ********************************
+    @staticmethod
+    def __state(obj: Any, attributes: Iterable[str]) -> Dict[str, Any]:
+        return {attr: getattr(obj, attr) for attr in attributes if hasattr(obj, attr)}
+
+    @staticmethod
+    def __cidr(interface: Any) -> str | None:
+        if interface.ip_address and interface.subnet_mask:
+            return f"{interface.ip_address}/{interface.subnet_mask}"
+
+        return None
+
+    @staticmethod
+    def __edge_endpoints(device1: Router, device2: Router, data: Dict[str, Any]) -> Tuple[Router, str, Router, str]:
+        # The edges are undirected, so the ports in the data are matched against the interfaces of the first device
+        for interface in device1.all_phys_interfaces():
+            if interface.remote_device is device2 and interface.port == data["d1_port"]:
+                endpoints = (device1, data["d1_port"], device2, data["d2_port"])
+                break
+        else:
+            endpoints = (device2, data["d1_port"], device1, data["d2_port"])
+
+        # Always store the same link in the same direction
+        if (str(endpoints[0].id()), endpoints[1]) > (str(endpoints[2].id()), endpoints[3]):
+            endpoints = (endpoints[2], endpoints[3], endpoints[0], endpoints[1])
+
+        return endpoints
+
+    def __device_rows(self, topology: Topology, device: Router) -> Tuple[tuple, List[tuple]]:
+        if type(device).__name__ not in DEVICE_CLASSES:
+            raise TypeError(f"ERROR: {str(device)} cannot be stored. The topology store only supports routers.")
+
+        state = self.__state(device, ROUTER_STATE + XR_ROUTER_STATE)
+        state["ibgp_adjacent_router_ids"] = sorted(device.ibgp_adjacent_router_ids)
+        state["lazy_ports"] = [[port, interface_class.__name__, int_type]
+                               for port, (interface_class, int_type) in device.lazy_port_specs().items()]
+
+        device_row = (topology.as_number, device.id(), type(device).__name__, device.hostname,
+                      json.dumps(state), json.dumps(device._pending_commands()))
+
+        interface_rows = []
+        for interface in device.all_phys_interfaces():
+            int_state = self.__state(interface, PHYS_INTERFACE_STATE + ROUTER_INTERFACE_STATE)
+            int_state["vlans_in_service_instance"] = sorted(getattr(interface, "vlans_in_service_instance", []))
+            int_state["sub_interfaces"] = [{
+                "vlan_id": sub_if.vlan_id,
+                "cidr": self.__cidr(sub_if),
+                "description": sub_if.description,
+                "mtu": sub_if.mtu,
+                "neighbor_ids": sorted(sub_if.neighbor_ids),
+                "pw_redundancy_configured": sub_if.pw_redundancy_configured,
+                "pending": sub_if._pending_commands()
+            } for sub_if in sorted(interface.sub_interfaces, key=lambda sub_if: sub_if.vlan_id)]
+
+            interface_rows.append((topology.as_number, device.id(), str(interface.port), type(interface).__name__,
+                                   interface.int_type, self.__cidr(interface), json.dumps(int_state),
+                                   json.dumps(interface._pending_commands())))
+
+        for loopback in device.all_loopbacks():
+            interface_rows.append((topology.as_number, device.id(), str(loopback.port), "Loopback", "Loopback",
+                                   self.__cidr(loopback), json.dumps(self.__state(loopback, LOOPBACK_STATE)),
+                                   json.dumps(loopback._pending_commands())))
+
+        return device_row, interface_rows
+
+    def __edge_row(self, topology: Topology, edge: tuple) -> tuple:
+        device1, port1, device2, port2 = self.__edge_endpoints(*edge)
+        data = {key: value for key, value in edge[2].items() if key not in ("d1_port", "d2_port")}
+
+        return (topology.as_number, device1.id(), port1, device2.id(), port2, data.get("scr"),
+                data.get("network_address"), data.get("bandwidth"), int(bool(data.get("external", False))),
+                json.dumps(data))
+
+    @staticmethod
+    def __vrf_row(topology: Topology, vrf_id: str, vrf: VRF) -> tuple:
+        return (topology.as_number, vrf_id, vrf.name, vrf.rd, vrf.as_number, vrf.color,
+                json.dumps({"import": sorted(vrf.route_targets), "export": sorted(vrf.export_targets)}),
+                json.dumps(vrf.get_setup_cmd()))
+
+    @staticmethod
+    def __topology_state(topology: Topology) -> Dict[str, Any]:
+        state = {}
+        if isinstance(topology, Backbone):
+            state["reference_bw"] = topology.reference_bw
+        if isinstance(topology, L2VPNBackbone):
+            state["mtu"] = topology.mtu
+            state["label_headroom"] = topology.label_headroom
+        if isinstance(topology, L3VPNBackbone):
+            state["route_reflector"] = topology.route_reflector
+            if topology.rr_plan is not None:
+                state["rr_clusters"] = [[cluster.cluster_id, cluster.route_reflectors, cluster.clients]
+                                        for cluster in topology.rr_plan.clusters]
+            state["vpn_policies"] = [[policy.name, policy.kind, policy.members, policy.route_targets, policy.hub]
+                                     for policy in topology.get_vpn_policies()]
+
+        return state
+
+    # ******************************** DESERIALIZATION ********************************
+    @staticmethod
+    def __build_device(row: tuple, interface_rows: List[tuple]) -> Router:
+        device_id, kind, hostname, state, pending = row
+        state = json.loads(state)
+
+        device = DEVICE_CLASSES[kind](router_id=device_id, hostname=hostname, interfaces=[],
+                                      mpls_ldp_sync=state.get("_mpls_ldp_sync", False))
+
+        # Physical interfaces and loopbacks
+        for port, int_kind, int_type, cidr, int_state, int_pending in interface_rows:
+            int_state = json.loads(int_state)
+
+            if int_kind == "Loopback":
+                if int(port) == 0:
+                    interface = device.loopback(0)
+                else:
+                    interface = Loopback(cidr=cidr, loopback_id=int(port))
+                    device.add_interface(interface)
+
+            else:
+                interface = INTERFACE_CLASSES[int_kind](int_type, port, cidr)
+                device.add_interface(interface)
+
+                interface.vlans_in_service_instance = set(int_state.pop("vlans_in_service_instance", []))
+                for sub_if_state in int_state.pop("sub_interfaces", []):
+                    sub_interface = SubInterface(int_type, port, sub_if_state["vlan_id"], sub_if_state["cidr"],
+                                                 sub_if_state["mtu"])
+                    sub_interface.xr_mode = interface.xr_mode
+                    sub_interface.device_id = device_id
+                    sub_interface.description = sub_if_state["description"]
+                    sub_interface.neighbor_ids = set(sub_if_state["neighbor_ids"])
+                    sub_interface.pw_redundancy_configured = sub_if_state["pw_redundancy_configured"]
+                    sub_interface._restore_pending_commands(sub_if_state["pending"])
+                    interface.sub_interfaces.add(sub_interface)
+
+            for attr, value in int_state.items():
+                setattr(interface, attr, value)
+
+            interface._restore_pending_commands(json.loads(int_pending))
+
+        # Ports that have never been used
+        for port, class_name, int_type in state.pop("lazy_ports", []):
+            device.add_lazy_interfaces(INTERFACE_CLASSES[class_name], int_type, port)
+
+        device.ibgp_adjacent_router_ids = set(state.pop("ibgp_adjacent_router_ids", []))
+        for attr, value in state.items():
+            setattr(device, attr, value)
+
+        # The hostname is set as it is (route-reflectors already have their suffix)
+        device.hostname = hostname
+        device._restore_pending_commands(json.loads(pending))
+
+        return device
+
+    @staticmethod
+    def __build_vrf(row: tuple) -> Tuple[str, VRF]:
+        vrf_id, name, rd, as_number, color, route_targets, pending = row
+        vrf = VRF(rd, name, as_number, color)
+        route_targets = json.loads(route_targets)
+
+        # Older stores only have the imported route-targets
+        if isinstance(route_targets, list):
+            route_targets = {"import": route_targets, "export": []}
+
+        vrf.route_targets = set(route_targets["import"])
+        vrf.export_targets = set(route_targets["export"])
+        vrf._restore_setup_cmd(json.loads(pending))
+
+        return vrf_id, vrf
+
+    # ******************************** QUERIES ********************************
+    def __select_in(self, query: str, as_number: int, column: str, values: Iterable[Any]) -> List[tuple]:
+        # Runs the query with 'column IN (...)', in batches (SQLite limits the number of parameters)
+        values = list(values)
+        rows = []
+        for index in range(0, len(values), 500):
+            batch = values[index:index + 500]
+            placeholders = ", ".join("?" * len(batch))
+            rows.extend(self.__connection.execute(query.format(f"{column} IN ({placeholders})"),
+                                                  [as_number, *batch]).fetchall())
+
+        return rows
+
+    def __session(self, topology: Topology) -> _Session:
+        if id(topology) not in self.__sessions:
+            raise NotFoundError(f"AS {topology.as_number} has not been opened from this store")
+
+        return self.__sessions[id(topology)]
+
+    def topology_numbers(self) -> List[int]:
+        return [row[0] for row in self.__connection.execute("SELECT as_number FROM topologies ORDER BY as_number")]
+
+    def device_ids(self, as_number: int) -> List[str]:
+        return [row[0] for row in self.__connection.execute(
+            "SELECT device_id FROM devices WHERE topology_as = ? ORDER BY device_id", (as_number,))]
+
+    # ******************************** PUBLIC FUNCTIONS ********************************
+    def journal_sequence(self, as_number: int) -> int | None:
+        # Sequence number of the last journal entry included in the stored topology (see MutationJournal)
+        row = self.__connection.execute("SELECT journal_sequence FROM topologies WHERE as_number = ?",
+                                        (as_number,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, topology: Topology, journal_sequence: int = None) -> None:
+        # Writes the complete topology, replacing anything stored under its AS number
+        as_number = topology.as_number
+        print_log(f"AS {as_number}: Saving the topology to '{self.path}'...")
+
+        with self.__connection:
+            for table in ("devices", "interfaces", "edges", "vrfs", "vrf_routers", "route_targets"):
+                self.__connection.execute(f"DELETE FROM {table} WHERE topology_as = ?", (as_number,))
+
+            self.__write(topology, topology.get_all_devices(), complete_ids=None)
+            self.__connection.execute("UPDATE topologies SET journal_sequence = ? WHERE as_number = ?",
+                                      (journal_sequence, as_number))
+
+        # Everything is loaded now
+        session = self.__sessions.setdefault(id(topology), _Session())
+        session.devices = {device.id() for device in topology.get_all_devices()}
+        session.neighbor_devices.clear()
+        if isinstance(topology, L3VPNBackbone):
+            session.vrfs = set(topology.get_all_vrfs(name_rd_only=True))
+            session.neighbor_vrfs.clear()
+
+    def open(self, as_number: int) -> Topology:
+        # Opens the topology without any devices in it (see hydrate())
+        row = self.__connection.execute("SELECT kind, name, state FROM topologies WHERE as_number = ?",
+                                        (as_number,)).fetchone()
+        if row is None:
+            raise NotFoundError(f"AS {as_number} is not found in '{self.path}'")
+
+        kind, name, state = row
+        state = json.loads(state)
+
+        if kind == "Topology":
+            topology = Topology(as_number)
+        else:
+            topology = TOPOLOGY_CLASSES[kind](as_number, name, [])
+
+        if isinstance(topology, Backbone):
+            # The reference bandwidth and the uniqueness checks need every link, but just these columns
+            topology._restore_link_bandwidths(row[0] for row in self.__connection.execute(
+                "SELECT bandwidth FROM edges WHERE topology_as = ? AND external = 0", (as_number,)))
+            for scr, network_address in self.__connection.execute(
+                    "SELECT scr, network_address FROM edges WHERE topology_as = ?", (as_number,)):
+                if scr is not None:
+                    topology._reserved_scrs.add(scr)
+                if network_address is not None:
+                    topology._reserved_network_addresses.add(network_address)
+
+            topology.reference_bw = state.get("reference_bw", topology.reference_bw)
+
+        if isinstance(topology, L2VPNBackbone):
+            topology.mtu = state.get("mtu", topology.mtu)
+            topology.label_headroom = state.get("label_headroom", False)
+
+        if isinstance(topology, L3VPNBackbone):
+            topology.route_reflector = state.get("route_reflector")
+            if "rr_clusters" in state:
+                topology.rr_plan = RRPlan([RRCluster(*cluster) for cluster in state["rr_clusters"]])
+            for policy in state.get("vpn_policies", []):
+                topology._restore_vpn_policy(VPNPolicy(*policy))
+
+            # The RDs of all the VRFs are taken, even though the VRFs are only loaded when needed
+            topology._reserve_rds(row[0] for row in self.__connection.execute(
+                "SELECT rd FROM vrfs WHERE topology_as = ?", (as_number,)))
+
+        self.__sessions[id(topology)] = _Session()
+        return topology
+
+    def load(self, as_number: int) -> Topology:
+        # Opens the topology with every device and VRF in it
+        topology = self.open(as_number)
+        self.hydrate(topology, *self.device_ids(as_number))
+
+        if isinstance(topology, L3VPNBackbone):
+            self.hydrate_vrfs(topology, *[row[0] for row in self.__connection.execute(
+                "SELECT vrf_id FROM vrfs WHERE topology_as = ?", (as_number,))])
+
+        return topology
+
+    def hydrate(self, topology: Topology, *device_ids: str) -> None:
+        # Loads the devices along with their links, the routers on the other end, and their VRFs
+        session = self.__session(topology)
+        as_number = topology.as_number
+        loaded = {device.id(): device for device in topology.get_all_devices()}
+
+        new_ids = [device_id for device_id in device_ids if device_id not in session.devices]
+        if not new_ids:
+            return
+
+        # Step 1: The links of the devices, and the devices on both ends of them
+        edge_rows = self.__select_in(
+            "SELECT device_id1, port1, device_id2, port2, data FROM edges WHERE topology_as = ? AND {}",
+            as_number, "device_id1", new_ids)
+        edge_rows.extend(self.__select_in(
+            "SELECT device_id1, port1, device_id2, port2, data FROM edges WHERE topology_as = ? AND {}",
+            as_number, "device_id2", new_ids))
+
+        required_ids = set(new_ids)
+        for device_id1, _, device_id2, _, _ in edge_rows:
+            required_ids.update((device_id1, device_id2))
+
+        # Step 2: Build the devices which are not loaded yet
+        missing_ids = [device_id for device_id in required_ids if device_id not in loaded]
+        device_rows = self.__select_in(
+            "SELECT device_id, kind, hostname, state, pending FROM devices WHERE topology_as = ? AND {}",
+            as_number, "device_id", missing_ids)
+        interface_rows: Dict[str, List[tuple]] = {}
+        for row in self.__select_in(
+                "SELECT device_id, port, kind, int_type, cidr, state, pending FROM interfaces "
+                "WHERE topology_as = ? AND {} ORDER BY kind, port", as_number, "device_id", missing_ids):
+            interface_rows.setdefault(row[0], []).append(row[1:])
+
+        if len(device_rows) != len(missing_ids):
+            found = {row[0] for row in device_rows}
+            raise NotFoundError(f"ERROR in AS_NUM {as_number}: Devices "
+                                f"{', '.join(sorted(set(missing_ids) - found))} not found in '{self.path}'")
+
+        for row in device_rows:
+            device = self.__build_device(row, interface_rows.get(row[0], []))
+            topology._restore_device(device)
+            loaded[device.id()] = device
+
+        # Step 3: Reconnect the links
+        for device_id1, port1, device_id2, port2, data in edge_rows:
+            device1, device2 = loaded[device_id1], loaded[device_id2]
+            if device1.interface(port1).remote_device is None:
+                topology._restore_link(device1, port1, device2, port2, json.loads(data))
+
+        session.devices.update(new_ids)
+        session.neighbor_devices.update(required_ids - session.devices)
+        session.neighbor_devices.difference_update(session.devices)
+
+        # Step 4: The VRFs of the routers
+        if isinstance(topology, L3VPNBackbone):
+            memberships = self.__select_in(
+                "SELECT device_id, vrf_id FROM vrf_routers WHERE topology_as = ? AND {}",
+                as_number, "device_id", new_ids)
+            self.hydrate_vrfs(topology, *{vrf_id for _, vrf_id in memberships})
+
+            for device_id, vrf_id in memberships:
+                vrf = topology.get_vrf(vrf_id)
+                loaded[device_id].vrfs.add(vrf)
+                vrf.assigned_routers.add(loaded[device_id])
+
+    def hydrate_vrfs(self, topology: L3VPNBackbone, *vrf_ids: str) -> None:
+        # Loads the VRFs along with their route-targets (and the VRFs on the other end of them)
+        session = self.__session(topology)
+        as_number = topology.as_number
+
+        new_ids = [vrf_id for vrf_id in vrf_ids if vrf_id not in session.vrfs]
+        if not new_ids:
+            return
+
+        rt_rows = self.__select_in("SELECT source, destination FROM route_targets WHERE topology_as = ? AND {}",
+                                   as_number, "source", new_ids)
+        rt_rows.extend(self.__select_in("SELECT source, destination FROM route_targets WHERE topology_as = ? AND {}",
+                                        as_number, "destination", new_ids))
+
+        required_ids = set(new_ids)
+        for source, destination in rt_rows:
+            required_ids.update((source, destination))
+
+        loaded = set(topology.get_all_vrfs(name_rd_only=True))
+        for row in self.__select_in(
+                "SELECT vrf_id, name, rd, as_number, color, route_targets, pending FROM vrfs "
+                "WHERE topology_as = ? AND {}", as_number, "vrf_id", [i for i in required_ids if i not in loaded]):
+            topology._restore_vrf(*self.__build_vrf(row))
+
+        for source, destination in rt_rows:
+            topology._restore_route_target(source, destination)
+
+        session.vrfs.update(new_ids)
+        session.neighbor_vrfs.update(required_ids - session.vrfs)
+        session.neighbor_vrfs.difference_update(session.vrfs)
+
+    def sync(self, topology: Topology) -> None:
+        # Writes the loaded part of the topology back to the store
+        session = self.__session(topology)
+        as_number = topology.as_number
+        current = {device.id(): device for device in topology.get_all_devices()}
+
+        # Devices created in this session are complete, just like the hydrated ones
+        complete_ids = {device_id for device_id in current if device_id not in session.neighbor_devices}
+        removed_ids = session.devices - set(current)
+
+        with self.__connection:
+            for table in ("devices", "interfaces", "vrf_routers"):
+                self.__select_in(f"DELETE FROM {table} WHERE topology_as = ? AND {{}}", as_number, "device_id",
+                                 removed_ids)
+
+            # All the links of the complete devices are known, so they are replaced
+            for column in ("device_id1", "device_id2"):
+                self.__select_in("DELETE FROM edges WHERE topology_as = ? AND {}", as_number, column,
+                                 complete_ids | removed_ids)
+
+            self.__write(topology, current.values(), complete_ids)
+
+        session.devices = (session.devices - removed_ids) | complete_ids
+
+    def __write(self, topology: Topology, devices: Iterable[Router], complete_ids: set[str] | None) -> None:
+        # complete_ids: devices whose links and VRFs are all loaded (None means everything)
+        as_number = topology.as_number
+        devices = list(devices)
+
+        # Only the routers are stored, so the switches and their links are left out
+        skipped = [device for device in devices if type(device).__name__ not in DEVICE_CLASSES]
+        if skipped:
+            print_warning(f"AS {as_number}: {', '.join(map(str, skipped))} won't be stored, since the topology store "
+                          f"only supports routers", prompt=False)
+            devices = [device for device in devices if type(device).__name__ in DEVICE_CLASSES]
+
+        self.__connection.execute(
+            "INSERT INTO topologies (as_number, kind, name, state) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (as_number) DO UPDATE SET kind = excluded.kind, name = excluded.name, "
+            "state = excluded.state",
+            (as_number, type(topology).__name__, getattr(topology, "name", None),
+             json.dumps(self.__topology_state(topology))))
+
+        # Devices and interfaces (the interfaces do not hold the links, so the neighbors are safe to write)
+        device_rows, interface_rows = [], []
+        for device in devices:
+            device_row, rows = self.__device_rows(topology, device)
+            device_rows.append(device_row)
+            interface_rows.extend(rows)
+
+        self.__select_in("DELETE FROM interfaces WHERE topology_as = ? AND {}", as_number, "device_id",
+                         [device.id() for device in devices])
+        self.__connection.executemany("INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?)", device_rows)
+        self.__connection.executemany("INSERT INTO interfaces VALUES (?, ?, ?, ?, ?, ?, ?, ?)", interface_rows)
+
+        # Links
+        self.__connection.executemany("INSERT OR REPLACE INTO edges VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      [self.__edge_row(topology, edge) for edge in topology.get_all_links()
+                                       if all(type(end).__name__ in DEVICE_CLASSES for end in edge[:2])])
+
+        if not isinstance(topology, L3VPNBackbone):
+            return
+
+        # VRFs and their routers
+        session = self.__sessions.get(id(topology), _Session())
+        vrf_ids = {id(topology.get_vrf(vrf_id)): vrf_id for vrf_id in topology.get_all_vrfs(name_rd_only=True)}
+        complete_vrfs = [vrf_id for vrf_id in vrf_ids.values()
+                         if complete_ids is None or vrf_id not in session.neighbor_vrfs]
+
+        self.__connection.executemany("INSERT OR REPLACE INTO vrfs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      [self.__vrf_row(topology, vrf_id, topology.get_vrf(vrf_id))
+                                       for vrf_id in vrf_ids.values()])
+
+        membership_devices = [device for device in devices if complete_ids is None or device.id() in complete_ids]
+        self.__select_in("DELETE FROM vrf_routers WHERE topology_as = ? AND {}", as_number, "device_id",
+                         [device.id() for device in membership_devices])
+        self.__connection.executemany("INSERT INTO vrf_routers VALUES (?, ?, ?)",
+                                      [(as_number, vrf_ids[id(vrf)], device.id())
+                                       for device in membership_devices for vrf in device.vrfs
+                                       if id(vrf) in vrf_ids])
+
+        # Route-targets
+        self.__select_in("DELETE FROM route_targets WHERE topology_as = ? AND {}", as_number, "source",
+                         complete_vrfs)
+        self.__connection.executemany("INSERT OR REPLACE INTO route_targets VALUES (?, ?, ?)",
+                                      [(as_number, source, destination)
+                                       for source, destination in topology.get_route_targets()])
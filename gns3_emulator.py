@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from iptx_utils import NotFoundError, print_log
+
+GNS3_VERSION = "2.2.44"
+
+
+class EmulatedResource:
+    def __init__(self, data: object) -> None:
+        self.body = b""
+        self.etag = ""
+        self.last_modified = ""
+        self.update(data)
+
+    def update(self, data: object) -> None:
+        self.body = json.dumps(data).encode()
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+
+class GNS3Emulator:
+    """
+    Stand-in for the v2 REST API of a GNS3 server on this machine, serving the projects it's given: '/v2/version',
+    '/v2/projects', and the nodes, links and drawings of every project. The connections are kept alive (HTTP/1.1),
+    and every response has an ETag and a Last-Modified header, so an If-None-Match (or If-Modified-Since) of a
+    resource that hasn't changed gets a '304 Not Modified'.
+
+    The connections, the requests and the 304s are counted, for testing the clients.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.__resources: Dict[str, EmulatedResource] = {"/v2/version": EmulatedResource({"version": GNS3_VERSION})}
+        self.__projects: Dict[str, dict] = {}
+        self.__lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.latency = 0.0  # Seconds before every answer
+
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                emulator._connected()
+
+            def do_GET(self) -> None:
+                emulator._answer(self)
+
+            def log_message(self, *_) -> None:
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ******************************** PROJECTS ********************************
+    def add_project(self, name: str, nodes: List[dict], links: List[dict], drawings: List[dict] = ()) -> str:
+        project_id = str(uuid.uuid4())
+        with self.__lock:
+            self.__projects[project_id] = {"project_id": project_id, "name": name, "status": "opened",
+                                           "path": f"/opt/gns3/projects/{project_id}", "auto_close": True}
+            self.__resources["/v2/projects"] = EmulatedResource(list(self.__projects.values()))
+            for resource, data in (("nodes", nodes), ("links", links), ("drawings", list(drawings))):
+                for item in data:
+                    item["project_id"] = project_id
+                self.__resources[f"/v2/projects/{project_id}/{resource}"] = EmulatedResource(data)
+
+        return project_id
+
+    def update(self, project_id: str, resource: str, data: List[dict]) -> None:
+        # The nodes, links or drawings of a project are changed, so they get a new ETag
+        with self.__lock:
+            try:
+                self.__resources[f"/v2/projects/{project_id}/{resource}"].update(data)
+            except KeyError:
+                raise NotFoundError(f"Emulated project '{project_id}' has no {resource}")
+
+    @staticmethod
+    def node(name: str, x: int, y: int, ports: List[Tuple[str, str]], node_type: str = "dynamips",
+             properties: dict = None) -> dict:
+        # A node, with its ports as (name, short name), one per adapter
+        return {
+            "node_id": str(uuid.uuid4()), "name": name, "node_type": node_type, "status": "stopped",
+            "x": x, "y": y, "z": 1, "width": 66, "height": 45, "console_type": "telnet",
+            "properties": properties if properties is not None else {"platform": "c7200"},
+            "ports": [{"name": long_name, "short_name": short_name, "adapter_number": adapter, "port_number": 0,
+                       "link_type": "ethernet", "data_link_types": {"Ethernet": "DLT_EN10MB"}}
+                      for adapter, (long_name, short_name) in enumerate(ports)]
+        }
+
+    @staticmethod
+    def link(node1: dict, adapter1: int, node2: dict, adapter2: int) -> dict:
+        return {
+            "link_id": str(uuid.uuid4()), "link_type": "ethernet", "capturing": False, "suspend": False,
+            "nodes": [{"node_id": node["node_id"], "adapter_number": adapter, "port_number": 0,
+                       "label": {"text": node["ports"][adapter]["short_name"], "x": 0, "y": 0}}
+                      for node, adapter in ((node1, adapter1), (node2, adapter2))]
+        }
+
+    @staticmethod
+    def rectangle(x: int, y: int, width: int, height: int) -> dict:
+        return {"drawing_id": str(uuid.uuid4()), "x": x, "y": y, "z": 0, "rotation": 0, "locked": False,
+                "svg": f'<svg width="{width}" height="{height}"><rect width="{width}" height="{height}" '
+                       f'fill="#ffffff" fill-opacity="0" stroke-width="2" stroke="#000000" /></svg>'}
+
+    @staticmethod
+    def ellipse(x: int, y: int, width: int, height: int) -> dict:
+        return {"drawing_id": str(uuid.uuid4()), "x": x, "y": y, "z": 0, "rotation": 0, "locked": False,
+                "svg": f'<svg width="{width}" height="{height}"><ellipse cx="{width // 2}" cy="{height // 2}" '
+                       f'rx="{width // 2}" ry="{height // 2}" fill="#ffffff" fill-opacity="0" stroke-width="2" '
+                       f'stroke="#000000" /></svg>'}
+
+    @staticmethod
+    def note(x: int, y: int, text: str) -> dict:
+        return {"drawing_id": str(uuid.uuid4()), "x": x, "y": y, "z": 2, "rotation": 0, "locked": False,
+                "svg": f'<svg width="{len(text) * 8}" height="24"><text font-family="TypeWriter" font-size="10.0" '
+                       f'font-weight="bold" fill="#000000" fill-opacity="1.0">{text}</text></svg>'}
+
+    def ring_project(self, name: str, routers: int, area_size: int = 0) -> str:
+        """
+        A project with a ring of c7200 routers, laid out in rows of 'area_size' routers (or ten), with a rectangle
+        (or every other one, an ellipse) drawn around each row after the first one, labelled 'Area 1', 'Area 2'...
+        The project also has a switch and a host, linked to the first router.
+        """
+        ports = [("FastEthernet0/0", "f0/0"), ("FastEthernet0/1", "f0/1"), ("GigabitEthernet1/0", "g1/0"),
+                 ("GigabitEthernet2/0", "g2/0")]
+        row = area_size or 10
+        nodes = [self.node(f"R{i + 1}", (i % row) * 150, (i // row) * 150, ports) for i in range(routers)]
+        links = [self.link(nodes[i - 1], 1, nodes[i], 0) for i in range(routers if routers > 2 else routers - 1)]
+
+        switch = self.node("Switch1", -300, 0, [(f"Ethernet{i}", f"e{i}") for i in range(8)], "ethernet_switch", {})
+        host = self.node("PC1", -300, 150, [("Ethernet0", "e0")], "vpcs", {})
+        if nodes:
+            links += [self.link(nodes[0], 2, switch, 0), self.link(switch, 1, host, 0)]
+
+        drawings = []
+        if area_size:
+            for area, first in enumerate(range(area_size, routers, area_size), start=1):
+                members = nodes[first:first + area_size]
+                left, top = min(node["x"] for node in members) - 20, min(node["y"] for node in members) - 20
+                width = max(node["x"] for node in members) + 86 - left
+                height = max(node["y"] for node in members) + 65 - top
+                if area % 2:
+                    drawings.append(self.rectangle(left, top, width, height))
+                else:
+                    # Around the same box, so its corners are inside of it too
+                    grown_width, grown_height = int(width * 1.42), int(height * 1.42)
+                    drawings.append(self.ellipse(left - (grown_width - width) // 2, top - (grown_height - height) // 2,
+                                                 grown_width, grown_height))
+                drawings.append(self.note(left + 5, top + 5, f"Area {area}"))
+
+        return self.add_project(name, nodes + [switch, host], links, drawings)
+
+    # ******************************** SERVER ********************************
+    def _connected(self) -> None:
+        with self.__lock:
+            self.connections += 1
+
+    def _answer(self, handler: BaseHTTPRequestHandler) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.__lock:
+            self.requests += 1
+            resource = self.__resources.get(handler.path.split("?")[0].rstrip("/"))
+
+        if resource is None:
+            body = json.dumps({"message": f"{handler.path} not found", "status": 404}).encode()
+            handler.send_response(404)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+
+        if self.__fresh(handler, resource):
+            with self.__lock:
+                self.not_modified += 1
+            handler.send_response(304)
+            handler.send_header("ETag", resource.etag)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(resource.body)))
+        handler.send_header("ETag", resource.etag)
+        handler.send_header("Last-Modified", resource.last_modified)
+        handler.end_headers()
+        handler.wfile.write(resource.body)
+
+    @staticmethod
+    def __fresh(handler: BaseHTTPRequestHandler, resource: EmulatedResource) -> bool:
+        # Whether the copy of the client is still the current one (the ETag wins over the date, like in RFC 9110)
+        if handler.headers.get("If-None-Match") is not None:
+            return resource.etag in [tag.strip() for tag in handler.headers["If-None-Match"].split(",")]
+
+        if handler.headers.get("If-Modified-Since") is not None:
+            try:
+                return parsedate_to_datetime(resource.last_modified) <= \
+                    parsedate_to_datetime(handler.headers["If-Modified-Since"])
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def start(self) -> str:
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        print_log(f"GNS3 emulator listening on {self.url} with {len(self.__projects)} projects")
+        return self.url
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self) -> "GNS3Emulator":
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves sample projects over a stand-in of the GNS3 v2 API")
+    parser.add_argument("--port", type=int, default=3080)
+    parser.add_argument("--routers", type=int, default=12, help="Routers of the ring of each project")
+    parser.add_argument("--area-size", type=int, default=4, help="Routers of each drawn OSPF area (0 for none)")
+    parser.add_argument("--projects", type=int, default=1)
+    args = parser.parse_args()
+
+    emulator = GNS3Emulator(port=args.port)
+    for number in range(1, args.projects + 1):
+        emulator.ring_project(f"Ring {number}", args.routers, args.area_size)
+
+    with emulator:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,150 @@
-import requests
+import argparse
+import ipaddress
+import re
+import threading
+import time
 import xml.etree.ElementTree as Tree
-from router import Router
-from typing import Tuple
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from tabulate import tabulate
+
+from components.deployment.config_parser import normalized_name
+from components.devices.router.router import Router, RouterInterface
+from components.devices.router.xr_router import XRRouter
+from components.interfaces.physical_interfaces.physical_interface import PhysicalInterface
+from components.topologies.autonomous_system.area_partitioner import AreaPartitioner, AreaPlan, BACKBONE_AREA
+from components.topologies.autonomous_system.backbone import Backbone
+from iptx_utils import NetworkError, NotFoundError, print_log, print_success, print_warning, split_port_name
+
+GNS3_SERVER = "http://localhost:3080"
+
+ROUTER_NODE_TYPES = ("dynamips", "iou", "qemu")  # The node types which may be routers (the rest are switches, hosts...)
+PORT_ABBREVIATIONS = {"Gi": "GigabitEthernet", "Fa": "FastEthernet", "Te": "TenGigabitEthernet", "Eth": "Ethernet"}
+AREA_LABEL = re.compile(r"\barea\s*(\d+)\b", re.IGNORECASE)
+
+
+# ******************************** API CLIENT ********************************
+class GNS3Project:
+    def __init__(self, project: dict, nodes: List[dict], links: List[dict], drawings: List[dict]) -> None:
+        self.project = project
+        self.nodes = nodes
+        self.links = links
+        self.drawings = drawings
+
+    @property
+    def project_id(self) -> str:
+        return self.project["project_id"]
+
+    @property
+    def name(self) -> str:
+        return self.project["name"]
+
+
+class GNS3Client:
+    """
+    Reads projects from the v2 REST API of a GNS3 server.
+
+    Every request goes through one session, whose connections are pooled and kept alive, so the threads of the
+    client (up to 'workers' requests at once) never open a connection per request. The responses are cached with
+    their ETag and Last-Modified headers, and asked for again with If-None-Match and If-Modified-Since, so a
+    resource that hasn't changed comes back as a bodyless '304 Not Modified' and is taken from the cache.
+    """
+
+    def __init__(self, server: str = GNS3_SERVER, workers: int = 8, timeout: float = 10.0) -> None:
+        self.api_base = f"{server.rstrip('/')}/v2"
+        self.timeout = timeout
+        self.workers = workers
+
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+
+        # URL -> (ETag, Last-Modified, data) of the last response with a body
+        self.__cache: Dict[str, Tuple[str | None, str | None, object]] = {}
+        self.__cache_lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0  # Requests answered from the cache
+
+    def close(self) -> None:
+        self.__session.close()
+
+    def __enter__(self) -> "GNS3Client":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def get(self, path: str) -> object:
+        # The decoded JSON of a GET of the API
+        url = f"{self.api_base}{path}"
+        with self.__cache_lock:
+            cached = self.__cache.get(url)
+            self.requests += 1
+
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.__session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            with self.__cache_lock:
+                self.not_modified += 1
+            return cached[2]
+
+        if response.status_code == 404:
+            raise NotFoundError(f"ERROR: '{path}' not found on the GNS3 server")
+
+        if response.status_code != 200:
+            raise ConnectionError(f"Error: {response.status_code} - {response.content}")
+
+        data = response.json()
+        if "ETag" in response.headers or "Last-Modified" in response.headers:
+            with self.__cache_lock:
+                self.__cache[url] = (response.headers.get("ETag"), response.headers.get("Last-Modified"), data)
+
+        return data
+
+    def projects(self) -> List[dict]:
+        return self.get("/projects")
 
-gns3_server = 'http://localhost:3080'
-gns3_api_base = f'{gns3_server}/v2'
+    def __fetch(self, executor: ThreadPoolExecutor, project: dict) -> Tuple:
+        # The requests of a project, each in its own thread
+        project_id = project["project_id"]
+        return tuple(executor.submit(self.get, f"/projects/{project_id}/{resource}")
+                     for resource in ("nodes", "links", "drawings"))
 
-# Get the project from the user
-projects_url = f'{gns3_api_base}/projects'
-proj_response = requests.get(projects_url)
-projects_data = proj_response.json()
+    def fetch_projects(self, project_ids: Iterable[str] = None) -> List[GNS3Project]:
+        # The nodes, links and drawings of the projects (all of them by default), all requested at once
+        projects = self.projects()
+        if project_ids is not None:
+            by_id = {project["project_id"]: project for project in projects}
+            missing = [project_id for project_id in project_ids if project_id not in by_id]
+            if missing:
+                raise NotFoundError(f"ERROR: Project(s) {', '.join(missing)} not found on the GNS3 server")
+            projects = [by_id[project_id] for project_id in project_ids]
 
-# Check if the response is accepted
-if proj_response.status_code != 200:
-    raise ConnectionError(f"Error: {proj_response.status_code} - {proj_response.content}")
+        with ThreadPoolExecutor(self.workers) as executor:
+            pending = [(project, self.__fetch(executor, project)) for project in projects]
+            return [GNS3Project(project, *(future.result() for future in futures)) for project, futures in pending]
+
+    def fetch_project(self, project_id: str) -> GNS3Project:
+        return self.fetch_projects([project_id])[0]
 
 
 # First a user selects a project from a list of projects
-def select_project_from_user():
+def select_project_from_user(projects_data: List[dict]) -> dict:
+    if not projects_data:
+        raise NotFoundError("ERROR: There are no projects on the GNS3 server")
+
     print("Select Project by number:")
     for index, project in enumerate(projects_data):
         print(f"    {index + 1}. {project['name']}")
@@ -38,8 +165,9 @@ def select_project_from_user():
     return projects_data[selected - 1]
 
 
+# ******************************** DRAWINGS ********************************
 # Determine if a point is inside the rectangle
-def inside_rectangle(given_point: Tuple[int, int], rect_pos: Tuple[int, int], width: int, height: int):
+def inside_rectangle(given_point: Tuple[float, float], rect_pos: Tuple[float, float], width: float, height: float):
     x_lb = rect_pos[0]  # Lower bound of X
     x_ub = x_lb + width  # Upper bound of X
     y_lb = rect_pos[1]  # Lower bound of Y
@@ -49,7 +177,7 @@ def inside_rectangle(given_point: Tuple[int, int], rect_pos: Tuple[int, int], wi
 
 
 # Determine if a point is inside the ellipse
-def inside_ellipse(given_point: Tuple[int, int], ellipse_pos: Tuple[int, int], width: int, height: int):
+def inside_ellipse(given_point: Tuple[float, float], ellipse_pos: Tuple[float, float], width: float, height: float):
     # Using the equation (x - h)^2 / a^2 + (y - k)^2 / b^2 = 1
     a = width / 2
     b = height / 2
@@ -60,45 +188,378 @@ def inside_ellipse(given_point: Tuple[int, int], ellipse_pos: Tuple[int, int], w
     return ((x - h) ** 2 / a ** 2) + ((y - k) ** 2 / b ** 2) <= 1
 
 
-# Determine if the object is within the area
-def inside_given_area(drawing_json, node):
-    svg = drawing_json["svg"]
-    root = Tree.fromstring(svg)
-    given_point = (node.x, node.y)
-    drawing_pos = (drawing_json['x'], drawing_json['y'])
+def node_position(node_json: dict) -> Tuple[float, float]:
+    # The centre of the symbol of the node (its position is the top left corner)
+    return node_json["x"] + node_json.get("width", 0) / 2, node_json["y"] + node_json.get("height", 0) / 2
+
+
+class Shape(ABC):
+    # A shape drawn on the canvas, parsed once out of the SVG of its drawing
+    def __init__(self, drawing_id: str, x: float, y: float, width: float, height: float, z: int = 0) -> None:
+        self.drawing_id = drawing_id
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.z = z
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return self.x, self.y, self.x + self.width, self.y + self.height
+
+    @property
+    def size(self) -> float:
+        return self.width * self.height
 
-    if root.find('rect'):
+    @abstractmethod
+    def contains(self, point: Tuple[float, float]) -> bool:
+        pass
+
+    @staticmethod
+    def from_drawing(drawing_json: dict, root: Tree.Element = None) -> "Shape | None":
+        # The rectangle or the ellipse of a drawing (None for the other drawings, like the notes)
+        root = root if root is not None else Tree.fromstring(drawing_json["svg"])
+        args = drawing_json.get("drawing_id"), drawing_json["x"], drawing_json["y"]
+
+        # (An element without children is falsy, so it's compared with None)
         rectangle = root.find('rect')
-        width = int(rectangle.get('width'))
-        height = int(rectangle.get('height'))
+        if rectangle is not None:
+            return Rectangle(*args, float(rectangle.get('width')), float(rectangle.get('height')),
+                             drawing_json.get("z", 0))
+
+        if root.find('ellipse') is not None:
+            # The ellipse fills the whole drawing
+            return Ellipse(*args, float(root.get('width')), float(root.get('height')), drawing_json.get("z", 0))
+
+        return None
+
+
+class Rectangle(Shape):
+    def contains(self, point: Tuple[float, float]) -> bool:
+        return inside_rectangle(point, (self.x, self.y), self.width, self.height)
 
-        return inside_rectangle(given_point, drawing_pos, width, height)
 
-    elif root.find('ellipse'):
-        width = int(root.get('width'))
-        height = int(root.get('height'))
+class Ellipse(Shape):
+    def contains(self, point: Tuple[float, float]) -> bool:
+        return inside_ellipse(point, (self.x, self.y), self.width, self.height)
 
-        return inside_ellipse(given_point, drawing_pos, width, height)
 
-    else:
+# Determine if the object is within the area
+def inside_given_area(drawing_json: dict, point: Tuple[float, float]) -> bool:
+    shape = Shape.from_drawing(drawing_json)
+    if shape is None:
         raise TypeError("The drawing should either be a rectangle or an ellipse")
 
+    return shape.contains(point)
+
+
+class RegionIndex:
+    """
+    Finds the region drawn around a point, out of many regions (each a shape with its value, like an area number),
+    without testing the point against every shape.
+
+    The canvas is split into a uniform grid of square cells, and every shape is listed in the cells its bounding
+    box overlaps, so a point is only tested against the few shapes of its own cell. The cells are as large as the
+    median shape by default, so most shapes cover a handful of cells. The rare shapes which would cover more than
+    'max_cells' cells are tested for every point instead.
+
+    Where the regions overlap, the point is in the topmost one (the highest Z), and then in the smallest one, so a
+    region drawn inside of another one wins.
+    """
+
+    def __init__(self, regions: Iterable[Tuple[Shape, object]], cell_size: float = None,
+                 max_cells: int = 1024) -> None:
+        self.__regions = sorted(regions, key=lambda region: (-region[0].z, region[0].size))
+        if cell_size is None:
+            sizes = sorted(max(shape.width, shape.height) for shape, _ in self.__regions)
+            cell_size = sizes[len(sizes) // 2] if sizes else 1.0
+
+        self.cell_size = max(float(cell_size), 1.0)
+        self.__cells: Dict[Tuple[int, int], List[int]] = {}  # (column, row) -> regions, by precedence
+        self.__large: List[int] = []
+
+        for position, (shape, _) in enumerate(self.__regions):
+            left, top, right, bottom = shape.bounds
+            columns = range(self.__cell(left), self.__cell(right) + 1)
+            rows = range(self.__cell(top), self.__cell(bottom) + 1)
+
+            if len(columns) * len(rows) > max_cells:
+                self.__large.append(position)
+                continue
+
+            for column in columns:
+                for row in rows:
+                    self.__cells.setdefault((column, row), []).append(position)
+
+    def __cell(self, coordinate: float) -> int:
+        return int(coordinate // self.cell_size)
+
+    def __len__(self) -> int:
+        return len(self.__regions)
+
+    def lookup(self, point: Tuple[float, float], default: object = None) -> object:
+        # The value of the region around the point, or the default when it's outside of all of them
+        cell = self.__cells.get((self.__cell(point[0]), self.__cell(point[1])), ())
+        found = [next((position for position in candidates if self.__regions[position][0].contains(point)), None)
+                 for candidates in (cell, self.__large)]
+        found = [position for position in found if position is not None]
+
+        return self.__regions[min(found)][1] if found else default
+
+
+def area_regions(drawings: List[dict]) -> List[Tuple[Shape, int]]:
+    """
+    The shapes drawn around the OSPF areas, each with the number of its area. A rectangle or an ellipse marks an
+    area when a note like 'Area 1' is placed inside of it (and not inside of another shape drawn within it).
+    Every drawing is parsed once.
+    """
+    shapes, labels = [], []
+    for drawing in drawings:
+        root = Tree.fromstring(drawing["svg"])
+        text = root.find('text')
+        if text is None:
+            shape = Shape.from_drawing(drawing, root)
+            if shape is not None:
+                shapes.append(shape)
+        elif text.text and AREA_LABEL.search(text.text):
+            labels.append((int(AREA_LABEL.search(text.text).group(1)), (drawing["x"], drawing["y"])))
+
+    index = RegionIndex((shape, shape) for shape in shapes)
+    shape_areas: Dict[int, Tuple[Shape, set]] = {}
+    for area, point in labels:
+        shape = index.lookup(point)
+        if shape is not None:
+            shape_areas.setdefault(id(shape), (shape, set()))[1].add(area)
+
+    regions = []
+    for shape, areas in shape_areas.values():
+        if len(areas) > 1:
+            print_warning(f"The drawing {shape.drawing_id} has the labels of the areas {sorted(areas)}, so it's "
+                          f"ignored", prompt=False)
+        else:
+            regions.append((shape, areas.pop()))
+
+    return regions
+
+
+# ******************************** IMPORT ********************************
+def port_name(port_json: dict) -> str:
+    # The long name of a port of a node, whichever way the node names its ports (e.g. 'Gi0/0/0/0' or 'f0/0')
+    name = normalized_name(port_json["name"])
+    for abbreviation, int_type in PORT_ABBREVIATIONS.items():
+        if name.startswith(abbreviation) and name[len(abbreviation):len(abbreviation) + 1].isdigit():
+            return int_type + name[len(abbreviation):]
+
+    try:
+        split_port_name(longname=name)
+    except ValueError:
+        int_type, port = split_port_name(shortname=port_json.get("short_name") or name)
+        return int_type + port
+
+    return name
+
+
+def device_ports(node_json: dict) -> Dict[Tuple[int, int], Tuple[str, str]]:
+    # (adapter, port) -> (interface type, port) of every port of the node that can be a router interface
+    ports = {}
+    for port_json in node_json.get("ports") or []:
+        try:
+            int_type, port = split_port_name(longname=port_name(port_json))
+            RouterInterface.validate_port(int_type, port)
+        except (ValueError, TypeError):
+            continue
+
+        if int_type in PhysicalInterface.BANDWIDTHS:
+            ports[(port_json["adapter_number"], port_json["port_number"])] = (int_type, port)
+
+    return ports
+
+
+def get_device(node_json: dict, router_id: str) -> Router | None:
+    # The router of a GNS3 node (an XRRouter for an IOS-XR image), or None for the other kinds of nodes
+    if node_json.get("node_type") not in ROUTER_NODE_TYPES:
+        return None
+
+    ports = device_ports(node_json)
+    if not ports:
+        return None
+
+    properties = node_json.get("properties") or {}
+    image = f"{properties.get('platform', '')} {properties.get('hda_disk_image', '')}".lower()
+    xr = "xr" in image or any(port.count("/") == 3 for _, port in ports.values())
+
+    hostname = re.sub(r"[^A-Za-z0-9-]", "-", node_json["name"]).strip("-")[:63] or "Router"
+    return (XRRouter if xr else Router)(
+        router_id=router_id,
+        hostname=hostname,
+        interfaces=[RouterInterface(int_type, port) for int_type, port in ports.values()]
+    )
+
+
+class GNS3Importer:
+    """
+    Builds a backbone out of a GNS3 project: a router for every router node of the project (IOS or IOS-XR, from
+    its image), with its ports as interfaces, and a backbone link for every link between two of them.
+
+    GNS3 doesn't know the addresses, so the router IDs are given by node name (or handed out from
+    'first_router_id' onwards, in the order of the nodes), and each link gets its own network from 'first_network'
+    onwards, in steps of 256 addresses (the last octet of a network address is always 0).
+
+    The OSPF areas can be drawn on the canvas, as a rectangle or an ellipse around the routers of each area, with a
+    note like 'Area 1' inside of it. The routers outside of every area are in the backbone area, which has to be
+    contiguous (or else a NetworkError is raised).
+    """
+
+    def __init__(self, client: GNS3Client, as_number: int, router_ids: Dict[str, str] = None,
+                 first_router_id: str = "10.255.0.1", first_network: str = "172.16.0.0") -> None:
+        self.client = client
+        self.as_number = as_number
+        self.router_ids = router_ids or {}
+        self.first_router_id = ipaddress.IPv4Address(first_router_id)
+        self.first_network = ipaddress.IPv4Address(first_network)
+
+    def __devices(self, project: GNS3Project) -> Dict[str, Router]:
+        # Node ID -> router
+        devices = {}
+        for index, node in enumerate(project.nodes):
+            router_id = self.router_ids.get(node["name"], str(self.first_router_id + index))
+            device = get_device(node, router_id)
+            if device is None:
+                print_log(f"Node '{node['name']}' ({node.get('node_type')}) is not a router, so it's skipped")
+                continue
+
+            device.as_number = self.as_number
+            devices[node["node_id"]] = device
+
+        return devices
+
+    @staticmethod
+    def __area_plan(project: GNS3Project, devices: Dict[str, Router], backbone: Backbone) -> AreaPlan | None:
+        regions = RegionIndex(area_regions(project.drawings))
+        if not len(regions):
+            return None
+
+        # Every router is in the area drawn around it (see RegionIndex)
+        router_areas = {}
+        for node in project.nodes:
+            if node["node_id"] in devices:
+                router_areas[devices[node["node_id"]].id()] = regions.lookup(node_position(node), BACKBONE_AREA)
+
+        areas = {}
+        for router_id, area in router_areas.items():
+            areas.setdefault(area, []).append(router_id)
+
+        # A link within an area is in it, and one between the backbone area and another area is in the latter.
+        # A link between two other areas is in the lower one of them (never the backbone area, which would then
+        # be split), so its router in the higher area is in both, without being an area border router.
+        link_areas, abrs = {}, {}
+        backbone_links = {router_id: set() for router_id in areas.get(BACKBONE_AREA, [])}
+        for device1, device2, data in backbone.get_all_links():
+            area1, area2 = router_areas[device1.id()], router_areas[device2.id()]
+            area = area1 if area1 == area2 else max(area1, area2) if BACKBONE_AREA in (area1, area2) \
+                else min(area1, area2)
+            link_areas[(device1.id(), device2.id())] = area
+
+            if area == BACKBONE_AREA:
+                backbone_links[device1.id()].add(device2.id())
+                backbone_links[device2.id()].add(device1.id())
+
+            for end, end_area in ((device1.id(), area1), (device2.id(), area2)):
+                if end_area == BACKBONE_AREA and area != BACKBONE_AREA:
+                    abrs.setdefault(end, set()).add(area)
+                elif end_area != area:
+                    print_log(f"Router {end} is in the areas {area} and {end_area}, but not in the backbone area")
+
+        # The backbone area has to be contiguous, or the routes between its parts are lost
+        if backbone_links:
+            reached, stack = set(), [min(backbone_links)]
+            while stack:
+                router_id = stack.pop()
+                if router_id not in reached:
+                    reached.add(router_id)
+                    stack.extend(backbone_links[router_id] - reached)
+
+            if len(reached) < len(backbone_links):
+                raise NetworkError(f"ERROR in project '{project.name}': The backbone area isn't contiguous, since "
+                                   f"the routers {', '.join(sorted(set(backbone_links) - reached))} have no link "
+                                   f"to {', '.join(sorted(reached))} within it")
+
+        return AreaPlan({area: sorted(router_ids) for area, router_ids in sorted(areas.items())}, link_areas, abrs)
+
+    def build(self, project: GNS3Project) -> Backbone:
+        start = time.perf_counter()
+        devices = self.__devices(project)
+        backbone = Backbone(self.as_number, project.name, devices.values())
+
+        nodes = {node["node_id"]: node for node in project.nodes}
+        node_ports = {node_id: device_ports(nodes[node_id]) for node_id in devices}
+
+        links = 0
+        for link in project.links:
+            ends = link.get("nodes") or []
+            if len(ends) != 2 or not all(end["node_id"] in devices for end in ends):
+                continue
+
+            ports = []
+            for end in ends:
+                interface = node_ports[end["node_id"]].get((end["adapter_number"], end["port_number"]))
+                ports.append(interface[1] if interface else None)
+
+            if None in ports:
+                print_warning(f"The link {link['link_id']} is on a port which isn't a router interface, so it's "
+                              f"skipped", prompt=False)
+                continue
+
+            network = str(self.first_network + 256 * links)
+            backbone.connect_internal_devices(devices[ends[0]["node_id"]].id(), ports[0],
+                                              devices[ends[1]["node_id"]].id(), ports[1], network)
+            links += 1
+
+        plan = self.__area_plan(project, devices, backbone)
+        if plan is not None:
+            AreaPartitioner(backbone).apply(plan)
+
+        print_success(f"Imported the GNS3 project '{project.name}' as AS {self.as_number}: {len(devices)} routers "
+                      f"and {links} links in {time.perf_counter() - start:.2f} seconds")
+        return backbone
+
+    def import_project(self, project_id: str) -> Backbone:
+        return self.build(self.client.fetch_project(project_id))
+
+    def import_projects(self, project_ids: Iterable[str] = None) -> Dict[str, Backbone]:
+        # Project ID -> backbone, with every project fetched at once (all of them by default), all in the same AS
+        return {project.project_id: self.build(project) for project in self.client.fetch_projects(project_ids)}
+
+
+def print_routers(backbone: Backbone) -> None:
+    data = [[
+        router.id(),
+        router.hostname,
+        "IOS-XR" if isinstance(router, XRRouter) else "IOS",
+        len(router.all_phys_interfaces()),
+        ", ".join(map(str, sorted(router.get_all_areas())))
+    ] for router in backbone.get_all_routers()]
+
+    print()
+    print(tabulate(data, headers=["Router ID", "Hostname", "Platform", "Interfaces", "OSPF Areas"]))
+    print()
 
-def get_device(node_json: dict):
-    node_id = node_json['node_id']
-    hostname = node_json['name']
-    interfaces = node_json[]
-    return Router(node_json['node_id'], )
 
+def main():
+    parser = argparse.ArgumentParser(description="Imports a GNS3 project as a backbone")
+    parser.add_argument("--server", default=GNS3_SERVER)
+    parser.add_argument("--project", help="ID of the project (asked for otherwise)")
+    parser.add_argument("--as-number", type=int, default=65000)
+    parser.add_argument("--workers", type=int, default=8, help="Requests sent to the server at once")
+    args = parser.parse_args()
 
-def get_nodes(project_id):
-    nodes_url = f'{projects_url}/{project_id}/nodes'
-    response = requests.get(nodes_url)
-    nodes_data = response.json()
+    with GNS3Client(args.server, args.workers) as client:
+        project_id = args.project or select_project_from_user(client.projects())["project_id"]
+        backbone = GNS3Importer(client, args.as_number).import_project(project_id)
 
-    return nodes_data
+    print_routers(backbone)
+    backbone.print_backbone_links()
 
 
-PROJECT_ID = "99dab476-e669-4463-bb47-62d3241e55d1"
-for node in get_nodes(PROJECT_ID):
-    print(node["name"])
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from components.deployment.config_parser import import_configs, print_import
+from components.deployment.push_engine import PushEngine
+from components.devices.network_device import NetworkDevice
+from iptx_utils import print_log
+from push_benchmark import build_backbone
+
+
+BLOCK = 250  # Routers of each ring, since building a single large one takes much longer than the import
+
+
+def write_configs(devices: int, directory: str) -> int:
+    # The running configuration of every router of the rings, as the devices would show it once configured
+    size = 0
+    for first in range(0, devices, BLOCK):
+        scripts = PushEngine.render(build_backbone(min(BLOCK, devices - first), first))
+
+        for device_id, script in scripts.items():
+            lines = ["Building configuration...", "", "!"] + NetworkDevice.running_config(script) + ["end"]
+            with open(os.path.join(directory, f"{device_id}.cfg"), "w", newline="\n") as file:
+                size += file.write("\n".join(lines) + "\n")
+
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how fast running configurations are imported as routers")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 0],
+                        help="Worker processes, for each run (0 for one per CPU)")
+    parser.add_argument("--directory", help="Existing configurations to import, instead of generated ones")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix="iptx-configs-")
+    try:
+        if args.directory is None:
+            start = time.perf_counter()
+            size = write_configs(args.devices, directory)
+            print_log(f"Wrote {args.devices} configurations ({size / 1024 / 1024:.1f} MB) in "
+                      f"{time.perf_counter() - start:.2f} seconds")
+
+        for processes in args.processes:
+            result = import_configs(directory, processes or None)
+            print_import(result)
+            print_log(f"{len(result.routers) / result.elapsed:.0f} routers/s with "
+                      f"{processes or os.cpu_count()} processes")
+
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from typing import Iterable, Tuple, Dict, List
 import datetime
+import heapq
 from colorama import Fore, Style
 
 # CUSTOM TYPES
@@ -97,6 +98,106 @@ def smallest_missing_non_negative_integer(iterable: Iterable[int], starting_numb
     return max(iterable) + 1
 
 
+# Multiset of numbers that keeps track of its maximum value =====================================
+class MaxMultiset:
+    """
+    A counted multiset backed by a max-heap. Adding and discarding values is O(log n), and the maximum is
+    looked up in amortized O(log n) (discarded values are removed lazily from the top of the heap).
+    """
+
+    def __init__(self, values: Iterable[int] = None) -> None:
+        self.__heap: List[int] = []
+        self.__counts: Dict[int, int] = {}
+
+        for value in values or []:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return sum(self.__counts.values())
+
+    def __contains__(self, value: int) -> bool:
+        return value in self.__counts
+
+    def add(self, value: int) -> None:
+        if value not in self.__counts:
+            heapq.heappush(self.__heap, -value)
+            self.__counts[value] = 0
+
+        self.__counts[value] += 1
+
+    def discard(self, value: int) -> None:
+        if value not in self.__counts:
+            return
+
+        self.__counts[value] -= 1
+        if self.__counts[value] == 0:
+            del self.__counts[value]
+
+    def max(self, default: int = None) -> int | None:
+        # Drop the values which are no longer counted from the top of the heap
+        while self.__heap and -self.__heap[0] not in self.__counts:
+            heapq.heappop(self.__heap)
+
+        return -self.__heap[0] if self.__heap else default
+
+
+# Allocator of unique numbers, which reuses the released ones ===================================
+class IDAllocator:
+    """
+    Hands out the smallest free number from 'start' onwards, e.g. for the route-distinguishers. The released
+    numbers are kept in a min-heap, so they're reused first. Allocating, reserving and releasing are O(log n),
+    and the numbers reserved from elsewhere (e.g. the ones in a store) are just skipped when they're reached.
+    """
+
+    def __init__(self, start: int = 1, reserved: Iterable[int] = None) -> None:
+        self.start = start
+        self.__next = start  # Every number from here on is free, except for the reserved ones
+        self.__released: List[int] = []  # Min-heap of the free numbers below __next (with stale entries)
+        self.__free: set[int] = set()  # The numbers which are actually free in __released
+        self.__reserved: set[int] = set()  # Taken numbers from __next on
+
+        for value in reserved or []:
+            self.reserve(value)
+
+    def __contains__(self, value: int) -> bool:
+        # Whether the number is taken
+        if value >= self.__next:
+            return value in self.__reserved
+
+        return value >= self.start and value not in self.__free
+
+    def allocate(self) -> int:
+        while self.__released:
+            value = heapq.heappop(self.__released)
+            if value in self.__free:
+                self.__free.discard(value)
+                return value
+
+        while self.__next in self.__reserved:
+            self.__reserved.discard(self.__next)
+            self.__next += 1
+
+        self.__next += 1
+        return self.__next - 1
+
+    def reserve(self, value: int) -> None:
+        # Marks a number as taken, without allocating it
+        if value >= self.__next:
+            self.__reserved.add(value)
+        else:
+            self.__free.discard(value)
+
+    def release(self, value: int) -> None:
+        if value not in self:
+            return
+
+        if value >= self.__next:
+            self.__reserved.discard(value)
+        else:
+            self.__free.add(value)
+            heapq.heappush(self.__released, value)
+
+
 def print_log(text: str, color_number: int = 2):
     current_datetime = datetime.datetime.now()
     formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import statistics
+import time
+from typing import List
+
+from components.deployment.cli_emulator import CLIEmulator
+from components.deployment.drift_detection import DriftDetector
+from components.deployment.file_transfer import FileTransferEngine
+from components.deployment.push_engine import PushEngine, PushResult
+from components.devices.device_creator import gns3_c7200
+from components.topologies.autonomous_system.backbone import Backbone
+from iptx_utils import print_log, print_success
+
+USERNAME, PASSWORD = "admin", "cisco"
+
+
+def raise_file_limit(devices: int) -> None:
+    # Every device takes a listening socket and a connection on each side
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, devices * 3 + 256))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def build_backbone(devices: int, first: int = 0) -> Backbone:
+    # A ring of routers running OSPF, so every device has an actual script (numbered from 'first', so the rings
+    # built in blocks don't overlap)
+    backbone = Backbone(65000, "Push Benchmark", [gns3_c7200(f"10.{i // 250}.{i % 250}.1", f"R{i}")
+                                                  for i in range(first, first + devices)])
+    routers = backbone.get_all_devices()
+    ports = [[interface.port for interface in router.all_phys_interfaces()[:2]] for router in routers]
+
+    for i, router in enumerate(routers):
+        backbone.connect_internal_devices(routers[i - 1].id(), ports[i - 1][1], router.id(), ports[i][0],
+                                          f"172.{16 + (first + i) // 256}.{(first + i) % 256}.0")
+
+    backbone.begin_internal_routing()
+    return backbone
+
+
+def run_emulator(hostnames, latency, addresses, stop) -> None:
+    # In its own process, so the devices don't share the event loop (and the CPU time) of the engine
+    async def serve():
+        async with CLIEmulator(hostnames, username=USERNAME, password=PASSWORD) as emulator:
+            for hostname in hostnames:
+                emulator.device(hostname).latency = latency
+            addresses.update(emulator.addresses())
+            await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+
+    raise_file_limit(len(hostnames))
+    asyncio.run(serve())
+
+
+def report(results: List[PushResult], elapsed: float, mode: str, concurrency: int) -> None:
+    PushEngine.print_results(results)
+
+    lines = sum(result.lines for result in results)
+    durations = sorted(result.elapsed for result in results)
+    print_success(f"{len(results)} devices in {elapsed:.2f} seconds with {mode} and a concurrency of {concurrency}: "
+                  f"{len(results) / elapsed:.0f} devices/s, {lines / elapsed:.0f} lines/s")
+    print_log(f"Per device: median {statistics.median(durations) * 1000:.0f} ms, "
+              f"p95 {durations[int(len(durations) * 0.95) - 1] * 1000:.0f} ms, "
+              f"{sum(result.attempts - 1 for result in results)} retries, "
+              f"{sum(not result.success for result in results)} failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the throughput of the push engine against emulated devices")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--window", type=int, nargs="+", default=[0, 200],
+                        help="Lines sent ahead of the prompts, for each run (0 waits for the prompt of every line)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Milliseconds before every answer of a device")
+    parser.add_argument("--repeat", type=int, default=1, help="Times every script is sent in a row, for larger ones")
+    parser.add_argument("--transfer", action="store_true", help="Also push the scripts as files the devices fetch")
+    parser.add_argument("--audit", action="store_true",
+                        help="Then collect the running configurations and compare them with the model")
+    args = parser.parse_args()
+
+    raise_file_limit(args.devices)
+
+    start = time.perf_counter()
+    backbone = build_backbone(args.devices)
+    scripts = {device_id: script * args.repeat for device_id, script in PushEngine.render(backbone).items()}
+    print_log(f"Rendered {sum(map(len, scripts.values()))} lines for {len(scripts)} devices in "
+              f"{time.perf_counter() - start:.2f} seconds")
+
+    with multiprocessing.Manager() as manager:
+        addresses, stop = manager.dict(), manager.Event()
+        emulator = multiprocessing.Process(target=run_emulator,
+                                           args=(list(scripts), args.latency / 1000, addresses, stop))
+        emulator.start()
+        while len(addresses) < len(scripts) and emulator.is_alive():
+            time.sleep(0.1)
+
+        try:
+            for window in args.window:
+                engine = PushEngine(dict(addresses), USERNAME, PASSWORD, args.concurrency, args.timeout,
+                                    window=window)
+                start = time.perf_counter()
+                results = engine.run(scripts)
+                report(results, time.perf_counter() - start, f"a window of {window} lines" if window
+                       else "line-at-a-time sending", args.concurrency)
+
+            if args.transfer:
+                engine = FileTransferEngine(dict(addresses), USERNAME, PASSWORD, concurrency=args.concurrency,
+                                            timeout=args.timeout)
+                start = time.perf_counter()
+                results = engine.run(scripts)
+                report(results, time.perf_counter() - start, "file transfers", args.concurrency)
+
+            if args.audit:
+                detector = DriftDetector(backbone)
+                start = time.perf_counter()
+                drifts = detector.audit(dict(addresses), username=USERNAME, password=PASSWORD,
+                                        concurrency=args.concurrency, timeout=args.timeout, window=0)
+                detector.print_report(drifts)
+                print_success(f"Audited {len(drifts)} devices in {time.perf_counter() - start:.2f} seconds: "
+                              f"{len(drifts) / (time.perf_counter() - start):.0f} devices/s")
+        finally:
+            stop.set()
+            emulator.join()
+
+
+
+if __name__ == "__main__":
+    main()
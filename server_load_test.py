@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from automation_server import AutomationServer
+from components.devices.network_device import NetworkDevice
+from iptx_utils import print_log, print_success, print_warning
+
+
+class HTTPClient:
+    # A keep-alive HTTP/1.1 connection to the server, for JSON requests one at a time
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.__reader: asyncio.StreamReader | None = None
+        self.__writer: asyncio.StreamWriter | None = None
+
+    async def request(self, method: str, path: str, body: Any = None) -> Tuple[int, Any]:
+        if self.__writer is None:
+            self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+
+        data = json.dumps(body).encode() if body is not None else b""
+        self.__writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+
+        status = int((await self.__reader.readline()).split()[1])
+        length, keep_alive = 0, True
+        while True:
+            line = (await self.__reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "connection":
+                keep_alive = value.strip().lower() != "close"
+
+        payload = json.loads(await self.__reader.readexactly(length)) if length else None
+        if not keep_alive:
+            await self.close()
+
+        return status, payload
+
+    async def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+
+def run_server(max_batch: int, batch_window: float, ports, stop) -> None:
+    # In its own process, so the clients don't share the event loop (and the CPU time) of the server
+    async def serve():
+        async with AutomationServer(port=0, max_batch=max_batch, batch_window=batch_window) as server:
+            ports.append(server.port)
+            await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+
+    asyncio.run(serve())
+
+
+async def run_requests(host: str, port: int, requests: List[Tuple[str, str, Any]],
+                       concurrency: int) -> Tuple[List[float], List[Any]]:
+    # Every request, over 'concurrency' connections at once: (latency of each, answers with an error status)
+    latencies, errors = [], []
+    pending = iter(requests)
+
+    async def client():
+        connection = HTTPClient(host, port)
+        try:
+            for method, path, body in pending:
+                start = time.perf_counter()
+                status, payload = await connection.request(method, path, body)
+                latencies.append(time.perf_counter() - start)
+                if status >= 300:
+                    errors.append((status, payload))
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, errors
+
+
+def report(phase: str, latencies: List[float], elapsed: float, errors: List[Any]) -> None:
+    latencies = sorted(latencies)
+    print_success(f"{phase}: {len(latencies)} requests in {elapsed:.2f} seconds, {len(latencies) / elapsed:.0f} "
+                  f"requests/s, median {statistics.median(latencies) * 1000:.1f} ms, "
+                  f"p95 {latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000:.1f} ms")
+    for status, payload in errors[:5]:
+        print_warning(f"{status}: {payload}", prompt=False)
+
+
+async def load_test(host: str, port: int, routers: int, concurrency: int) -> Dict[str, Any]:
+    name = "load-test"
+    client = HTTPClient(host, port)
+    devices = [{"router_id": f"10.{i // 250}.{i % 250}.1", "hostname": f"R{i}", "model": "gns3_c7200"}
+               for i in range(routers)]
+
+    start = time.perf_counter()
+    status, summary = await client.request("POST", "/topologies", {"name": name, "as_number": 65000,
+                                                                   "devices": devices})
+    if status != 201:
+        raise RuntimeError(f"Couldn't build the topology: {status} {summary}")
+    print_log(f"Built {summary['routers']} routers in {time.perf_counter() - start:.2f} seconds")
+
+    # A ring, with a client on every tenth router
+    phases = [
+        ("Connect", [("POST", f"/topologies/{name}/links", {
+            "device_id1": devices[i - 1]["router_id"], "port1": "0/1", "device_id2": devices[i]["router_id"],
+            "port2": "0/0", "network_address": f"172.{16 + i // 256}.{i % 256}.0"}) for i in range(routers)]),
+        ("Onboard clients", [("POST", f"/topologies/{name}/clients", {
+            "device": {"router_id": f"100.{i // 250}.{i % 250}.1", "hostname": f"C{i}", "model": "gns3_ce_router",
+                       "as_number": 64512 + i}, "client_port": "0/0",
+            "device_id": devices[i]["router_id"], "port": "1/0"}) for i in range(0, routers, 10)]),
+        ("Routing", [("POST", f"/topologies/{name}/routing", {})]),
+        ("Render", [("GET", f"/topologies/{name}/scripts?device={device['router_id']}", None)
+                    for device in devices]),
+    ]
+
+    for phase, requests in phases:
+        start = time.perf_counter()
+        latencies, errors = await run_requests(host, port, requests, concurrency)
+        report(phase, latencies, time.perf_counter() - start, errors)
+
+    # The running configurations, as the devices would show them once the scripts are pushed
+    _, scripts = await client.request("GET", f"/topologies/{name}/scripts")
+    configs = {device_id: "\n".join(NetworkDevice.running_config(script)) for device_id, script in scripts.items()}
+    start = time.perf_counter()
+    status, diff = await client.request("POST", f"/topologies/{name}/diff", {"configs": configs})
+    print_success(f"Diff of {len(diff['devices'])} running configurations in {time.perf_counter() - start:.2f} "
+                  f"seconds: {diff['drifted']} drifted")
+
+    _, stats = await client.request("GET", "/stats")
+    await client.request("DELETE", f"/topologies/{name}")
+    await client.close()
+    return stats["topologies"][name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the throughput of the automation server")
+    parser.add_argument("--routers", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 64],
+                        help="Operations sent to the topology at once, for each run (1 turns batching off)")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="Milliseconds to wait for a batch to fill")
+    args = parser.parse_args()
+
+    for max_batch in args.max_batch:
+        with multiprocessing.Manager() as manager:
+            ports, stop = manager.list(), manager.Event()
+            server = multiprocessing.Process(target=run_server,
+                                             args=(max_batch, args.batch_window / 1000, ports, stop))
+            server.start()
+            while not ports and server.is_alive():
+                time.sleep(0.1)
+
+            try:
+                print_log(f"Batches of up to {max_batch} operations:")
+                stats = asyncio.run(load_test("127.0.0.1", ports[0], args.routers, args.concurrency))
+                print_log(f"{stats['operations']} operations in {stats['batches']} batches "
+                          f"({stats['operations'] / max(stats['batches'], 1):.1f} per batch)")
+            finally:
+                stop.set()
+                server.join()
+
+
+if __name__ == "__main__":
+    main()